@@ -0,0 +1,202 @@
+"""Procedural ambient bed (rain, pink/brown noise, wind) mixed under the loop.
+
+The bed is synthesized block by block with overlap-added random spectra, so it
+has no repeating period and is never held in memory for the full length.
+All enabled kinds share one random draw per bin: independent noises add in
+power, so one draw shaped by the summed power spectrum is statistically the
+same as summing separately generated layers, at a fraction of the cost.
+Each kind's level drifts slowly (a random AR(1) walk in dB), wind the most.
+"""
+import wave
+
+SEGMENT = 32768  # samples per synthesized spectrum (~0.74 s at 44.1 kHz)
+BATCH_SEGMENTS = 32
+MIX_BLOCK_SECONDS = 10
+
+# kind: (level drift time constant s, drift depth dB)
+BED_KINDS = {
+    "pink": (30.0, 1.5),
+    "brown": (40.0, 2.0),
+    "rain": (20.0, 3.0),
+    "wind": (8.0, 6.0),
+}
+RAIN_DROPS_PER_SECOND = 40
+
+
+def _shape(kind, freqs):
+    """Amplitude response of one bed kind (before normalization)."""
+    import numpy as np
+
+    f = np.maximum(freqs, 20.0)
+    if kind == "pink":
+        shape = 1 / np.sqrt(f)
+    elif kind == "brown":
+        shape = 1 / f
+    elif kind == "rain":
+        # Hiss band between ~800 Hz and ~8 kHz
+        low = (f / 800) ** 2 / (1 + (f / 800) ** 2)
+        shape = low / np.sqrt(1 + (f / 8000) ** 4) / np.sqrt(f)
+    elif kind == "wind":
+        # Broad resonance around 300 Hz over a brown floor
+        shape = 1 / (1 + ((f - 300) / 250) ** 2) / np.sqrt(f) + 0.2 / f
+    else:
+        raise ValueError(f"Unknown ambient bed kind: {kind} (expected one of {', '.join(BED_KINDS)})")
+    # Roll off everything below ~25 Hz (rumble, DC)
+    return shape * (f / 25) ** 2 / (1 + (f / 25) ** 2)
+
+
+class AmbientBed:
+    def __init__(self, kinds, sample_rate, channels, level_db=-30.0, seed=None):
+        import numpy as np
+
+        self.kinds = list(kinds)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.rng = np.random.default_rng(seed)
+        self.hop = SEGMENT // 2
+
+        freqs = np.fft.rfftfreq(SEGMENT, 1 / sample_rate)
+        powers = []
+        for kind in self.kinds:
+            shape = _shape(kind, freqs)
+            # irfft of unit-variance complex bins has variance ~4*sum|H|^2/N^2;
+            # scale each kind to unit RMS
+            shape /= 2 * np.sqrt(np.sum(shape ** 2)) / SEGMENT
+            powers.append(shape ** 2)
+        powers = np.array(powers)
+        # Bins where every kind is ~silent are never drawn
+        audible = np.flatnonzero(powers.max(axis=0) > powers.max() * 1e-6)
+        self.bins = int(audible[-1]) + 1 if audible.size else 1
+        self.powers = powers[:, :self.bins].astype(np.float32)
+
+        # Kinds share the level; total bed RMS ~ level_db dBFS
+        self.base_gain = 10 ** (level_db / 20) / np.sqrt(max(len(self.kinds), 1))
+        hop_seconds = self.hop / sample_rate
+        self.drift_rho = np.array([np.exp(-hop_seconds / BED_KINDS[k][0]) for k in self.kinds])
+        self.drift_depth = np.array([BED_KINDS[k][1] for k in self.kinds])
+        self.drift_db = self.rng.standard_normal(len(self.kinds)) * self.drift_depth
+
+        n = np.arange(SEGMENT)
+        # sqrt of a periodic Hann: squared windows at 50% overlap sum to one, so
+        # overlap-added independent segments keep a constant variance
+        self.window = np.sqrt(0.5 - 0.5 * np.cos(2 * np.pi * n / SEGMENT)).astype(np.float32)
+        self.tail = np.zeros((channels, self.hop), dtype=np.float32)
+        self.pending = np.zeros((channels, 0), dtype=np.float32)
+
+        drop_length = int(0.004 * sample_rate)
+        t = np.arange(drop_length) / sample_rate
+        burst = np.diff(self.rng.standard_normal(drop_length + 1)) * np.exp(-t / 0.0012)
+        self.drop_kernel = (burst / np.sqrt(np.mean(burst ** 2))).astype(np.float32)
+
+    def _drift(self, count):
+        """Per-segment linear gains (count, kinds) from the AR(1) level walk."""
+        import numpy as np
+
+        noise = self.rng.standard_normal((count, len(self.kinds)))
+        scale = np.sqrt(1 - self.drift_rho ** 2) * self.drift_depth
+        levels = np.empty((count, len(self.kinds)))
+        for i in range(count):
+            self.drift_db = self.drift_db * self.drift_rho + noise[i] * scale
+            levels[i] = self.drift_db
+        return self.base_gain * 10 ** (levels / 20)
+
+    def _synthesize(self, count):
+        """count hops of output, shape (channels, count * hop)."""
+        import numpy as np
+
+        gains = self._drift(count)
+        # Unit-variance uniform bins (uniform draws are ~4x cheaper than normal
+        # ones); summed over thousands of bins the output is Gaussian anyway
+        amplitude = np.sqrt((gains ** 2).astype(np.float32) @ self.powers * 12)  # (count, bins)
+        spectra = np.empty((self.channels, count, self.bins), dtype=np.complex64)
+        # Draw straight into the interleaved (real, imag) view of the bins
+        parts = spectra.view(np.float32).reshape(self.channels, count, self.bins, 2)
+        self.rng.random(out=parts, dtype=np.float32)
+        parts -= 0.5
+        parts *= amplitude[None, :, :, None]
+        # Bins above self.bins are zero-padded by irfft
+        segments = np.fft.irfft(spectra, n=SEGMENT, axis=-1)
+        segments *= self.window
+
+        # Overlap-add in place: each output hop is the current segment's first
+        # half plus the previous segment's second half
+        segments[:, 1:, :self.hop] += segments[:, :-1, self.hop:]
+        segments[:, 0, :self.hop] += self.tail
+        self.tail = segments[:, -1, self.hop:].copy()
+        out = segments[..., :self.hop].reshape(self.channels, -1)
+
+        if "rain" in self.kinds:
+            self._add_drops(out, gains[:, self.kinds.index("rain")])
+        return out
+
+    def _add_drops(self, out, rain_gains):
+        import numpy as np
+
+        length = out.shape[1] - len(self.drop_kernel)
+        count = self.rng.poisson(RAIN_DROPS_PER_SECOND * out.shape[1] / self.sample_rate)
+        if count == 0 or length <= 0:
+            return
+        # Sorted and unique, so the tap-by-tap scatter below never collides
+        positions = np.unique(self.rng.integers(0, length, count))
+        gains = rain_gains[positions // self.hop] * self.rng.lognormal(-1.5, 0.6, len(positions))
+        pan = self.rng.uniform(0.2, 0.8, len(positions))
+        # Drops are sparse: scatter tap by tap instead of touching the whole buffer
+        for channel in range(self.channels):
+            weight = gains * (pan if channel % 2 == 0 else 1 - pan)
+            row = out[channel]
+            for tap, value in enumerate(self.drop_kernel):
+                row[positions + tap] += weight * value
+
+    def render(self, frames):
+        """Next `frames` samples of the bed, shape (frames, channels), float in [-1, 1] scale."""
+        import numpy as np
+
+        parts = [self.pending]
+        available = self.pending.shape[1]
+        while available < frames:
+            count = max(BATCH_SEGMENTS, -(-(frames - available) // self.hop))
+            block = self._synthesize(count)
+            parts.append(block)
+            available += block.shape[1]
+        buffer = np.concatenate(parts, axis=1)
+        self.pending = buffer[:, frames:]
+        return buffer[:, :frames].T
+
+
+def mix_blocks(blocks, bed, total_frames, fade_frames=0):
+    """Mix the bed into int16 (frames, channels) blocks, fading it out over the
+    last fade_frames of total_frames together with the loop."""
+    import numpy as np
+
+    start = 0
+    for block in blocks:
+        chunk = block.astype(np.float32)
+        layer = bed.render(len(chunk)) * 32767
+        if fade_frames and start + len(chunk) > total_frames - fade_frames:
+            position = np.arange(start, start + len(chunk))
+            layer *= np.clip((total_frames - position) / fade_frames, 0, 1)[:, None]
+        chunk += layer
+        start += len(chunk)
+        yield np.clip(chunk, -32768, 32767).astype("<i2")
+
+
+def mix_to_wav(segment, output_path, bed, fadeout_seconds=0):
+    """Write a pydub AudioSegment with the bed mixed in, block by block."""
+    import numpy as np
+
+    segment = segment.set_sample_width(2)
+    samples = np.frombuffer(segment.raw_data, dtype="<i2").reshape(-1, segment.channels)
+    block = segment.frame_rate * MIX_BLOCK_SECONDS
+    mixed = mix_blocks(
+        (samples[start:start + block] for start in range(0, len(samples), block)),
+        bed,
+        len(samples),
+        int(fadeout_seconds * segment.frame_rate),
+    )
+    with wave.open(output_path, "wb") as out:
+        out.setnchannels(segment.channels)
+        out.setsampwidth(2)
+        out.setframerate(segment.frame_rate)
+        for chunk in mixed:
+            out.writeframes(chunk.tobytes())
+    return output_path
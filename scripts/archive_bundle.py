@@ -0,0 +1,162 @@
+"""Compact Drive archive: source assets + manifest instead of the rendered MP4.
+
+A bundle is a zip holding the Suno source clip, the background image(s) and a
+manifest.json with every parameter needed to rebuild the video byte-for-byte
+(same ffmpeg build permitting).
+
+Usage:
+    PYTHONPATH=. python scripts/archive_bundle.py rebuild bundle.zip [--output-dir DIR]
+"""
+import argparse
+import json
+import os
+import subprocess
+import zipfile
+
+from scripts.utils import sha256_file
+
+BUNDLE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def ffmpeg_version():
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-version"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.splitlines()[0] if result.stdout else None
+
+
+def build_bundle(bundle_path, raw_audio, bg_path, audio_params, render_params, metadata=None, scenes=()):
+    """Write a versioned bundle zip and return its path.
+
+    audio_params must contain the exact target_ms used, so the random length
+    variance is not re-rolled on rebuild. scenes are the extra backgrounds of
+    a scene sequence, stored as scene_2, scene_3, ...
+    """
+    assets = {
+        "audio": raw_audio,
+        "background": bg_path,
+        **{f"scene_{index}": path for index, path in enumerate(scenes, start=2)},
+    }
+    manifest = {
+        "version": BUNDLE_VERSION,
+        "assets": {},
+        "audio_params": audio_params,
+        "render_params": render_params,
+        "ffmpeg_version": ffmpeg_version(),
+        "metadata": metadata or {},
+    }
+    with zipfile.ZipFile(bundle_path, "w") as bundle:
+        for role, path in assets.items():
+            arcname = f"{role}{os.path.splitext(path)[1]}"
+            manifest["assets"][role] = {
+                "name": arcname,
+                "sha256": sha256_file(path),
+                "bytes": os.path.getsize(path),
+            }
+            # Audio and PNG are already compressed; deflate only wastes CPU.
+            bundle.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+        bundle.writestr(
+            MANIFEST_NAME,
+            json.dumps(manifest, ensure_ascii=False, indent=2),
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+    return bundle_path
+
+
+def read_manifest(bundle_path):
+    with zipfile.ZipFile(bundle_path) as bundle:
+        manifest = json.loads(bundle.read(MANIFEST_NAME).decode("utf-8"))
+    if manifest.get("version") != BUNDLE_VERSION:
+        raise RuntimeError(
+            f"Unsupported bundle version {manifest.get('version')} "
+            f"(expected {BUNDLE_VERSION})"
+        )
+    return manifest
+
+
+def extract_bundle(bundle_path, output_dir):
+    """Extract and verify bundle assets. Returns (manifest, {role: path})."""
+    manifest = read_manifest(bundle_path)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    with zipfile.ZipFile(bundle_path) as bundle:
+        for role, info in manifest["assets"].items():
+            path = bundle.extract(info["name"], output_dir)
+            if sha256_file(path) != info["sha256"]:
+                raise RuntimeError(f"Checksum mismatch for {info['name']} in {bundle_path}")
+            paths[role] = path
+    return manifest, paths
+
+
+def rebuild_from_bundle(bundle_path, output_dir, cache_dir=None):
+    """Rebuild the rendered MP4 from a bundle. Returns the video path."""
+    from scripts.audio_process import process_audio
+    from scripts.video_render import render_video
+
+    manifest, paths = extract_bundle(bundle_path, output_dir)
+
+    current_ffmpeg = ffmpeg_version()
+    if manifest.get("ffmpeg_version") and current_ffmpeg != manifest["ffmpeg_version"]:
+        print(
+            "Warning: ffmpeg version differs from the original render; "
+            "output may not be byte-identical.\n"
+            f"  bundle: {manifest['ffmpeg_version']}\n  local:  {current_ffmpeg}"
+        )
+
+    audio_params = manifest["audio_params"]
+    processed_audio = os.path.join(output_dir, "audio_90m.wav")
+    process_audio(
+        paths["audio"],
+        processed_audio,
+        audio_params["target_minutes"],
+        audio_params["variance_minutes"],
+        audio_params["lowpass_hz"],
+        audio_params["crossfade_seconds"],
+        audio_params["fadeout_seconds"],
+        target_ms=audio_params["target_ms"],
+        cache_dir=cache_dir,
+        # Older bundles predate the ambient bed
+        ambient=audio_params.get("ambient"),
+        ambient_level_db=audio_params.get("ambient_level_db", -30.0),
+        ambient_seed=audio_params.get("ambient_seed"),
+        # Same bytes as the in-memory path, without holding the whole loop in RAM
+        streaming=True,
+    )
+
+    video_path = os.path.join(output_dir, "video.mp4")
+    # audio, background, then scene_2 ... scene_N
+    scenes = [paths[f"scene_{index}"] for index in range(2, len(paths))]
+    render_video(paths["background"], processed_audio, video_path, scenes=scenes, **manifest["render_params"])
+    return video_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SleepMusic archive bundle tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild", help="Rebuild video.mp4 from a bundle")
+    rebuild.add_argument("bundle")
+    rebuild.add_argument("--output-dir", default=None)
+
+    show = subparsers.add_parser("show", help="Print a bundle manifest")
+    show.add_argument("bundle")
+
+    args = parser.parse_args()
+
+    if args.command == "show":
+        print(json.dumps(read_manifest(args.bundle), ensure_ascii=False, indent=2))
+        return
+
+    output_dir = args.output_dir or os.path.join(
+        "output", "rebuild_" + os.path.splitext(os.path.basename(args.bundle))[0]
+    )
+    video_path = rebuild_from_bundle(args.bundle, output_dir)
+    print(f"Rebuilt video: {video_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Decode-once PCM cache for source audio.
+
+Each source file (usually the Suno MP3) is decoded by ffmpeg once into
+<cache_dir>/<sha256>.npy (int16, shape frames x channels) with a JSON sidecar
+holding the sample rate and source info. Later loads memory-map the .npy, so
+analysis, looping and preview code gets zero-copy views and repeated tuning
+runs on the same clip skip decoding entirely.
+"""
+import json
+import os
+import tempfile
+import wave
+
+from scripts import tracing
+from scripts.utils import sha256_file, write_json_atomic
+
+SAMPLE_WIDTH = 2  # int16 PCM
+
+
+class DecodedAudio:
+    def __init__(self, samples, sample_rate, key):
+        self.samples = samples  # np.memmap, shape (frames, channels), int16
+        self.sample_rate = sample_rate
+        self.key = key
+
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+
+    @property
+    def frames(self):
+        return self.samples.shape[0]
+
+    @property
+    def duration_seconds(self):
+        return self.frames / self.sample_rate
+
+    def view(self, start_seconds=0.0, end_seconds=None):
+        """Zero-copy slice of the cached samples."""
+        start = int(start_seconds * self.sample_rate)
+        end = self.frames if end_seconds is None else int(end_seconds * self.sample_rate)
+        return self.samples[max(start, 0):min(end, self.frames)]
+
+    def to_audio_segment(self, start_seconds=0.0, end_seconds=None):
+        """pydub AudioSegment over a slice (pydub needs bytes, so this copies once)."""
+        from pydub import AudioSegment
+
+        return AudioSegment(
+            data=self.view(start_seconds, end_seconds).tobytes(),
+            sample_width=SAMPLE_WIDTH,
+            frame_rate=self.sample_rate,
+            channels=self.channels,
+        )
+
+
+def _paths(cache_dir, key):
+    return os.path.join(cache_dir, f"{key}.npy"), os.path.join(cache_dir, f"{key}.json")
+
+
+def _decode_to_cache(input_path, npy_path, meta_path, key):
+    import numpy as np
+
+    cache_dir = os.path.dirname(npy_path)
+    with tempfile.TemporaryDirectory(dir=cache_dir) as tmp_dir:
+        wav_path = os.path.join(tmp_dir, "decoded.wav")
+        tracing.run(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-i", input_path,
+                "-vn", "-c:a", "pcm_s16le",
+                wav_path,
+            ],
+            check=True,
+        )
+        with wave.open(wav_path, "rb") as source:
+            channels = source.getnchannels()
+            sample_rate = source.getframerate()
+            frames = source.getnframes()
+            tmp_npy = os.path.join(tmp_dir, "decoded.npy")
+            target = np.lib.format.open_memmap(
+                tmp_npy, mode="w+", dtype="<i2", shape=(frames, channels)
+            )
+            # Copy in blocks so the decoded clip is never held in memory twice
+            block = sample_rate * 10
+            offset = 0
+            while offset < frames:
+                data = source.readframes(block)
+                if not data:
+                    break
+                chunk = np.frombuffer(data, dtype="<i2").reshape(-1, channels)
+                target[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+            target.flush()
+            del target
+        os.replace(tmp_npy, npy_path)
+
+    meta = {
+        "key": key,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "frames": frames,
+        "sample_width": SAMPLE_WIDTH,
+        "source_name": os.path.basename(input_path),
+        "source_bytes": os.path.getsize(input_path),
+    }
+    write_json_atomic(meta_path, meta, indent=2)
+    return meta
+
+
+def load_decoded(input_path, cache_dir):
+    """Return DecodedAudio for input_path, decoding only on a cache miss."""
+    import numpy as np
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = sha256_file(input_path)
+    npy_path, meta_path = _paths(cache_dir, key)
+    if os.path.exists(npy_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    else:
+        print(f"Decoding {input_path} into PCM cache ({key[:12]})")
+        meta = _decode_to_cache(input_path, npy_path, meta_path, key)
+    samples = np.load(npy_path, mmap_mode="r")
+    return DecodedAudio(samples, meta["sample_rate"], key)
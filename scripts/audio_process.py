@@ -1,6 +1,211 @@
 import random
+import wave
 
-from pydub import AudioSegment
+STREAM_BLOCK_SECONDS = 10  # same as ambient_bed.MIX_BLOCK_SECONDS, so the bed draws identically
+
+
+def _position(ms, frame_rate):
+    """pydub's millisecond -> frame index (AudioSegment._parse_position)."""
+    return int(ms * (frame_rate / 1000.0))
+
+
+def _length_ms(frames, frame_rate):
+    """pydub's len() of a segment holding `frames` frames."""
+    return round(1000 * (frames / frame_rate))
+
+
+def _load_filtered(input_path, lowpass_hz, cache_dir):
+    if cache_dir:
+        # Decode once into the memory-mapped PCM cache; reruns skip ffmpeg
+        from scripts.audio_cache import load_decoded
+
+        audio = load_decoded(input_path, cache_dir).to_audio_segment()
+    else:
+        from pydub import AudioSegment
+
+        audio = AudioSegment.from_file(input_path)
+    return audio.low_pass_filter(lowpass_hz)
+
+
+def _output_frames(target_ms, frame_rate):
+    """Frames process_audio writes for target_ms: the slice, plus any silence
+    pydub pads when fade_out's last millisecond overruns it."""
+    cut_at = _position(target_ms, frame_rate)
+    return max(cut_at, _position(_length_ms(cut_at, frame_rate), frame_rate))
+
+
+def _choose_target_ms(target_minutes, variance_minutes, target_ms):
+    if target_ms is None:
+        target_ms = (
+            target_minutes * 60 * 1000
+            + random.randint(-variance_minutes, variance_minutes) * 60 * 1000
+        )
+    return target_ms
+
+
+def loop_pieces(filtered, target_ms, crossfade_ms, fadeout_ms):
+    """Yield the faded crossfade loop as consecutive int16 (frames, channels) arrays.
+
+    Equivalent to process_audio's AudioSegment.append loop, target_ms slice and
+    fade_out, but only the source and one crossfade are held in memory. pydub's
+    millisecond arithmetic (rounded lengths, truncated positions, one fade step
+    per ms) is replayed on absolute frame positions, so the output is
+    byte-identical. Fades of 100 ms or less (pydub fades those per sample) are
+    not supported.
+    """
+    import numpy as np
+    from pydub.audio_segment import audioop
+    from pydub.utils import db_to_float
+
+    if fadeout_ms <= 100:
+        raise ValueError("Streaming fade-out must be longer than 100 ms")
+    rate = filtered.frame_rate
+    channels = filtered.channels
+    source = np.frombuffer(filtered.raw_data, dtype="<i2").reshape(-1, channels)
+
+    def take(pieces, start, end):
+        """Frames [start, end) of the concatenated pieces, zero-padded past the end."""
+        parts = []
+        offset = 0
+        for piece in pieces:
+            lo, hi = max(start - offset, 0), min(end - offset, len(piece))
+            if lo < hi:
+                parts.append(piece[lo:hi])
+            offset += len(piece)
+        if end > max(start, offset):
+            # pydub pads up to 2 ms of silence when a slice overruns
+            parts.append(np.zeros((end - max(start, offset), channels), dtype="<i2"))
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    def gain(samples, factor):
+        return np.frombuffer(audioop.mul(samples.tobytes(), 2, factor), dtype="<i2").reshape(-1, channels)
+
+    # seg2[:crossfade] faded in, and seg2[crossfade:], are the same every pass
+    head = filtered[:crossfade_ms].fade(from_gain=-120, start=0, end=float("inf"))
+    body = take([source], _position(crossfade_ms, rate), _position(len(filtered), rate))
+
+    # combined[:target_ms] keeps `cut_at` frames; fade_out then steps the gain
+    # once per ms over [fade_start, fade_end) ms and applies -120 dB after it.
+    # A final ms chunk overrunning the data is padded with silence, up to `total`.
+    cut_at = _position(target_ms, rate)
+    fade_end = _length_ms(cut_at, rate)
+    fade_start = fade_end - fadeout_ms
+    step = (db_to_float(-120) - 1.0) / fadeout_ms
+    total = _output_frames(target_ms, rate)
+
+    def faded(samples, offset):
+        """Fade-out applied to samples at frames [offset, offset + len(samples))."""
+        end = offset + len(samples)
+        if end <= _position(fade_start, rate):
+            return samples
+        out = samples.copy()
+        for ms in range(fade_start, fade_end):
+            lo, hi = _position(ms, rate), _position(ms + 1, rate)
+            if hi > offset and lo < end:
+                span = slice(max(lo - offset, 0), min(hi, end) - offset)
+                out[span] = gain(samples[span], 1.0 + step * (ms - fade_start))
+        after = _position(fade_end, rate)
+        if end > after:
+            span = slice(max(after - offset, 0), len(samples))
+            out[span] = gain(samples[span], db_to_float(-120))
+        return out
+
+    emitted = 0
+
+    def emit(samples):
+        nonlocal emitted
+        samples = samples[:max(cut_at - emitted, 0)]
+        out = faded(samples, emitted)
+        emitted += len(samples)
+        return out
+
+    # The loop so far: `flushed` final frames, then the `pending` pieces
+    pending = [source]
+    frames = len(source)
+    flushed = 0
+    while _length_ms(frames, rate) < target_ms:
+        length_ms = _length_ms(frames, rate)
+        cut = _position(length_ms - crossfade_ms, rate)
+        tail = take(pending, cut - flushed, _position(length_ms, rate) - flushed)
+        xf = filtered._spawn(tail.tobytes()).fade(to_gain=-120, start=0, end=float("inf"))
+        xf *= head
+        if emitted < cut_at:
+            yield emit(take(pending, 0, cut - flushed))
+        flushed = cut
+        xf_samples = np.frombuffer(xf.raw_data, dtype="<i2").reshape(-1, channels)
+        pending = [xf_samples, body]
+        frames = cut + len(xf_samples) + len(body)
+
+    for piece in pending:
+        if emitted < cut_at:
+            yield emit(piece)
+    if emitted < cut_at:
+        yield emit(np.zeros((cut_at - emitted, channels), dtype="<i2"))
+    if total > cut_at:
+        yield np.zeros((total - cut_at, channels), dtype="<i2")
+
+
+def rechunk(pieces, block_frames):
+    """Regroup arrays of frames into blocks of exactly block_frames (last may be short)."""
+    import numpy as np
+
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        while len(piece):
+            take = min(block_frames - buffered, len(piece))
+            buffer.append(piece[:take])
+            buffered += take
+            piece = piece[take:]
+            if buffered == block_frames:
+                yield np.concatenate(buffer) if len(buffer) > 1 else buffer[0]
+                buffer, buffered = [], 0
+    if buffered:
+        yield np.concatenate(buffer) if len(buffer) > 1 else buffer[0]
+
+
+def stream_audio(
+    input_path,
+    target_minutes,
+    variance_minutes,
+    lowpass_hz,
+    crossfade_seconds,
+    fadeout_seconds,
+    target_ms=None,
+    cache_dir=None,
+    ambient=None,
+    ambient_level_db=-30.0,
+    ambient_seed=None,
+):
+    """The processed soundtrack as blocks instead of a file.
+
+    Returns (blocks, sample_rate, channels, target_ms); blocks yields int16
+    (frames, channels) arrays of STREAM_BLOCK_SECONDS. Memory stays around the
+    size of the decoded source clip whatever the target length.
+    """
+    filtered = _load_filtered(input_path, lowpass_hz, cache_dir)
+    target_ms = _choose_target_ms(target_minutes, variance_minutes, target_ms)
+    rate = filtered.frame_rate
+    blocks = rechunk(
+        loop_pieces(filtered, target_ms, crossfade_seconds * 1000, fadeout_seconds * 1000),
+        rate * STREAM_BLOCK_SECONDS,
+    )
+    if ambient:
+        from scripts.ambient_bed import AmbientBed, mix_blocks
+
+        bed = AmbientBed(ambient, rate, filtered.channels, level_db=ambient_level_db, seed=ambient_seed)
+        blocks = mix_blocks(blocks, bed, _output_frames(target_ms, rate), int(fadeout_seconds * rate))
+    return blocks, rate, filtered.channels, target_ms
+
+
+def write_wav(output_path, blocks, sample_rate, channels):
+    with wave.open(output_path, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        for block in blocks:
+            out.writeframes(block.tobytes())
+    return output_path
 
 
 def process_audio(
@@ -11,14 +216,38 @@ def process_audio(
     lowpass_hz,
     crossfade_seconds,
     fadeout_seconds,
+    target_ms=None,
+    cache_dir=None,
+    ambient=None,
+    ambient_level_db=-30.0,
+    ambient_seed=None,
+    streaming=False,
 ):
-    audio = AudioSegment.from_file(input_path)
-    filtered = audio.low_pass_filter(lowpass_hz)
+    """Loop, fade and write the soundtrack WAV. Returns (output_path, target_ms).
 
-    target_ms = (
-        target_minutes * 60 * 1000
-        + random.randint(-variance_minutes, variance_minutes) * 60 * 1000
-    )
+    streaming=True writes the same bytes block by block (see loop_pieces)
+    instead of building the whole loop in memory, which peaks at ~3x the WAV
+    size.
+    """
+    if streaming:
+        blocks, sample_rate, channels, target_ms = stream_audio(
+            input_path,
+            target_minutes,
+            variance_minutes,
+            lowpass_hz,
+            crossfade_seconds,
+            fadeout_seconds,
+            target_ms=target_ms,
+            cache_dir=cache_dir,
+            ambient=ambient,
+            ambient_level_db=ambient_level_db,
+            ambient_seed=ambient_seed,
+        )
+        write_wav(output_path, blocks, sample_rate, channels)
+        return output_path, target_ms
+
+    filtered = _load_filtered(input_path, lowpass_hz, cache_dir)
+    target_ms = _choose_target_ms(target_minutes, variance_minutes, target_ms)
     crossfade_ms = crossfade_seconds * 1000
 
     combined = filtered
@@ -27,6 +256,15 @@ def process_audio(
 
     combined = combined[:target_ms]
     combined = combined.fade_out(fadeout_seconds * 1000)
-    combined.export(output_path, format="wav")
+    if ambient:
+        # Procedural bed is synthesized while writing; never a full-length buffer
+        from scripts.ambient_bed import AmbientBed, mix_to_wav
+
+        bed = AmbientBed(
+            ambient, combined.frame_rate, combined.channels, level_db=ambient_level_db, seed=ambient_seed
+        )
+        mix_to_wav(combined, output_path, bed, fadeout_seconds=fadeout_seconds)
+    else:
+        combined.export(output_path, format="wav")
 
     return output_path, target_ms
@@ -0,0 +1,493 @@
+"""Streaming QC for the processed soundtrack.
+
+Reads the WAV (or any iterator of int16 PCM blocks) in 10 s chunks and keeps
+only running statistics, so memory stays constant however long the output is:
+
+- integrated, max momentary and max short-term loudness (ITU-R BS.1770 style:
+  K-weighting applied per 100 ms sub-block in the frequency domain, gating via a
+  0.1 LU histogram instead of a stored list of blocks)
+- true peak (4x oversampling through a 12-tap x 4-phase polyphase FIR) and
+  clipped sample count
+- silence gaps
+- level jumps and crossfade dips (phase cancellation) at each loop seam
+
+Usage:
+    PYTHONPATH=. python scripts/audio_qc.py output/YYYYMMDD/audio_90m.wav [--source audio_raw.mp3]
+"""
+import json
+import math
+import wave
+
+SUB_BLOCK_SECONDS = 0.1
+CHUNK_SUB_BLOCKS = 100  # 10 s per vectorized chunk
+OVERSAMPLE = 4
+PEAK_TAPS = 12  # per phase; 48-tap polyphase interpolator as in BS.1770 Annex 2
+PEAK_GROUP = 64  # frames per group in the true-peak pre-check (> PEAK_TAPS)
+FULL_SCALE = 32768.0
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+HIST_MIN, HIST_MAX, HIST_STEP = -70.0, 10.0, 0.1
+SEAM_CONTEXT_SECONDS = 1.0
+
+
+class AudioQCError(RuntimeError):
+    def __init__(self, failures, report):
+        super().__init__("Audio QC failed: " + "; ".join(failures))
+        self.failures = failures
+        self.report = report
+
+
+def _biquad_power(b, a, freqs, sample_rate):
+    """|H(f)|^2 of a biquad at the given frequencies."""
+    import numpy as np
+
+    z = np.exp(-2j * np.pi * freqs / sample_rate)
+    numerator = b[0] + b[1] * z + b[2] * z ** 2
+    denominator = a[0] + a[1] * z + a[2] * z ** 2
+    return np.abs(numerator / denominator) ** 2
+
+
+def k_weighting_power(freqs, sample_rate):
+    """Squared magnitude of the BS.1770 K-weighting (high shelf + high pass)."""
+    # Stage 1: +4 dB high shelf at 1.5 kHz
+    gain_db, q, fc = 4.0, 1 / math.sqrt(2), 1500.0
+    big_a = 10 ** (gain_db / 40)
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    shelf_b = (
+        big_a * ((big_a + 1) + (big_a - 1) * cos_w0 + 2 * math.sqrt(big_a) * alpha),
+        -2 * big_a * ((big_a - 1) + (big_a + 1) * cos_w0),
+        big_a * ((big_a + 1) + (big_a - 1) * cos_w0 - 2 * math.sqrt(big_a) * alpha),
+    )
+    shelf_a = (
+        (big_a + 1) - (big_a - 1) * cos_w0 + 2 * math.sqrt(big_a) * alpha,
+        2 * ((big_a - 1) - (big_a + 1) * cos_w0),
+        (big_a + 1) - (big_a - 1) * cos_w0 - 2 * math.sqrt(big_a) * alpha,
+    )
+    # Stage 2: high pass at 38 Hz
+    q, fc = 0.5, 38.0
+    w0 = 2 * math.pi * fc / sample_rate
+    alpha = math.sin(w0) / (2 * q)
+    cos_w0 = math.cos(w0)
+    hp_b = ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2)
+    hp_a = (1 + alpha, -2 * cos_w0, 1 - alpha)
+    return _biquad_power(shelf_b, shelf_a, freqs, sample_rate) * _biquad_power(hp_b, hp_a, freqs, sample_rate)
+
+
+def true_peak_phases():
+    """(PEAK_TAPS, OVERSAMPLE) windowed-sinc interpolation filter, one column per phase."""
+    import numpy as np
+
+    length = PEAK_TAPS * OVERSAMPLE
+    n = np.arange(length)
+    taps = np.sinc((n - (length - 1) / 2) / OVERSAMPLE) * np.kaiser(length, 6.0)
+    phases = taps.reshape(PEAK_TAPS, OVERSAMPLE)
+    # Unity gain per phase; reversed because the windows run forward in time
+    return (phases / phases.sum(axis=0))[::-1].astype(np.float32)
+
+
+def _loudness(energy):
+    return -0.691 + 10 * math.log10(energy) if energy > 0 else float("-inf")
+
+
+def _db(value):
+    return 10 * math.log10(value) if value > 0 else float("-inf")
+
+
+def loop_seams(source_ms, crossfade_ms, target_ms, joins_ms=()):
+    """Seam centres (seconds) of the crossfade loop built by process_audio.
+
+    joins_ms are crossfades inside the source itself (a chained unit, see
+    track_chain); they recur on every pass of the loop.
+    """
+    seams = []
+    length = source_ms
+    while length < target_ms and source_ms > crossfade_ms:
+        seams.append((length - crossfade_ms / 2) / 1000)
+        length += source_ms - crossfade_ms
+    for index in range(len(seams) + 1):
+        for join in joins_ms:
+            at = join + index * (source_ms - crossfade_ms)
+            if at < target_ms:
+                seams.append(at / 1000)
+    return sorted(seams)
+
+
+class _Analyzer:
+    def __init__(self, sample_rate, channels, silence_db, seams, crossfade_seconds):
+        import numpy as np
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sub_frames = int(sample_rate * SUB_BLOCK_SECONDS)
+        freqs = np.fft.rfftfreq(self.sub_frames, 1 / sample_rate)
+        # Parseval weights for a one-sided spectrum
+        bins = np.full(freqs.size, 2.0)
+        bins[0] = 1.0
+        if self.sub_frames % 2 == 0:
+            bins[-1] = 1.0
+        self.k_weights = k_weighting_power(freqs, sample_rate) * bins / self.sub_frames ** 2
+
+        self.hist_count = np.zeros(int((HIST_MAX - HIST_MIN) / HIST_STEP) + 1)
+        self.hist_energy = np.zeros_like(self.hist_count)
+        self.recent = np.zeros(0)  # last 2.9 s of K-weighted sub-block energies
+        self.sub_blocks = 0
+        self.max_momentary = float("-inf")
+        self.max_short_term = float("-inf")
+
+        self.silence_level = (10 ** (silence_db / 20)) ** 2
+        self.silent_run = 0
+        self.silence_gaps = []
+
+        self.peak_phases = true_peak_phases()
+        # No interpolated value exceeds this gain times the loudest sample in its window
+        self.peak_gain = float(np.abs(self.peak_phases).sum(axis=0).max())
+        self.peak_tail = np.zeros((channels, PEAK_TAPS - 1), dtype=np.float32)
+        self.sample_peak = 0.0
+        self.true_peak = 0.0
+        self.clipped = 0
+        self.frames = 0
+
+        self.crossfade_seconds = crossfade_seconds
+        self.seams = seams
+        # Sub-block indices whose plain energy is kept for the seam checks
+        self.seam_energy = {}
+        self.seam_indices = set()
+        half = crossfade_seconds / 2 + SEAM_CONTEXT_SECONDS
+        for seam in seams:
+            first = int((seam - half) / SUB_BLOCK_SECONDS)
+            last = int(math.ceil((seam + half) / SUB_BLOCK_SECONDS))
+            self.seam_indices.update(range(max(first, 0), last + 1))
+        self.pending = np.zeros((channels, 0), dtype=np.float32)
+
+    def feed(self, pcm):
+        import numpy as np
+
+        # Planar (channels, frames) so every reduction runs over contiguous memory
+        samples = np.ascontiguousarray(pcm.T, dtype=np.float32)
+        samples /= FULL_SCALE
+        self.frames += samples.shape[1]
+        self._peaks(samples)
+
+        samples = np.concatenate([self.pending, samples], axis=1)
+        usable = samples.shape[1] // self.sub_frames * self.sub_frames
+        self.pending = samples[:, usable:]
+        if usable:
+            self._loudness_blocks(samples[:, :usable].reshape(self.channels, -1, self.sub_frames))
+
+    def _peaks(self, samples):
+        import numpy as np
+        from numpy.lib.stride_tricks import sliding_window_view
+
+        data = np.concatenate([self.peak_tail, samples], axis=1)
+        magnitude = np.abs(data)
+        self.clipped += int(np.count_nonzero(magnitude[:, self.peak_tail.shape[1]:] >= 32767 / FULL_SCALE))
+        frame_peak = magnitude.max(axis=0)  # loudest channel per frame
+        self.sample_peak = max(self.sample_peak, float(frame_peak.max(initial=0)))
+        self.peak_tail = data[:, -(PEAK_TAPS - 1):]
+        frames = data.shape[1] - PEAK_TAPS + 1
+        if frames <= 0:
+            return
+        # Windows past the last whole group of PEAK_GROUP (fewer than PEAK_GROUP)
+        full = frames // PEAK_GROUP
+        if full * PEAK_GROUP < frames:
+            rest = sliding_window_view(data[:, full * PEAK_GROUP:], PEAK_TAPS, axis=1) @ self.peak_phases
+            self.true_peak = max(self.true_peak, float(np.abs(rest).max()))
+        if not full:
+            return
+        # Pre-check: the windows of group g read frames [g * PEAK_GROUP,
+        # (g + 1) * PEAK_GROUP + PEAK_TAPS - 1), inside groups g and g + 1, so
+        # peak_gain times their louder frame bounds every interpolated value in
+        # the group. Only groups that could raise the running true peak are
+        # interpolated, so quiet passages cost a max per frame.
+        group_peak = np.zeros((full + 1) * PEAK_GROUP, dtype=np.float32)
+        covered = min(frame_peak.size, group_peak.size)
+        group_peak[:covered] = frame_peak[:covered]
+        group_peak = group_peak.reshape(-1, PEAK_GROUP).max(axis=1)
+        bound = np.maximum(group_peak[:-1], group_peak[1:]) * self.peak_gain
+        selected = np.flatnonzero(bound > self.true_peak)
+        if not selected.size:
+            return
+        if selected.size > full // 2:
+            # Mostly loud: interpolate every whole group without gathering
+            windows = sliding_window_view(data[:, :full * PEAK_GROUP + PEAK_TAPS - 1], PEAK_TAPS, axis=1)
+        else:
+            # (channels, groups, PEAK_GROUP + PEAK_TAPS - 1) spans, then every
+            # window of every span against all phases in one matmul
+            spans = data[:, selected[:, None] * PEAK_GROUP + np.arange(PEAK_GROUP + PEAK_TAPS - 1)]
+            windows = sliding_window_view(spans, PEAK_TAPS, axis=2)
+        upsampled = windows @ self.peak_phases
+        self.true_peak = max(self.true_peak, float(upsampled.max()), -float(upsampled.min()))
+
+    def _loudness_blocks(self, blocks):
+        import numpy as np
+
+        # blocks: (channels, sub-blocks, frames). Channel weights are 1.0 for
+        # stereo, so channel energies simply add.
+        spectra = np.fft.rfft(blocks, axis=2)
+        power = np.square(spectra.real) + np.square(spectra.imag)
+        weighted = (power @ self.k_weights).sum(axis=0)
+        plain = np.square(blocks).mean(axis=2).max(axis=0)
+        first = self.sub_blocks
+        self.sub_blocks += len(weighted)
+
+        # Moving 400 ms / 3 s means over the carried history plus this chunk
+        series = np.concatenate([self.recent, weighted])
+        sums = np.concatenate([[0.0], np.cumsum(series)])
+        ends = np.arange(len(self.recent) + 1, len(series) + 1)
+        valid_m = ends - len(self.recent) + first >= 4
+        # Clamped so the first few sub-blocks of the stream index safely; they are masked out
+        momentary = (sums[ends] - sums[np.maximum(ends - 4, 0)])[valid_m] / 4
+        valid_s = ends - len(self.recent) + first >= 30
+        short_term = (sums[ends] - sums[np.maximum(ends - 30, 0)])[valid_s] / 30
+        self.recent = series[-29:]
+
+        with np.errstate(divide="ignore"):
+            loudness = -0.691 + 10 * np.log10(momentary)
+            if short_term.size:
+                self.max_short_term = max(self.max_short_term, float(-0.691 + 10 * np.log10(short_term.max())))
+        if loudness.size:
+            self.max_momentary = max(self.max_momentary, float(loudness.max()))
+        gated = loudness > ABSOLUTE_GATE
+        slots = np.minimum(((loudness[gated] - HIST_MIN) / HIST_STEP).astype(int), self.hist_count.size - 1)
+        np.add.at(self.hist_count, slots, 1)
+        np.add.at(self.hist_energy, slots, momentary[gated])
+
+        # Silence runs: only the transitions need Python
+        silent = plain < self.silence_level
+        changes = np.flatnonzero(np.diff(np.concatenate([[self.silent_run > 0], silent])))
+        position = 0
+        for change in changes:
+            if silent[position]:
+                self.silent_run += change - position
+            else:
+                self._close_silence(first + position)
+            position = change
+        if silent[position:].any():
+            self.silent_run += len(silent) - position
+        else:
+            self._close_silence(first + position)
+
+        for index in self.seam_indices.intersection(range(first, self.sub_blocks)):
+            self.seam_energy[index] = float(plain[index - first])
+
+    def _close_silence(self, index):
+        if self.silent_run:
+            self.silence_gaps.append((
+                round((index - self.silent_run) * SUB_BLOCK_SECONDS, 1),
+                round(self.silent_run * SUB_BLOCK_SECONDS, 1),
+            ))
+        self.silent_run = 0
+
+    def _integrated(self):
+        import numpy as np
+
+        counts, energies = self.hist_count, self.hist_energy
+        if not counts.sum():
+            return float("-inf")
+        threshold = _loudness(energies.sum() / counts.sum()) + RELATIVE_GATE
+        levels = HIST_MIN + np.arange(counts.size) * HIST_STEP
+        keep = levels + HIST_STEP > threshold
+        if not counts[keep].sum():
+            return float("-inf")
+        return _loudness(energies[keep].sum() / counts[keep].sum())
+
+    def _seam_report(self):
+        seams = []
+        for seam in self.seams:
+            half = self.crossfade_seconds / 2
+
+            def level_db(start, end):
+                values = [
+                    self.seam_energy[i]
+                    for i in range(int(start / SUB_BLOCK_SECONDS), int(end / SUB_BLOCK_SECONDS))
+                    if i in self.seam_energy
+                ]
+                return _db(sum(values) / len(values)) if values else None
+
+            before = level_db(seam - half - SEAM_CONTEXT_SECONDS, seam - half)
+            after = level_db(seam + half, seam + half + SEAM_CONTEXT_SECONDS)
+            inside = [
+                level_db(start / 10, start / 10 + 0.4)
+                for start in range(int((seam - half) * 10), int((seam + half - 0.4) * 10) + 1)
+            ]
+            inside = [value for value in inside if value is not None]
+            if before is None or after is None or not inside:
+                continue
+            seams.append({
+                "at_seconds": round(seam, 2),
+                "jump_db": round(abs(after - before), 2),
+                # A dip below both sides means the crossfaded halves cancel
+                "dip_db": round(max((before + after) / 2 - min(inside), 0.0), 2),
+            })
+        return seams
+
+    def finish(self, tail_grace_seconds):
+        duration = self.frames / self.sample_rate
+        if self.silent_run:
+            start = (self.sub_blocks - self.silent_run) * SUB_BLOCK_SECONDS
+            # Silence inside the final fade-out is expected
+            if start < duration - tail_grace_seconds:
+                self._close_silence(self.sub_blocks)
+        return {
+            "duration_seconds": round(duration, 2),
+            "integrated_lufs": round(self._integrated(), 2),
+            "max_momentary_lufs": round(self.max_momentary, 2),
+            "max_short_term_lufs": round(self.max_short_term, 2),
+            "sample_peak_dbfs": round(20 * math.log10(self.sample_peak), 2) if self.sample_peak else None,
+            "true_peak_dbtp": round(20 * math.log10(self.true_peak), 2) if self.true_peak else None,
+            "clipped_samples": self.clipped,
+            "silence_gaps": self.silence_gaps,
+            "seams": self._seam_report(),
+        }
+
+
+def analyze_stream(blocks, sample_rate, channels, seams=(), crossfade_seconds=0,
+                   silence_db=-60.0, tail_grace_seconds=0):
+    """QC report for an iterator of int16 arrays shaped (frames, channels)."""
+    analyzer = _Analyzer(sample_rate, channels, silence_db, list(seams), crossfade_seconds)
+    for block in blocks:
+        analyzer.feed(block)
+    return analyzer.finish(tail_grace_seconds)
+
+
+def wav_blocks(path, seconds=SUB_BLOCK_SECONDS * CHUNK_SUB_BLOCKS):
+    """Yield (frames, channels) int16 blocks of a 16-bit WAV."""
+    import numpy as np
+
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"Only 16-bit PCM is supported: {path}")
+        channels = f.getnchannels()
+        block = int(f.getframerate() * seconds)
+        while True:
+            data = f.readframes(block)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype="<i2").reshape(-1, channels)
+
+
+def analyze_wav(path, **kwargs):
+    with wave.open(path, "rb") as f:
+        sample_rate, channels = f.getframerate(), f.getnchannels()
+    return analyze_stream(wav_blocks(path), sample_rate, channels, **kwargs)
+
+
+def check_report(report, thresholds):
+    """List of human-readable threshold failures (empty when the audio passes)."""
+    failures = []
+    integrated = report["integrated_lufs"]
+    if integrated < thresholds["min_lufs"] or integrated > thresholds["max_lufs"]:
+        failures.append(
+            f"integrated loudness {integrated} LUFS outside "
+            f"[{thresholds['min_lufs']}, {thresholds['max_lufs']}]"
+        )
+    if report["true_peak_dbtp"] is not None and report["true_peak_dbtp"] > thresholds["max_true_peak_db"]:
+        failures.append(f"true peak {report['true_peak_dbtp']} dBTP > {thresholds['max_true_peak_db']}")
+    if report["clipped_samples"] > thresholds["max_clipped_samples"]:
+        failures.append(f"{report['clipped_samples']} clipped samples > {thresholds['max_clipped_samples']}")
+    long_gaps = [gap for gap in report["silence_gaps"] if gap[1] > thresholds["max_silence_seconds"]]
+    if long_gaps:
+        start, length = max(long_gaps, key=lambda gap: gap[1])
+        failures.append(f"{len(long_gaps)} silence gap(s), longest {length}s at {start}s")
+    for seam in report["seams"]:
+        if seam["jump_db"] > thresholds["max_seam_jump_db"]:
+            failures.append(f"seam at {seam['at_seconds']}s jumps {seam['jump_db']} dB")
+        if seam["dip_db"] > thresholds["max_seam_dip_db"]:
+            failures.append(f"seam at {seam['at_seconds']}s dips {seam['dip_db']} dB")
+    return failures
+
+
+def qc_thresholds(settings):
+    return {
+        "min_lufs": settings["qc_min_lufs"],
+        "max_lufs": settings["qc_max_lufs"],
+        "max_true_peak_db": settings["qc_max_true_peak_db"],
+        "max_clipped_samples": settings["qc_max_clipped_samples"],
+        "max_silence_seconds": settings["qc_max_silence_seconds"],
+        "max_seam_jump_db": settings["qc_max_seam_jump_db"],
+        "max_seam_dip_db": settings["qc_max_seam_dip_db"],
+    }
+
+
+def _finish(report, settings, report_path):
+    report["failures"] = check_report(report, qc_thresholds(settings))
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if report["failures"]:
+        raise AudioQCError(report["failures"], report)
+    return report
+
+
+def run_qc(audio_path, settings, seams=(), report_path=None):
+    """Analyze audio_path, write the report, and raise AudioQCError on failure."""
+    report = analyze_wav(
+        audio_path,
+        seams=seams,
+        crossfade_seconds=settings["crossfade_seconds"],
+        silence_db=settings["qc_silence_db"],
+        tail_grace_seconds=settings["fadeout_seconds"] + 1,
+    )
+    return _finish(report, settings, report_path)
+
+
+class StreamQC:
+    """QC for audio that never reaches disk (piped straight into the render).
+
+    Wrap the block iterator with tee(), consume it, then call check(), which
+    behaves like run_qc.
+    """
+
+    def __init__(self, sample_rate, channels, settings, seams=()):
+        self.settings = settings
+        self.analyzer = _Analyzer(
+            sample_rate, channels, settings["qc_silence_db"], list(seams), settings["crossfade_seconds"]
+        )
+
+    def tee(self, blocks):
+        for block in blocks:
+            self.analyzer.feed(block)
+            yield block
+
+    def check(self, report_path=None):
+        report = self.analyzer.finish(self.settings["fadeout_seconds"] + 1)
+        return _finish(report, self.settings, report_path)
+
+
+def main():
+    import argparse
+
+    from dotenv import load_dotenv
+
+    from scripts.config import load_settings
+
+    parser = argparse.ArgumentParser(description="Audio QC for a processed soundtrack")
+    parser.add_argument("audio", help="16-bit WAV to check")
+    parser.add_argument("--source", help="Raw source clip, to locate and check the loop seams")
+    args = parser.parse_args()
+
+    load_dotenv()
+    settings = load_settings(strict=False)
+    seams = ()
+    if args.source:
+        from scripts.audio_cache import load_decoded
+
+        source = load_decoded(args.source, settings["audio_cache_dir"])
+        with wave.open(args.audio, "rb") as f:
+            target_ms = f.getnframes() * 1000 // f.getframerate()
+        seams = loop_seams(
+            int(source.duration_seconds * 1000), settings["crossfade_seconds"] * 1000, target_ms
+        )
+    try:
+        report = run_qc(args.audio, settings, seams=seams)
+    except AudioQCError as e:
+        print(json.dumps(e.report, indent=2))
+        raise SystemExit(str(e))
+    print(json.dumps(report, indent=2))
+    print("QC passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Offline benchmarks for the audio, video and upload hot paths.
+
+Uses a synthetic source clip (tones + noise), a synthetic background, and the
+local Google API fake (scripts/fake_google.py) for uploads, so no API keys or
+network are needed. Upload cases also check that the bytes the fake received
+(after injected errors and dropped connections) hash to the source file. Every
+case runs in a fresh process so its peak memory is measured in isolation. Results are appended to a JSON history, and the
+run fails if a case regresses beyond the threshold against the recent median.
+
+Usage:
+    PYTHONPATH=. python scripts/benchmark.py                 # full suite
+    PYTHONPATH=. python scripts/benchmark.py --quick         # skip the long cases
+    PYTHONPATH=. python scripts/benchmark.py --only audio_90m --threshold 0.3
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from statistics import median
+
+SAMPLE_RATE = 44100
+SOURCE_SECONDS = 180  # Typical Suno clip length
+
+# (case name, kind, parameters)
+AUDIO_CASES = [
+    ("audio_10m", "audio", {"minutes": 10}),
+    ("audio_90m", "audio", {"minutes": 90}),
+    ("audio_480m", "audio", {"minutes": 480}),
+    ("audio_90m_ambient", "audio", {"minutes": 90, "ambient": ["rain", "brown", "wind"]}),
+    ("audio_480m_streaming", "audio", {"minutes": 480, "streaming": True}),
+]
+RENDER_SECONDS = [("30s", 30), ("5m", 300)]
+UPLOAD_CASES = [
+    ("upload_200mb", "upload", {"mb": 200}),
+    # ~1 in 10 chunks fails with a 503 or a dropped connection (seed 1 hits
+    # several of the 21 chunks); measures resume and the client's backoff
+    ("upload_200mb_faults", "upload", {
+        "mb": 200, "faults": {"error_rate": 0.05, "disconnect_rate": 0.05, "seed": 1},
+    }),
+]
+LONG_CASES = {"audio_480m", "audio_480m_streaming", "render_5m_default", "render_5m_compact", "render_5m_numpy"}
+
+
+def write_synthetic_audio(path, seconds=SOURCE_SECONDS, sample_rate=SAMPLE_RATE, seed=0):
+    """Stereo 16-bit WAV: soft chord pad with slow tremolo plus low-level noise."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pad = sum(np.sin(2 * np.pi * freq * t) for freq in (110.0, 164.8, 220.0, 277.2)) / 4
+    pad *= 0.6 + 0.4 * np.sin(2 * np.pi * 0.05 * t)
+    noise = rng.standard_normal((2, t.size)) * 0.05
+    stereo = (pad * 0.4 + noise).T
+    pcm = (np.clip(stereo, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return path
+
+
+def write_synthetic_background(path, width=1920, height=1080):
+    """Night-sky-like gradient with speckle stars, rendered by ffmpeg."""
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"gradients=s={width}x{height}:c0=0x050a1e:c1=0x1a2850:seed=1",
+            "-vf", "noise=alls=12:allf=u",
+            "-frames:v", "1", path,
+        ],
+        check=True,
+    )
+    return path
+
+
+def _peak_rss():
+    """(own VmHWM, largest child max RSS) in bytes for the current process."""
+    import resource
+
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return own, children
+
+
+def _run_upload_case(params, workdir):
+    """YouTube upload (video + thumbnail) against the local fake."""
+    from scripts.fake_google import FakeGoogle, Faults
+    from scripts.utils import sha256_file
+
+    source = os.path.join(workdir, f"upload_{params['mb']}mb.bin")
+    with FakeGoogle(faults=Faults(**params.get("faults", {}))) as fake:
+        os.environ["GOOGLE_API_ENDPOINT"] = fake.url
+        os.environ["STATE_DIR"] = os.path.join(workdir, "state")
+        from scripts.upload_youtube import upload_video
+
+        start = time.perf_counter()
+        video_id = upload_video(
+            "benchmark", "benchmark", "benchmark", source, "benchmark", "", [],
+            thumbnail_path=os.path.join(workdir, "bg.png"),
+        )
+        seconds = time.perf_counter() - start
+        stats = fake.stats()
+        received = fake.videos[video_id]
+    if received["sha256"] != sha256_file(source):
+        raise RuntimeError(f"Upload corrupted: fake holds {received['bytes']} bytes with a different hash")
+    own, child = _peak_rss()
+    return {
+        "seconds": round(seconds, 3),
+        "peak_rss_bytes": own,
+        "peak_child_rss_bytes": child,
+        "output_bytes": received["bytes"],
+        "round_trips": stats["round_trips"],
+        "bytes_sent": stats["bytes_received"],
+        "resumes": stats["status_queries"],
+    }
+
+
+def _run_case(kind, params, workdir):
+    """Executed in a fresh worker process."""
+    if kind == "upload":
+        return _run_upload_case(params, workdir)
+    start = time.perf_counter()
+    if kind == "audio":
+        from scripts.audio_process import process_audio
+
+        output_path = os.path.join(workdir, f"audio_{params['minutes']}m.wav")
+        process_audio(
+            os.path.join(workdir, "source.wav"),
+            output_path,
+            params["minutes"],
+            0,
+            4000,
+            12,
+            5,
+            ambient=params.get("ambient"),
+            ambient_seed=0,
+            streaming=params.get("streaming", False),
+        )
+    else:
+        from scripts.video_render import render_video
+
+        output_path = os.path.join(workdir, f"render_{params['label']}_{params.get('engine', params['profile'])}.mp4")
+        render_video(
+            os.path.join(workdir, "bg.png"),
+            os.path.join(workdir, f"clip_{params['label']}.wav"),
+            output_path,
+            profile=params["profile"],
+            duration_seconds=params["seconds"],
+            motion_engine=params.get("engine", "zoompan"),
+        )
+    seconds = time.perf_counter() - start
+    own, child = _peak_rss()
+    result = {
+        "seconds": round(seconds, 3),
+        "peak_rss_bytes": own,
+        "peak_child_rss_bytes": child,
+        "output_bytes": os.path.getsize(output_path),
+    }
+    os.remove(output_path)
+    return result
+
+
+def build_cases(quick=False, only=None):
+    from scripts.video_render import RENDER_PROFILES
+
+    cases = list(AUDIO_CASES) + list(UPLOAD_CASES)
+    for label, seconds in RENDER_SECONDS:
+        for profile in RENDER_PROFILES:
+            cases.append((
+                f"render_{label}_{profile}",
+                "render",
+                {"label": label, "seconds": seconds, "profile": profile},
+            ))
+        # Same encode as render_*_default with frames from scripts/motion_frames.py
+        cases.append((
+            f"render_{label}_numpy",
+            "render",
+            {"label": label, "seconds": seconds, "profile": "default", "engine": "numpy"},
+        ))
+    if quick:
+        cases = [case for case in cases if case[0] not in LONG_CASES]
+    if only:
+        cases = [case for case in cases if case[0] in only]
+    return cases
+
+
+def prepare_inputs(workdir, cases):
+    os.makedirs(workdir, exist_ok=True)
+    source = os.path.join(workdir, "source.wav")
+    if not os.path.exists(source):
+        write_synthetic_audio(source)
+    bg_path = os.path.join(workdir, "bg.png")
+    if not os.path.exists(bg_path):
+        write_synthetic_background(bg_path)
+    for _, kind, params in cases:
+        if kind == "upload":
+            upload_path = os.path.join(workdir, f"upload_{params['mb']}mb.bin")
+            if not os.path.exists(upload_path):
+                # Incompressible, like an encoded video
+                with open(upload_path, "wb") as f:
+                    for _ in range(params["mb"]):
+                        f.write(os.urandom(2**20))
+            continue
+        if kind != "render":
+            continue
+        clip = os.path.join(workdir, f"clip_{params['label']}.wav")
+        if not os.path.exists(clip):
+            write_synthetic_audio(clip, seconds=params["seconds"], seed=1)
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def find_regressions(history, results, host, threshold, window=5):
+    """Compare against the median of the last `window` runs on the same host."""
+    regressions = []
+    for name, result in results.items():
+        previous = [
+            entry["results"][name]
+            for entry in history
+            if entry["host"] == host and name in entry["results"]
+        ][-window:]
+        if not previous:
+            continue
+        for metric in ("seconds", "peak_rss_bytes"):
+            baseline = median(item[metric] for item in previous)
+            if baseline and result[metric] > baseline * (1 + threshold):
+                regressions.append(
+                    f"{name}: {metric} {result[metric]} vs baseline {baseline:.3f} "
+                    f"(+{(result[metric] / baseline - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline audio/render benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Skip the 480-minute and 5-minute cases")
+    parser.add_argument("--only", nargs="+", help="Run only these case names")
+    parser.add_argument("--workdir", default=os.path.join("output", "benchmark"))
+    parser.add_argument("--history", default=os.path.join("benchmarks", "history.json"))
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown/growth (0.2 = 20%%)")
+    parser.add_argument("--no-record", action="store_true", help="Do not append results to the history")
+    args = parser.parse_args()
+
+    cases = build_cases(args.quick, args.only)
+    if not cases:
+        raise SystemExit("No benchmark cases selected")
+    prepare_inputs(args.workdir, cases)
+
+    results = {}
+    for name, kind, params in cases:
+        print(f"Running {name}...", flush=True)
+        # One freshly spawned process per case so peak RSS is not inherited
+        # from the parent or from earlier cases
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(_run_case, kind, params, args.workdir).result()
+        result = results[name]
+        print(
+            f"  {result['seconds']:8.2f}s  peak RSS {result['peak_rss_bytes'] / 2**20:7.1f} MiB  "
+            f"ffmpeg {result['peak_child_rss_bytes'] / 2**20:7.1f} MiB  "
+            f"output {result['output_bytes'] / 1e6:8.1f} MB"
+            + (
+                f"  {result['round_trips']} round trips, {result['resumes']} resumes, "
+                f"{result['bytes_sent'] / 1e6:.1f} MB sent"
+                if kind == "upload" else ""
+            )
+        )
+
+    host = platform.node()
+    history = load_history(args.history)
+    regressions = find_regressions(history, results, host, args.threshold)
+
+    if not args.no_record:
+        history.append({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "host": host,
+            "python": platform.python_version(),
+            "results": results,
+        })
+        os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+        with open(args.history, "w", encoding="utf-8") as f:
+            json.dump(history, f, indent=2)
+
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Several channels (e.g. sleep, study, rain) from one process.
+
+Profiles live in config/channels.json (CHANNELS_PATH):
+
+    {
+      "channels": [
+        {"name": "sleep", "every_days": 3, "env": {"PUBLISH_TIME": "20:00"}},
+        {
+          "name": "study",
+          "every_days": 1,
+          "env": {
+            "TEMPLATES_PATH": "config/templates_study.json",
+            "YOUTUBE_REFRESH_TOKEN": "$YOUTUBE_REFRESH_TOKEN_STUDY",
+            "PUBLISH_TIME": "07:00",
+            "RENDER_PROFILE": "compact",
+            "TARGET_MINUTES": "120",
+            "LENGTH_VARIANTS": ""
+          }
+        }
+      ]
+    }
+
+`env` overrides any setting read by scripts/config.py for that channel;
+values starting with "$" are read from that environment variable, so secrets
+stay out of the file. Each channel writes to output/<name>/YYYYMMDD and is
+tagged in the run history.
+
+All due channels run concurrently on one thread each, sharing the process:
+HTTP connections, Google access tokens (service objects are per thread, see
+scripts/google_clients.py), rate limits, the variation pool, the
+decoded-audio cache and thumbnail layouts. Audio/render stages take a
+CPU_JOBS slot (scripts/resources.py), so the Suno waits and uploads of one
+channel overlap with another channel's render.
+
+Usage:
+    PYTHONPATH=. python scripts/run_pipeline.py channels [--dry-run] [--only study] [--force]
+"""
+import json
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from scripts.config import get_env, load_settings
+
+CHANNELS_PATH = os.path.join("config", "channels.json")
+
+
+def load_channels(path=None):
+    path = path or get_env("CHANNELS_PATH", CHANNELS_PATH)
+    with open(path, "r", encoding="utf-8") as f:
+        channels = json.load(f)["channels"]
+    names = [channel["name"] for channel in channels]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate channel names in {path}: {names}")
+    return channels
+
+
+def _resolve_env(env):
+    """Profile env with "$NAME" values read from the environment (None if unset)."""
+    resolved = {}
+    for name, value in env.items():
+        if isinstance(value, str) and value.startswith("$"):
+            value = os.getenv(value[1:])
+        resolved[name] = value if value is None else str(value)
+    return resolved
+
+
+def channel_settings(channel, strict=True):
+    overrides = _resolve_env(channel.get("env", {}))
+    overrides.setdefault("OUTPUT_DIR", os.path.join(get_env("OUTPUT_DIR", "output"), channel["name"]))
+    settings = load_settings(strict=strict, overrides=overrides)
+    settings["channel"] = channel["name"]
+    return settings
+
+
+def is_due(channel, history, now):
+    """True when the channel has no successful run in the last every_days days."""
+    last = history.last_success(channel["name"])
+    if last is None:
+        return True
+    return (now.date() - datetime.fromisoformat(last).date()).days >= channel.get("every_days", 1)
+
+
+def run_channels(channels, dry_run=False, force=False):
+    """Run every due channel concurrently. Returns {name: "ok" | "skipped" | error}."""
+    from scripts import rate_limit, resources
+    from scripts.run_history import RunHistory, history_path
+    from scripts.run_pipeline import JST, main
+
+    # Settings of every channel are resolved up front so a missing secret
+    # fails before any channel starts spending
+    configured = [(channel, channel_settings(channel, strict=not dry_run)) for channel in channels]
+    shared = load_settings(strict=False)
+    rate_limit.configure_from_settings(shared)
+    resources.set_cpu_jobs(shared["cpu_jobs"])
+    history = RunHistory(history_path(shared))
+
+    now = datetime.now(JST)
+    results = {}
+    due = []
+    for channel, settings in configured:
+        if force or dry_run or is_due(channel, history, now):
+            due.append((channel, settings))
+        else:
+            results[channel["name"]] = "skipped"
+            print(f"[{channel['name']}] not due (every {channel.get('every_days', 1)} day(s))")
+    if not due:
+        return results
+
+    def _run(channel, settings):
+        try:
+            main(dry_run=dry_run, settings=settings, history=history)
+            return "ok"
+        except Exception as exc:
+            traceback.print_exc()
+            return f"failed: {exc}"
+
+    with ThreadPoolExecutor(max_workers=len(due), thread_name_prefix="channel") as pool:
+        futures = {channel["name"]: pool.submit(_run, channel, settings) for channel, settings in due}
+        for name, future in futures.items():
+            results[name] = future.result()
+    return results
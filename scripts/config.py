@@ -2,15 +2,21 @@ import json
 import os
 
 
-def get_env(name, default=None, required=False):
-    value = os.getenv(name, default)
+def get_env(name, default=None, required=False, overrides=None):
+    """Environment variable `name`; `overrides` (e.g. a channel profile) wins."""
+    if overrides and name in overrides:
+        value = overrides[name]
+        if value is None:
+            value = default
+    else:
+        value = os.getenv(name, default)
     if required and not value:
         raise RuntimeError(f"Missing required env var: {name}")
     return value
 
 
-def load_json_env(name, required=False):
-    raw = get_env(name, required=required)
+def load_json_env(name, required=False, overrides=None):
+    raw = get_env(name, required=required, overrides=overrides)
     if not raw:
         return None
     try:
@@ -25,36 +31,117 @@ def load_json_env(name, required=False):
         ) from exc
 
 
-def load_settings():
+def load_settings(strict=True, overrides=None):
+    """Read settings from the environment.
+
+    strict=False skips the required-credential checks, for stage-only and
+    dry-run commands that make no API calls. `overrides` maps env var names to
+    values that take precedence over the environment (channel profiles).
+    """
+
+    def env(name, default=None, required=False):
+        return get_env(name, default, required, overrides)
+
     return {
-        "gemini_api_key": get_env("GEMINI_API_KEY") or get_env("GEMINI_API_KIE"),
-        "gemini_model": get_env("GEMINI_MODEL", "gemini-2.0-flash-exp"),
-        "kieai_api_key": get_env("KIEAI_API_KEY", required=True),
-        "kieai_api_base": get_env("KIEAI_API_BASE", "https://api.kie.ai"),
-        "kieai_suno_endpoint": get_env("KIEAI_SUNO_ENDPOINT", "/api/v1/generate"),
-        "kieai_nanobanana_endpoint": get_env(
+        # Set per channel by scripts/channels.py; tags history rows and traces
+        "channel": env("CHANNEL") or None,
+        "templates_path": env("TEMPLATES_PATH", os.path.join("config", "templates.json")),
+        "output_root": env("OUTPUT_DIR", "output"),
+        # Scheduled publish time (JST, HH:MM); past it, the next day's slot is used
+        "publish_time": env("PUBLISH_TIME", "20:00"),
+        # Audio/render/variant stages allowed to run at once across channels
+        "cpu_jobs": int(env("CPU_JOBS", "1")),
+        "gemini_api_key": env("GEMINI_API_KEY") or env("GEMINI_API_KIE"),
+        "gemini_model": env("GEMINI_MODEL", "gemini-2.0-flash-exp"),
+        "gemini_timeout_seconds": float(env("GEMINI_TIMEOUT_SECONDS", "30")),
+        "gemini_breaker_threshold": int(env("GEMINI_BREAKER_THRESHOLD", "3")),
+        "gemini_breaker_cooldown_seconds": int(env("GEMINI_BREAKER_COOLDOWN_SECONDS", "21600")),
+        "variation_pool_batch": int(env("VARIATION_POOL_BATCH", "40")),
+        "variation_pool_low_water": int(env("VARIATION_POOL_LOW_WATER", "6")),
+        "kieai_api_key": env("KIEAI_API_KEY", required=strict),
+        "kieai_api_base": env("KIEAI_API_BASE", "https://api.kie.ai"),
+        "kieai_suno_endpoint": env("KIEAI_SUNO_ENDPOINT", "/api/v1/generate"),
+        "kieai_nanobanana_endpoint": env(
             "KIEAI_NANOBANANA_ENDPOINT", "/api/v1/jobs/createTask"
         ),
-        "kieai_nanobanana_bg_model": get_env(
+        "kieai_nanobanana_bg_model": env(
             "KIEAI_NANOBANANA_BG_MODEL", "google/nano-banana"
         ),
-        "kieai_nanobanana_thumb_model": get_env(
+        "kieai_nanobanana_thumb_model": env(
             "KIEAI_NANOBANANA_THUMB_MODEL", "nano-banana-pro"
         ),
-        "drive_folder_id": get_env("DRIVE_FOLDER_ID"),
-        "google_refresh_token": get_env("GOOGLE_REFRESH_TOKEN"),
-        "sheets_id": get_env("SHEETS_ID"),
-        "sheets_range": get_env("SHEETS_RANGE", "A:H"),
-        "discord_webhook_url": get_env("DISCORD_WEBHOOK_URL"),
-        "gcp_service_account": load_json_env("GCP_SERVICE_ACCOUNT_JSON"),
-        "youtube_client_id": get_env("YOUTUBE_CLIENT_ID", required=True),
-        "youtube_client_secret": get_env("YOUTUBE_CLIENT_SECRET", required=True),
-        "youtube_refresh_token": get_env("YOUTUBE_REFRESH_TOKEN", required=True),
-        "youtube_privacy": get_env("YOUTUBE_PRIVACY", "public"),
-        "max_retries": int(get_env("MAX_RETRIES", "2")),
-        "target_minutes": int(get_env("TARGET_MINUTES", "90")),
-        "target_variance_minutes": int(get_env("TARGET_VARIANCE_MINUTES", "5")),
-        "lowpass_hz": int(get_env("LOWPASS_HZ", "4000")),
-        "crossfade_seconds": int(get_env("CROSSFADE_SECONDS", "12")),
-        "fadeout_seconds": int(get_env("FADEOUT_SECONDS", "5")),
+        # "local": compose the thumbnail from bg.png; "remote": THUMB_MODEL with text
+        "thumbnail_mode": env("THUMBNAIL_MODE", "local"),
+        "thumbnail_font": env("THUMBNAIL_FONT"),
+        "drive_folder_id": env("DRIVE_FOLDER_ID"),
+        # "bundle": upload source assets + manifest; "video": upload full MP4
+        "drive_archive_mode": env("DRIVE_ARCHIVE_MODE", "bundle"),
+        "google_refresh_token": env("GOOGLE_REFRESH_TOKEN"),
+        "sheets_id": env("SHEETS_ID"),
+        "sheets_range": env("SHEETS_RANGE", "A:H"),
+        # Local state (Sheets setup flags, offline row queue, ...)
+        "state_dir": env("STATE_DIR", ".cache"),
+        "audio_cache_dir": env("AUDIO_CACHE_DIR") or os.path.join(env("STATE_DIR", ".cache"), "audio"),
+        # Moods/titles used in this many recent runs are avoided
+        "avoid_repeat_runs": int(env("AVOID_REPEAT_RUNS", "3")),
+        "discord_webhook_url": env("DISCORD_WEBHOOK_URL"),
+        "gcp_service_account": load_json_env("GCP_SERVICE_ACCOUNT_JSON", overrides=overrides),
+        "youtube_client_id": env("YOUTUBE_CLIENT_ID", required=strict),
+        "youtube_client_secret": env("YOUTUBE_CLIENT_SECRET", required=strict),
+        "youtube_refresh_token": env("YOUTUBE_REFRESH_TOKEN", required=strict),
+        "youtube_privacy": env("YOUTUBE_PRIVACY", "public"),
+        "max_retries": int(env("MAX_RETRIES", "2")),
+        # Per-upstream overrides of scripts/rate_limit.DEFAULT_LIMITS, e.g.
+        # {"kieai.poll": {"rate": 0.5, "burst": 2, "concurrency": 2}}
+        "rate_limits": load_json_env("RATE_LIMITS", overrides=overrides) or {},
+        # Share the limits with other runs on this machine via STATE_DIR lock files
+        "rate_limit_shared": env("RATE_LIMIT_SHARED", "0") not in ("0", "false", "False"),
+        "target_minutes": int(env("TARGET_MINUTES", "90")),
+        "target_variance_minutes": int(env("TARGET_VARIANCE_MINUTES", "5")),
+        "lowpass_hz": int(env("LOWPASS_HZ", "4000")),
+        "crossfade_seconds": int(env("CROSSFADE_SECONDS", "12")),
+        "fadeout_seconds": int(env("FADEOUT_SECONDS", "5")),
+        # Suno tracks per generation chained into the loop unit (1 = first track only)
+        "suno_tracks": int(env("SUNO_TRACKS", "2")),
+        "chain_max_key_shift": int(env("CHAIN_MAX_KEY_SHIFT", "2")),
+        # Comma-separated procedural bed kinds: rain, pink, brown, wind (empty = off)
+        "ambient_bed": [kind.strip() for kind in env("AMBIENT_BED", "").split(",") if kind.strip()],
+        "ambient_level_db": float(env("AMBIENT_LEVEL_DB", "-30")),
+        "qc_enabled": env("QC_ENABLED", "1") not in ("0", "false", "False"),
+        "qc_min_lufs": float(env("QC_MIN_LUFS", "-40")),
+        "qc_max_lufs": float(env("QC_MAX_LUFS", "-10")),
+        "qc_max_true_peak_db": float(env("QC_MAX_TRUE_PEAK_DB", "0")),
+        "qc_max_clipped_samples": int(env("QC_MAX_CLIPPED_SAMPLES", "100")),
+        "qc_silence_db": float(env("QC_SILENCE_DB", "-60")),
+        "qc_max_silence_seconds": float(env("QC_MAX_SILENCE_SECONDS", "3")),
+        "qc_max_seam_jump_db": float(env("QC_MAX_SEAM_JUMP_DB", "6")),
+        "qc_max_seam_dip_db": float(env("QC_MAX_SEAM_DIP_DB", "6")),
+        # Extra lengths in minutes, e.g. "60,180,480"; assembled by stream copy
+        "length_variants": [int(m) for m in env("LENGTH_VARIANTS", "").split(",") if m.strip()],
+        "variant_motion_seconds": int(env("VARIANT_MOTION_SECONDS", "600")),
+        # auto | memory | streaming | pipe (see scripts/resources.py)
+        "audio_mode": env("AUDIO_MODE", "auto"),
+        "preflight_headroom": float(env("PREFLIGHT_HEADROOM", "0.15")),
+        # Credential/tool probes before paid work (scripts/preflight.py); passes cached for the TTL
+        "preflight_checks": env("PREFLIGHT_CHECKS", "1") not in ("0", "false", "False"),
+        "preflight_ttl_seconds": int(env("PREFLIGHT_TTL_SECONDS", "900")),
+        "preflight_timeout_seconds": float(env("PREFLIGHT_TIMEOUT_SECONDS", "20")),
+        "keep_intermediates": env("KEEP_INTERMEDIATES", "0") not in ("0", "false", "False"),
+        # Prune output/YYYYMMDD runs (and the audio cache) older than this; 0 = keep
+        "retention_days": int(env("RETENTION_DAYS", "0")),
+        "retention_max_gb": float(env("RETENTION_MAX_GB", "0")),
+        "render_profile": env("RENDER_PROFILE", "default"),
+        # zoompan (ffmpeg filter) or numpy (scripts/motion_frames.py); workers 0 = all CPUs
+        "motion_engine": env("MOTION_ENGINE", "zoompan"),
+        "motion_workers": int(env("MOTION_WORKERS", "0")),
+        # Backgrounds per video, crossfaded in turn (1 = single background; see scripts/scenes.py)
+        "scenes": int(env("SCENES", "1")),
+        "scene_loop_seconds": int(env("SCENE_LOOP_SECONDS", "300")),
+        "scene_transition_seconds": int(env("SCENE_TRANSITION_SECONDS", "10")),
+        "render_target_kbps": int(env("RENDER_TARGET_KBPS", "0")) or None,
+        "render_target_mb": int(env("RENDER_TARGET_MB", "0")) or None,
+        "render_audio_codec": env("RENDER_AUDIO_CODEC") or None,
+        "render_audio_kbps": int(env("RENDER_AUDIO_KBPS", "0")) or None,
+        "render_baseline_kbps": int(env("RENDER_BASELINE_KBPS", "2500")),
+        "upload_mbps": float(env("UPLOAD_MBPS", "50")),
     }
@@ -0,0 +1,527 @@
+"""Local stand-in for the YouTube, Drive, Sheets and OAuth token endpoints.
+
+Implements just what the pipeline calls, with Google's wire protocol so the
+real client libraries run unchanged:
+
+- POST /token (refresh-token grant); access tokens carry the requested
+  scopes, and each API call is refused (403 insufficient scopes) unless its
+  token has one of the scopes Google accepts for that method. With
+  granted_scopes (--grant), refresh tokens behave as if only those were
+  consented to, so asking for any other scope fails with invalid_scope
+- resumable uploads for YouTube videos.insert and Drive files.create:
+  session start, chunked PUTs with Content-Range, 308 + Range progress, and
+  "bytes */N" status queries used to resume
+- YouTube thumbnails.set (media upload) and channels.list (mine=true, status)
+- Drive files.get (metadata; any ID is an existing folder)
+- Sheets spreadsheets.get, values.get/update/append and batchUpdate
+
+Uploaded bytes are not stored: each upload keeps its size and a running
+SHA-256, so a resumed upload can be checked against the source file. Faults
+can be injected into upload chunks (5xx errors, connections dropped mid-body)
+and every request can be slowed (latency, bandwidth cap). GET /_stats returns
+round trips per endpoint, bytes received, faults and resumes.
+
+Point the clients at it with GOOGLE_API_ENDPOINT (see scripts/google_clients.py):
+
+    PYTHONPATH=. python scripts/fake_google.py --port 8089 --error-rate 0.1 --disconnect-rate 0.05
+    GOOGLE_API_ENDPOINT=http://127.0.0.1:8089 PYTHONPATH=. python scripts/test_drive_sheets.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+READ_BLOCK = 64 * 1024
+CONTENT_RANGE = re.compile(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)")
+AUTH = "https://www.googleapis.com/auth/"
+# Endpoint name -> scopes any one of which authorizes the call (as documented
+# per method by Google); endpoints not listed need no token
+REQUIRED_SCOPES = {
+    "youtube.videos.insert": ("youtube.upload", "youtube", "youtube.force-ssl"),
+    "youtube.thumbnails.set": ("youtube.upload", "youtube", "youtube.force-ssl"),
+    "youtube.channels.list": ("youtube.readonly", "youtube", "youtube.force-ssl"),
+    "drive.files.create": ("drive.file", "drive"),
+    "drive.files.get": ("drive.file", "drive", "drive.readonly", "drive.metadata.readonly"),
+    "sheets.get": ("spreadsheets", "spreadsheets.readonly", "drive", "drive.file", "drive.readonly"),
+    "sheets.values.get": ("spreadsheets", "spreadsheets.readonly", "drive", "drive.file", "drive.readonly"),
+    "sheets.values.update": ("spreadsheets", "drive", "drive.file"),
+    "sheets.values.append": ("spreadsheets", "drive", "drive.file"),
+    "sheets.batchUpdate": ("spreadsheets", "drive", "drive.file"),
+}
+
+
+class Faults:
+    """What to inject. Errors and disconnects hit upload chunk PUTs only (the
+    requests the resumable protocol can recover from); latency and the
+    bandwidth cap apply to every request."""
+
+    def __init__(self, error_rate=0.0, disconnect_rate=0.0, latency_ms=0, bandwidth_mbps=0, seed=0):
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.latency_ms = latency_ms
+        self.bandwidth_mbps = bandwidth_mbps
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """None, "error" or "disconnect" for the next upload chunk."""
+        with self._lock:
+            value = self._random.random()
+        if value < self.error_rate:
+            return "error"
+        if value < self.error_rate + self.disconnect_rate:
+            return "disconnect"
+        return None
+
+
+class Upload:
+    def __init__(self, kind, metadata, total):
+        self.kind = kind
+        self.metadata = metadata
+        self.total = total
+        self.received = 0
+        self.digest = hashlib.sha256()
+        self.result = None  # response body once complete
+        self.lock = threading.Lock()  # one chunk at a time
+
+
+def _column_row(cell):
+    """("A", 1) from "A1"; row None for a bare column."""
+    match = re.fullmatch(r"([A-Z]+)(\d*)", cell)
+    if not match:
+        raise ValueError(f"Unsupported cell reference: {cell}")
+    return match.group(1), int(match.group(2)) if match.group(2) else None
+
+
+def parse_range(a1):
+    """(first row, last row or None) of an A1 range like "Sheet1!A1:H5" or "A:H"."""
+    cells = a1.split("!")[-1].split(":")
+    first = _column_row(cells[0])[1] or 1
+    last = _column_row(cells[-1])[1] if len(cells) > 1 else first
+    return first, last
+
+
+class FakeGoogle:
+    def __init__(self, host="127.0.0.1", port=0, faults=None, granted_scopes=None):
+        self.faults = faults or Faults()
+        # None: every refresh token was granted whatever scope it asks for
+        self.granted_scopes = set(granted_scopes) if granted_scopes is not None else None
+        self.tokens = {}  # access token -> its scopes
+        self.lock = threading.Lock()
+        self.uploads = {}
+        self.videos = {}
+        self.thumbnails = {}
+        self.files = {}
+        self.sheets = {}
+        self.reset_stats()
+        handler = type("Handler", (_Handler,), {"fake": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self.lock:
+            self._stats = {
+                "requests": {},
+                "bytes_received": 0,
+                "errors_injected": 0,
+                "disconnects_injected": 0,
+                "status_queries": 0,
+                "overlap_bytes": 0,
+            }
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self._stats[key] += amount
+
+    def count_request(self, endpoint):
+        with self.lock:
+            requests = self._stats["requests"]
+            requests[endpoint] = requests.get(endpoint, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            stats = json.loads(json.dumps(self._stats))
+        stats["round_trips"] = sum(stats["requests"].values())
+        return stats
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-google", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as with Google
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # -- plumbing ---------------------------------------------------------
+
+    def _read_body(self, length=None, on_block=None):
+        """Read the request body in blocks at the bandwidth cap. on_block may
+        return False to stop reading (the rest stays unread)."""
+        length = int(self.headers.get("Content-Length", 0)) if length is None else length
+        mbps = self.fake.faults.bandwidth_mbps
+        start = time.monotonic()
+        remaining = length
+        parts = []
+        while remaining:
+            block = self.rfile.read(min(READ_BLOCK, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            self.fake.count("bytes_received", len(block))
+            if mbps:
+                ahead = (length - remaining) * 8 / (mbps * 1e6) - (time.monotonic() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+            if on_block is None:
+                parts.append(block)
+            elif on_block(block) is False:
+                return None
+        return b"".join(parts)
+
+    def _json_body(self):
+        body = self._read_body()
+        return json.loads(body) if body else {}
+
+    def _send(self, status, payload=None, headers=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, {"error": {"code": status, "message": message, "errors": [{"message": message}]}})
+
+    def _dispatch(self, method):
+        if self.fake.faults.latency_ms:
+            time.sleep(self.fake.faults.latency_ms / 1000)
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        for pattern, route_method, endpoint, handler in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and route_method == method:
+                self.fake.count_request(endpoint)
+                if endpoint in REQUIRED_SCOPES and not self._authorized(endpoint):
+                    return
+                try:
+                    handler(self, query, *match.groups())
+                except (KeyError, ValueError) as exc:
+                    self._error(400, f"{type(exc).__name__}: {exc}")
+                return
+        self.fake.count_request("unknown")
+        self._read_body()
+        self._error(404, f"No fake for {method} {path}")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    # -- OAuth ------------------------------------------------------------
+
+    def _authorized(self, endpoint):
+        """Check the bearer token's scopes; answers 401/403 itself when refused."""
+        header = self.headers.get("Authorization", "")
+        with self.fake.lock:
+            scopes = self.fake.tokens.get(header[len("Bearer "):]) if header.startswith("Bearer ") else None
+        if scopes is None:
+            self._read_body()
+            self._error(401, "Request had invalid authentication credentials.")
+            return False
+        if scopes != "*" and not scopes & {AUTH + scope for scope in REQUIRED_SCOPES[endpoint]}:
+            self._read_body()
+            self._error(403, "Request had insufficient authentication scopes.")
+            return False
+        return True
+
+    def token(self, query):
+        form = parse_qs(self._read_body().decode("utf-8"))
+        requested = set(form["scope"][0].split()) if "scope" in form else set()
+        granted = self.fake.granted_scopes
+        if granted is not None and requested - granted:
+            return self._send(400, {
+                "error": "invalid_scope",
+                "error_description": f"Scope not granted to this refresh token: {' '.join(sorted(requested - granted))}",
+            })
+        access_token = f"fake-{uuid.uuid4().hex}"
+        with self.fake.lock:
+            # Without a scope parameter the token carries everything granted
+            self.fake.tokens[access_token] = requested or (granted if granted is not None else "*")
+        payload = {"access_token": access_token, "expires_in": 3600, "token_type": "Bearer"}
+        if requested:
+            payload["scope"] = " ".join(sorted(requested))
+        self._send(200, payload)
+
+    # -- resumable uploads ------------------------------------------------
+
+    def start_upload(self, query, kind):
+        if query.get("uploadType") != "resumable":
+            self._read_body()
+            return self._error(400, "Only resumable uploads are faked for this method")
+        metadata = self._json_body()
+        total = self.headers.get("X-Upload-Content-Length")
+        upload_id = uuid.uuid4().hex
+        with self.fake.lock:
+            self.fake.uploads[upload_id] = Upload(kind, metadata, int(total) if total else None)
+        host = self.headers.get("Host") or "{}:{}".format(*self.server.server_address[:2])
+        self._send(200, {}, headers={"Location": f"http://{host}/_upload/{upload_id}"})
+
+    def put_chunk(self, query, upload_id):
+        upload = self.fake.uploads[upload_id]
+        match = CONTENT_RANGE.fullmatch(self.headers.get("Content-Range", "").strip())
+        if not match:
+            self._read_body()
+            return self._error(400, "Missing or invalid Content-Range")
+        first, last, total = match.groups()
+        if total != "*":
+            upload.total = int(total)
+
+        if first is None:
+            # "bytes */N": where should the client resume?
+            self.fake.count("status_queries")
+            self._read_body()
+            return self._progress(upload)
+        if upload.result is not None:
+            self._read_body()
+            return self._send(200, upload.result)
+
+        fault = self.fake.faults.draw()
+        if fault == "error":
+            self.fake.count("errors_injected")
+            self._read_body()
+            return self._error(503, "Injected backend error")
+
+        first, last = int(first), int(last)
+        length = int(self.headers.get("Content-Length", 0))
+        if first > upload.received:
+            self._read_body()
+            return self._error(400, f"Chunk starts at {first}, only {upload.received} bytes received")
+        # Bytes already persisted (a client resend after a drop) are skipped
+        skip = upload.received - first
+        cut_at = length // 2 if fault == "disconnect" else None
+        offset = 0
+
+        def on_block(block):
+            nonlocal offset
+            start, offset = offset, offset + len(block)
+            if cut_at is not None and offset >= cut_at:
+                block = block[:max(cut_at - start, 0)]
+            if start < skip:
+                overlap = min(skip - start, len(block))
+                self.fake.count("overlap_bytes", overlap)
+                block = block[overlap:]
+            upload.digest.update(block)
+            upload.received += len(block)
+            return cut_at is None or offset < cut_at
+
+        with upload.lock:
+            completed = self._read_body(length, on_block) is not None
+        if not completed:
+            # Drop the connection mid-body, keeping what arrived
+            self.fake.count("disconnects_injected")
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if last + 1 != first + length:
+            return self._error(400, "Content-Range does not match Content-Length")
+        self._progress(upload)
+
+    def _progress(self, upload):
+        if upload.total is not None and upload.received >= upload.total:
+            if upload.result is None:
+                upload.result = self._complete(upload)
+            return self._send(200, upload.result)
+        headers = {"Range": f"bytes=0-{upload.received - 1}"} if upload.received else {}
+        self._send(308, None, headers=headers)
+
+    def _complete(self, upload):
+        record = {"bytes": upload.received, "sha256": upload.digest.hexdigest(), **upload.metadata}
+        resource_id = uuid.uuid4().hex[:11]
+        with self.fake.lock:
+            if upload.kind == "youtube":
+                self.fake.videos[resource_id] = record
+            else:
+                self.fake.files[resource_id] = record
+        if upload.kind == "youtube":
+            return {"kind": "youtube#video", "id": resource_id, **upload.metadata}
+        return {"kind": "drive#file", "id": resource_id, "name": upload.metadata.get("name")}
+
+    def set_thumbnail(self, query):
+        body = self._read_body()
+        video_id = query["videoId"]
+        if video_id not in self.fake.videos:
+            return self._error(404, f"Video not found: {video_id}")
+        with self.fake.lock:
+            self.fake.thumbnails[video_id] = {"bytes": len(body), "sha256": hashlib.sha256(body).hexdigest()}
+        self._send(200, {"kind": "youtube#thumbnailSetResponse", "items": [{"default": {"url": "fake"}}]})
+
+    def list_channels(self, query):
+        self._send(200, {
+            "kind": "youtube#channelListResponse",
+            "items": [{"kind": "youtube#channel", "id": "fake-channel", "status": {"longUploadsStatus": "allowed"}}],
+        })
+
+    def get_file(self, query, file_id):
+        with self.fake.lock:
+            uploaded = file_id in self.fake.files
+        mime_type = "application/octet-stream" if uploaded else "application/vnd.google-apps.folder"
+        self._send(200, {"kind": "drive#file", "id": file_id, "mimeType": mime_type})
+
+    # -- Sheets -----------------------------------------------------------
+
+    def _sheet(self, spreadsheet_id):
+        with self.fake.lock:
+            return self.fake.sheets.setdefault(spreadsheet_id, {"sheetId": 0, "rows": [], "requests": []})
+
+    def get_spreadsheet(self, query, spreadsheet_id):
+        sheet = self._sheet(spreadsheet_id)
+        self._send(200, {
+            "spreadsheetId": spreadsheet_id,
+            "sheets": [{"properties": {"sheetId": sheet["sheetId"], "title": "Sheet1"}}],
+        })
+
+    def get_values(self, query, spreadsheet_id, a1):
+        sheet = self._sheet(spreadsheet_id)
+        first, last = parse_range(a1)
+        rows = sheet["rows"][first - 1:last]
+        payload = {"range": a1, "majorDimension": "ROWS"}
+        if any(rows):
+            payload["values"] = rows
+        self._send(200, payload)
+
+    def update_values(self, query, spreadsheet_id, a1):
+        values = self._json_body().get("values", [])
+        sheet = self._sheet(spreadsheet_id)
+        first, _ = parse_range(a1)
+        with self.fake.lock:
+            rows = sheet["rows"]
+            rows.extend([] for _ in range(first - 1 + len(values) - len(rows)))
+            rows[first - 1:first - 1 + len(values)] = values
+        self._send(200, {"spreadsheetId": spreadsheet_id, "updatedRange": a1, "updatedRows": len(values)})
+
+    def append_values(self, query, spreadsheet_id, a1):
+        values = self._json_body().get("values", [])
+        sheet = self._sheet(spreadsheet_id)
+        with self.fake.lock:
+            start = len(sheet["rows"]) + 1
+            sheet["rows"].extend(values)
+        self._send(200, {
+            "spreadsheetId": spreadsheet_id,
+            "updates": {"updatedRange": f"A{start}:A{start + len(values) - 1}", "updatedRows": len(values)},
+        })
+
+    def batch_update(self, query, spreadsheet_id):
+        requests = self._json_body().get("requests", [])
+        sheet = self._sheet(spreadsheet_id)
+        with self.fake.lock:
+            for request in requests:
+                sheet["requests"].append(request)
+                cells = request.get("updateCells")
+                if cells:
+                    row = cells["start"].get("rowIndex", 0)
+                    values = [
+                        [next(iter(cell["userEnteredValue"].values())) for cell in entry["values"]]
+                        for entry in cells["rows"]
+                    ]
+                    rows = sheet["rows"]
+                    rows.extend([] for _ in range(row + len(values) - len(rows)))
+                    rows[row:row + len(values)] = values
+        self._send(200, {"spreadsheetId": spreadsheet_id, "replies": [{} for _ in requests]})
+
+    # -- introspection ----------------------------------------------------
+
+    def get_stats(self, query):
+        self._send(200, self.fake.stats())
+
+    def post_reset(self, query):
+        self._read_body()
+        self.fake.reset_stats()
+        self._send(200, {})
+
+
+# (path regex, method, endpoint name for round-trip counts, handler)
+ROUTES = (
+    (r"/token", "POST", "oauth.token", _Handler.token),
+    (r"/upload/youtube/v3/videos", "POST", "youtube.videos.insert", lambda h, q: h.start_upload(q, "youtube")),
+    (r"/upload/drive/v3/files", "POST", "drive.files.create", lambda h, q: h.start_upload(q, "drive")),
+    (r"/_upload/(\w+)", "PUT", "upload.chunk", _Handler.put_chunk),
+    (r"/upload/youtube/v3/thumbnails/set", "POST", "youtube.thumbnails.set", _Handler.set_thumbnail),
+    (r"/youtube/v3/channels", "GET", "youtube.channels.list", _Handler.list_channels),
+    (r"/drive/v3/files/([^/]+)", "GET", "drive.files.get", _Handler.get_file),
+    (r"/v4/spreadsheets/([^/:]+)", "GET", "sheets.get", _Handler.get_spreadsheet),
+    (r"/v4/spreadsheets/([^/:]+)/values/(.+)", "GET", "sheets.values.get", _Handler.get_values),
+    (r"/v4/spreadsheets/([^/:]+)/values/(.+)", "PUT", "sheets.values.update", _Handler.update_values),
+    (r"/v4/spreadsheets/([^/:]+)/values/(.+):append", "POST", "sheets.values.append", _Handler.append_values),
+    (r"/v4/spreadsheets/([^/:]+):batchUpdate", "POST", "sheets.batchUpdate", _Handler.batch_update),
+    (r"/_stats", "GET", "stats", _Handler.get_stats),
+    (r"/_reset", "POST", "reset", _Handler.post_reset),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake of the YouTube/Drive/Sheets APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upload chunks answered 503")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Fraction of chunks dropped mid-body")
+    parser.add_argument("--latency-ms", type=int, default=0, help="Added to every request")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0, help="Cap on request body rate (0 = none)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--grant", action="append", metavar="SCOPE",
+        help="Scope refresh tokens were granted, e.g. youtube.upload (repeatable; default: any scope asked for)",
+    )
+    args = parser.parse_args()
+
+    faults = Faults(args.error_rate, args.disconnect_rate, args.latency_ms, args.bandwidth_mbps, args.seed)
+    granted = [scope if "://" in scope else AUTH + scope for scope in args.grant] if args.grant else None
+    fake = FakeGoogle(args.host, args.port, faults, granted_scopes=granted)
+    print(f"Fake Google APIs on {fake.url} (set GOOGLE_API_ENDPOINT={fake.url})")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+        print(json.dumps(fake.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
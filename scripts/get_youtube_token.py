@@ -61,7 +61,12 @@ def main():
         }
     }
 
-    scopes = ["https://www.googleapis.com/auth/youtube.upload"]
+    # upload_youtube.YOUTUBE_SCOPES + YOUTUBE_READ_SCOPES: uploads, and the
+    # channel's long-upload status for the preflight check
+    scopes = [
+        "https://www.googleapis.com/auth/youtube.upload",
+        "https://www.googleapis.com/auth/youtube.readonly",
+    ]
     flow = InstalledAppFlow.from_client_config(client_config, scopes=scopes)
     flow.redirect_uri = redirect_uri
 
@@ -0,0 +1,249 @@
+"""Shared Google credentials and service objects.
+
+- Access tokens are cached until shortly before expiry, in memory and in
+  <STATE_DIR>/google_tokens.json so separate processes can reuse them.
+- Discovery documents come from the copies bundled with google-api-python-client
+  (static_discovery), so no discovery fetch is made.
+- Service objects are reused per (API, version, identity, scopes) within a
+  thread.
+- GOOGLE_API_ENDPOINT (e.g. http://127.0.0.1:8089 from scripts/fake_google.py)
+  points every API, upload and token request at that server instead of Google.
+
+Service objects wrap an httplib2 connection and are not thread-safe, so each
+thread (channel runs, the Sheets sync, preflight probes) builds its own
+credentials and services. Access tokens are shared: refreshes happen under a
+lock, and a thread that finds a fresh token cached by another adopts it
+instead of refreshing again.
+"""
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from scripts.config import get_env
+
+TOKEN_URI = "https://oauth2.googleapis.com/token"
+# Refresh a little before Google's expiry so a long upload never starts on a stale token
+EXPIRY_MARGIN = timedelta(minutes=5)
+RETRIABLE_STATUSES = (500, 502, 503, 504)
+
+# Guards token refreshes and the token cache file
+_lock = threading.Lock()
+_local = threading.local()
+_generation = 0
+
+
+def api_endpoint():
+    """GOOGLE_API_ENDPOINT without a trailing slash, or None for the real APIs."""
+    return (get_env("GOOGLE_API_ENDPOINT") or "").rstrip("/") or None
+
+
+def _token_uri():
+    endpoint = api_endpoint()
+    return f"{endpoint}/token" if endpoint else TOKEN_URI
+
+
+def _identity(*parts):
+    # Tokens issued by a fake endpoint must never be offered to Google
+    endpoint = api_endpoint()
+    return [*parts, endpoint] if endpoint else list(parts)
+
+
+def _token_cache_path():
+    return os.path.join(get_env("STATE_DIR", ".cache"), "google_tokens.json")
+
+
+def _cache_key(identity, scopes):
+    raw = json.dumps([identity, sorted(scopes)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _load_token_cache():
+    path = _token_cache_path()
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_token(key, token, expiry):
+    from scripts.utils import write_json_atomic
+
+    cache = _load_token_cache()
+    cache[key] = {"token": token, "expiry": expiry.isoformat()}
+    # mkstemp files are 0600, like the tokens they hold
+    write_json_atomic(_token_cache_path(), cache)
+
+
+def _cached_token(key):
+    entry = _load_token_cache().get(key)
+    if not entry:
+        return None, None
+    expiry = datetime.fromisoformat(entry["expiry"])
+    if expiry - EXPIRY_MARGIN <= datetime.utcnow():
+        return None, None
+    return entry["token"], expiry
+
+
+def _thread_cache():
+    """This thread's {"credentials": {...}, "services": {...}}, emptied by clear_caches()."""
+    cache = getattr(_local, "cache", None)
+    if cache is None or cache["generation"] != _generation:
+        cache = {"generation": _generation, "credentials": {}, "services": {}}
+        _local.cache = cache
+    return cache
+
+
+def _is_fresh(creds):
+    return creds.valid and creds.expiry and creds.expiry - EXPIRY_MARGIN > datetime.utcnow()
+
+
+def _ensure_fresh(key, creds, force=False):
+    """Refresh creds if needed (or always, with force) and persist the new access token."""
+    if not force and _is_fresh(creds):
+        return creds
+    from google.auth.transport.requests import Request
+
+    with _lock:
+        if not force:
+            # Another thread may have refreshed this identity while we waited
+            token, expiry = _cached_token(key)
+            if token:
+                creds.token, creds.expiry = token, expiry
+                return creds
+        creds.refresh(Request())
+        _save_token(key, creds.token, creds.expiry)
+    return creds
+
+
+def oauth_credentials(client_id, client_secret, refresh_token, scopes, force_refresh=False):
+    """User OAuth credentials (YouTube, Drive) with a shared access-token cache.
+
+    force_refresh exchanges the refresh token even if a cached access token is
+    still valid (preflight: a revoked token must fail now, not at upload time).
+    """
+    from google.oauth2.credentials import Credentials
+
+    key = _cache_key(_identity("oauth", client_id, refresh_token), scopes)
+    credentials = _thread_cache()["credentials"]
+    creds = credentials.get(key)
+    if creds is None:
+        token, expiry = _cached_token(key)
+        creds = Credentials(
+            token,
+            refresh_token=refresh_token,
+            token_uri=_token_uri(),
+            client_id=client_id,
+            client_secret=client_secret,
+            scopes=scopes,
+            expiry=expiry,
+        )
+        credentials[key] = creds
+    return key, _ensure_fresh(key, creds, force_refresh)
+
+
+def service_account_credentials(service_account_info, scopes, force_refresh=False):
+    """Service-account credentials (Sheets) with a shared access-token cache."""
+    from google.oauth2.service_account import Credentials
+
+    email = service_account_info.get("client_email")
+    if api_endpoint():
+        # The fake endpoint cannot verify a signed JWT; use its refresh grant
+        return oauth_credentials(email, "fake", f"service-account:{email}", scopes, force_refresh)
+    key = _cache_key(_identity("service_account", email), scopes)
+    credentials = _thread_cache()["credentials"]
+    creds = credentials.get(key)
+    if creds is None:
+        creds = Credentials.from_service_account_info(service_account_info, scopes=scopes)
+        creds.token, creds.expiry = _cached_token(key)
+        credentials[key] = creds
+    return key, _ensure_fresh(key, creds, force_refresh)
+
+
+def _service(api, version, key, creds):
+    services = _thread_cache()["services"]
+    service_key = (api, version, key)
+    service = services.get(service_key)
+    if service is None:
+        endpoint = api_endpoint()
+        if endpoint:
+            from googleapiclient.discovery import build_from_document
+            from googleapiclient.discovery_cache import get_static_doc
+
+            # Rewrite the bundled document's root so uploads (which ignore
+            # client_options.api_endpoint) go to the same server
+            document = json.loads(get_static_doc(api, version))
+            document["rootUrl"] = f"{endpoint}/"
+            document["baseUrl"] = f"{endpoint}/{document['servicePath']}"
+            service = build_from_document(document, credentials=creds)
+        else:
+            from googleapiclient.discovery import build
+
+            service = build(
+                api,
+                version,
+                credentials=creds,
+                cache_discovery=False,
+                static_discovery=True,
+            )
+        services[service_key] = service
+    return service
+
+
+def oauth_service(api, version, client_id, client_secret, refresh_token, scopes, force_refresh=False):
+    key, creds = oauth_credentials(client_id, client_secret, refresh_token, scopes, force_refresh)
+    return _service(api, version, key, creds)
+
+
+def service_account_service(api, version, service_account_info, scopes, force_refresh=False):
+    key, creds = service_account_credentials(service_account_info, scopes, force_refresh)
+    return _service(api, version, key, creds)
+
+
+def run_resumable(request, max_retries=10):
+    """Send a resumable upload chunk by chunk and return the final response.
+
+    5xx answers and dropped connections are retried on the same session:
+    the next next_chunk() asks the server how many bytes it holds and resumes
+    from there, so nothing already received is sent again.
+    """
+    import httplib2
+    from googleapiclient.errors import HttpError
+
+    from scripts import tracing
+
+    response = None
+    retry_count = 0
+    while response is None:
+        try:
+            print("Uploading chunk...")
+            status, response = request.next_chunk()
+            if status:
+                print(f"Upload progress: {int(status.progress() * 100)}%")
+            continue
+        except HttpError as e:
+            if e.resp.status not in RETRIABLE_STATUSES:
+                raise
+            error = f"Retriable error {e.resp.status}: {e}"
+        except (OSError, http.client.HTTPException, httplib2.HttpLib2Error) as e:
+            error = f"Connection error: {e!r}"
+        retry_count += 1
+        if retry_count > max_retries:
+            raise Exception(f"Upload failed after {max_retries} retries: {error}")
+        print(f"{error}. Resuming in {retry_count * 2} seconds...")
+        tracing.count("retries")
+        time.sleep(retry_count * 2)
+    return response
+
+
+def clear_caches():
+    """Drop every thread's in-memory credentials and services (the on-disk token cache is kept)."""
+    global _generation
+    with _lock:
+        _generation += 1
@@ -1,16 +1,22 @@
-import requests
-
+from scripts import tracing
 from scripts.kieai_client import KieAIClient
+from scripts.utils import http_session
 
 
 def download_image(url, output_path):
-    response = requests.get(url, timeout=120)
+    response = http_session().get(url, timeout=120)
     response.raise_for_status()
+    tracing.add_network_bytes(received=len(response.content))
     with open(output_path, "wb") as f:
         f.write(response.content)
     return output_path
 
 
+def generate_image(client, prompt, seed, output_path, with_text, model):
+    url = client.generate_nanobanana(prompt, seed=seed, with_text=with_text, model=model)
+    return download_image(url, output_path)
+
+
 def generate_images(
     client: KieAIClient,
     bg_prompt,
@@ -20,13 +26,29 @@ def generate_images(
     thumb_path,
     bg_model="google/nano-banana",
     thumb_model="nano-banana-pro",
+    scene_prompts=(),
+    scene_paths=(),
 ):
-    # Background: google/nano-banana (no text, cheaper)
-    bg_url = client.generate_nanobanana(bg_prompt, seed=seed, with_text=False, model=bg_model)
-    download_image(bg_url, bg_path)
+    """Generate the background, extra scene backgrounds and thumbnail at once.
+
+    The tasks are independent, so their polling overlaps instead of adding up.
+    """
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
 
-    # Thumbnail: nano-banana-pro (supports Japanese text generation)
-    thumb_url = client.generate_nanobanana(thumb_prompt, seed=seed, with_text=True, model=thumb_model)
-    download_image(thumb_url, thumb_path)
+    # Backgrounds: google/nano-banana (no text, cheaper)
+    jobs = [(bg_prompt, bg_path, False, bg_model)]
+    jobs += [(prompt, path, False, bg_model) for prompt, path in zip(scene_prompts, scene_paths)]
+    # Thumbnail: nano-banana-pro (supports Japanese text generation); skipped
+    # when the thumbnail is composed locally
+    if thumb_path is not None:
+        jobs.append((thumb_prompt, thumb_path, True, thumb_model))
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, generate_image, client, prompt, seed, path, with_text, model)
+            for prompt, path, with_text, model in jobs
+        ]
+        for future in futures:
+            future.result()
 
     return bg_path, thumb_path
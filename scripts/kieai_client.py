@@ -1,9 +1,9 @@
 import time
 from urllib.parse import urljoin
 
-import requests
-
-from scripts.utils import request_with_retry
+from scripts import tracing
+from scripts.rate_limit import throttle
+from scripts.utils import http_session, request_with_retry
 
 
 class KieAIClient:
@@ -24,8 +24,25 @@ class KieAIClient:
                 return payload[key]
         return None
 
+    def credits(self):
+        """Remaining account credits. Cheap; fails on an invalid key (preflight)."""
+        response = http_session().get(
+            urljoin(self.api_base, "/api/v1/chat/credit"), headers=self._headers(), timeout=30
+        )
+        tracing.add_network_bytes(received=len(response.content))
+        response.raise_for_status()
+        data = response.json()
+        if data.get("code") != 200:
+            raise RuntimeError(f"Credit query error: {data}")
+        return data.get("data")
+
     def generate_suno(self, prompt, seed, model="V4", custom_mode=False, instrumental=False):
-        """Generate music using Suno API (async)"""
+        """Generate music using Suno API (async). Returns the audio URL of every
+        track the task produced (usually two)."""
+        with tracing.span("kieai.suno", model=model):
+            return self._generate_suno(prompt, seed, model, custom_mode, instrumental)
+
+    def _generate_suno(self, prompt, seed, model, custom_mode, instrumental):
         url = urljoin(self.api_base, self.suno_endpoint)
 
         payload = {
@@ -42,6 +59,7 @@ class KieAIClient:
             url,
             headers=self._headers(),
             json_payload=payload,
+            limit="kieai.submit",
         )
         data = response.json()
 
@@ -56,17 +74,20 @@ class KieAIClient:
         return self._poll_suno_task(task_id)
 
     def _poll_suno_task(self, task_id, max_wait=600, poll_interval=10):
-        """Poll Suno task until completion"""
+        """Poll Suno task until completion; returns all track URLs"""
         query_url = urljoin(self.api_base, "/api/v1/generate/record-info")
         start_time = time.time()
 
         while time.time() - start_time < max_wait:
-            response = requests.get(
-                query_url,
-                headers=self._headers(),
-                params={"taskId": task_id},
-                timeout=30,
-            )
+            with throttle("kieai.poll"):
+                response = http_session().get(
+                    query_url,
+                    headers=self._headers(),
+                    params={"taskId": task_id},
+                    timeout=30,
+                )
+            tracing.count("polls")
+            tracing.add_network_bytes(received=len(response.content))
             response.raise_for_status()
             data = response.json()
 
@@ -78,11 +99,10 @@ class KieAIClient:
 
             if status == "SUCCESS":
                 response_data = data.get("data", {}).get("response", {})
-                suno_data = response_data.get("sunoData", [])
-                if suno_data and len(suno_data) > 0:
-                    audio_url = suno_data[0].get("audioUrl")
-                    if audio_url:
-                        return audio_url
+                suno_data = response_data.get("sunoData", []) or []
+                audio_urls = [track.get("audioUrl") for track in suno_data if track.get("audioUrl")]
+                if audio_urls:
+                    return audio_urls
                 raise RuntimeError(f"No audio URL in completed task: {data}")
 
             if status in ("FAILED", "ERROR"):
@@ -94,6 +114,10 @@ class KieAIClient:
 
     def generate_nanobanana(self, prompt, seed=None, with_text=False, model="google/nano-banana"):
         """Generate image using Nano Banana API (async)"""
+        with tracing.span("kieai.nanobanana", model=model):
+            return self._generate_nanobanana(prompt, model)
+
+    def _generate_nanobanana(self, prompt, model):
         url = urljoin(self.api_base, self.nanobanana_endpoint)
 
         # Different parameters for nano-banana vs nano-banana-pro
@@ -125,6 +149,7 @@ class KieAIClient:
             url,
             headers=self._headers(),
             json_payload=payload,
+            limit="kieai.submit",
         )
         data = response.json()
 
@@ -144,12 +169,15 @@ class KieAIClient:
         start_time = time.time()
 
         while time.time() - start_time < max_wait:
-            response = requests.get(
-                query_url,
-                headers=self._headers(),
-                params={"taskId": task_id},
-                timeout=30,
-            )
+            with throttle("kieai.poll"):
+                response = http_session().get(
+                    query_url,
+                    headers=self._headers(),
+                    params={"taskId": task_id},
+                    timeout=30,
+                )
+            tracing.count("polls")
+            tracing.add_network_bytes(received=len(response.content))
             response.raise_for_status()
             data = response.json()
 
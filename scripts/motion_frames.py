@@ -0,0 +1,303 @@
+"""Ken Burns frames computed in NumPy and piped to ffmpeg as rawvideo.
+
+An alternative to the zoompan filter (MOTION_ENGINE=numpy). zoompan evaluates
+its expressions once per frame on a single thread and rounds the crop window
+to whole pixels, so a slow zoom shimmers as the window snaps from pixel to
+pixel. Here:
+
+- the background is scaled once, exactly like the zoompan chain's first stage
+  (1.1x the output, yuv420p), and held in shared memory
+- the whole zoom/pan trajectory (same formulas as zoompan_filter and
+  looping_zoompan_filter) is precomputed as float arrays
+- each frame is a sub-pixel, separable bilinear resample of the window
+  (x, y, iw/zoom, ih/zoom) straight into yuv420p, so there is no rounding and
+  no per-frame colour conversion in ffmpeg
+- MOTION_WORKERS processes render into a ring of shared-memory frame slots;
+  the parent writes finished slots to ffmpeg in order
+
+Usage:
+    PYTHONPATH=. python scripts/motion_frames.py bg.png --seconds 30 --output motion.mp4 [--workers 4]
+"""
+import argparse
+import math
+import os
+import subprocess
+from collections import deque
+
+from scripts import tracing
+
+FPS = 25
+PRESCALE = 1.1  # zoompan_filter scales the background up 10% for panning room
+
+_worker = {}  # per-process state of the pool workers (see _init_worker)
+
+
+def prescaled_size(bg_size, width, height):
+    """Size ffmpeg's scale=W*1.1:H*1.1:force_original_aspect_ratio=increase
+    gives the background, rounded up to even for yuv420p."""
+    bg_w, bg_h = bg_size
+    scaled_w, scaled_h = int(width * PRESCALE), int(height * PRESCALE)
+    # av_rescale rounds to nearest
+    scaled_w, scaled_h = max(scaled_w, round(scaled_h * bg_w / bg_h)), max(scaled_h, round(scaled_w * bg_h / bg_w))
+    return scaled_w + scaled_w % 2, scaled_h + scaled_h % 2
+
+
+def load_planes(bg_path, width, height):
+    """Scaled background as ((Y, Cb, Cr) uint8 planes bytes, (iw, ih))."""
+    from PIL import Image
+
+    with Image.open(bg_path) as image:
+        size = prescaled_size(image.size, width, height)
+    # ffmpeg does the scale and RGB -> BT.601 conversion the zoompan path uses
+    data = tracing.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", bg_path,
+            "-vf", f"scale={size[0]}:{size[1]},format=yuv420p", "-frames:v", "1", "-f", "rawvideo", "pipe:1",
+        ],
+        check=True,
+        capture_output=True,
+    ).stdout
+    return data, size
+
+
+def _split_planes(buffer, width, height):
+    """(Y, Cb, Cr) uint8 views of a yuv420p frame buffer."""
+    import numpy as np
+
+    luma = width * height
+    chroma = luma // 4
+    flat = np.frombuffer(buffer, dtype=np.uint8, count=luma + 2 * chroma)
+    return (
+        flat[:luma].reshape(height, width),
+        flat[luma:luma + chroma].reshape(height // 2, width // 2),
+        flat[luma + chroma:].reshape(height // 2, width // 2),
+    )
+
+
+def trajectory(frames, size, motion=None, period_seconds=None):
+    """(zoom, x, y) float arrays for `frames` frames from motion["start_seconds"].
+
+    Linear motion follows zoompan_filter; with period_seconds, the periodic
+    motion of looping_zoompan_filter. x and y are the window's top-left corner
+    in the scaled background, clamped to the image as zoompan does.
+    """
+    import numpy as np
+
+    from scripts.video_render import MOTION_DEFAULTS
+
+    motion = {**MOTION_DEFAULTS, **(motion or {})}
+    iw, ih = size
+    start = int(motion["start_seconds"] * FPS)
+    if period_seconds:
+        phase = 2 * np.pi * (np.arange(frames) + start) / int(period_seconds * FPS)
+        ease = (1 - np.cos(phase)) / 2
+        zoom = 1 + (motion["zoom_max"] - 1) * ease
+        x = iw / 2 - iw / zoom / 2 + np.sin(phase) * motion["pan_x_amplitude"]
+        y = ih / 2 - ih / zoom / 2 + ease * motion["pan_y_rate"] * period_seconds / 100
+    else:
+        seconds = (np.arange(frames) + start) / FPS
+        zoom = np.minimum(1 + motion["zoom_rate"] * seconds, motion["zoom_max"])
+        x = iw / 2 - iw / zoom / 2 + np.sin(seconds / 100) * motion["pan_x_amplitude"]
+        y = ih / 2 - ih / zoom / 2 + seconds / 100 * motion["pan_y_rate"]
+    x = np.clip(x, 0, iw - iw / zoom)
+    y = np.clip(y, 0, ih - ih / zoom)
+    return zoom, x, y
+
+
+def _taps(start, span, count, limit):
+    """Bilinear source indices and weights for `count` samples over [start, start + span)."""
+    import numpy as np
+
+    position = start + (np.arange(count, dtype=np.float64) + 0.5) * (span / count) - 0.5
+    np.clip(position, 0, limit - 1, out=position)
+    first = position.astype(np.intp)
+    weight = (position - first).astype(np.float32)
+    return first, np.minimum(first + 1, limit - 1), weight
+
+
+def _resample(plane, x, y, span_w, span_h, out):
+    """Bilinear-sample the window (x, y, span_w, span_h) of plane into out."""
+    import numpy as np
+
+    height, width = out.shape
+    rows0, rows1, wy = _taps(y, span_h, height, plane.shape[0])
+    cols0, cols1, wx = _taps(x, span_w, width, plane.shape[1])
+    # Only the columns the window touches
+    lo, hi = cols0[0], cols1[-1] + 1
+    top = plane[rows0, lo:hi].astype(np.float32)
+    rows = plane[rows1, lo:hi].astype(np.float32)
+    rows -= top
+    rows *= wy[:, None]
+    rows += top
+    left = rows[:, cols0 - lo]
+    right = rows[:, cols1 - lo]
+    right -= left
+    right *= wx
+    right += left
+    right += 0.5
+    out[...] = right  # float -> uint8 truncates, i.e. rounds after the +0.5
+
+
+def render_frame(planes, size, zoom, x, y, out_planes):
+    """One frame: window (x, y, iw/zoom, ih/zoom) of the scaled background."""
+    iw, ih = size
+    span_w, span_h = iw / zoom, ih / zoom
+    _resample(planes[0], x, y, span_w, span_h, out_planes[0])
+    # Chroma planes are half size in both directions
+    for plane, out in zip(planes[1:], out_planes[1:]):
+        _resample(plane, x / 2, y / 2, span_w / 2, span_h / 2, out)
+
+
+def _init_worker(source_name, size, ring_name, width, height):
+    from multiprocessing import shared_memory
+
+    source = shared_memory.SharedMemory(name=source_name)
+    ring = shared_memory.SharedMemory(name=ring_name)
+    _worker.update(
+        source=source,
+        ring=ring,
+        planes=_split_planes(source.buf, *size),
+        size=size,
+        width=width,
+        height=height,
+        frame_bytes=width * height * 3 // 2,
+    )
+
+
+def _render_slot(slot, zoom, x, y):
+    frame_bytes = _worker["frame_bytes"]
+    buffer = _worker["ring"].buf[slot * frame_bytes:(slot + 1) * frame_bytes]
+    out = _split_planes(buffer, _worker["width"], _worker["height"])
+    render_frame(_worker["planes"], _worker["size"], zoom, x, y, out)
+    return slot
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+class MotionRenderer:
+    """yuv420p Ken Burns frames of one background, rendered by `workers` processes.
+
+    Use as a context manager; frames() yields memoryviews that stay valid until
+    the next frame is requested.
+    """
+
+    def __init__(self, bg_path, width, height, motion=None, workers=None):
+        if width % 2 or height % 2:
+            raise ValueError(f"Output size must be even for yuv420p: {width}x{height}")
+        self.width = width
+        self.height = height
+        self.motion = motion
+        self.workers = workers or default_workers()
+        self.frame_bytes = width * height * 3 // 2
+        self._data, self.size = load_planes(bg_path, width, height)
+        self._pool = None
+        self._shared = []
+
+    def __enter__(self):
+        if self.workers > 1:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            from multiprocessing import shared_memory
+
+            source = shared_memory.SharedMemory(create=True, size=len(self._data))
+            source.buf[:len(self._data)] = self._data
+            self.slots = 2 * self.workers + 2
+            ring = shared_memory.SharedMemory(create=True, size=self.slots * self.frame_bytes)
+            self._shared = [source, ring]
+            self._ring = ring
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(source.name, self.size, ring.name, self.width, self.height),
+            )
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        for shared in self._shared:
+            shared.close()
+            shared.unlink()
+        self._shared = []
+
+    def frames(self, count, period_seconds=None):
+        """Yield `count` frames of the linear (or, with period_seconds, periodic) motion."""
+        zoom, x, y = trajectory(count, self.size, self.motion, period_seconds)
+        if self._pool is None:
+            planes = _split_planes(self._data, *self.size)
+            buffer = bytearray(self.frame_bytes)
+            out = _split_planes(buffer, self.width, self.height)
+            view = memoryview(buffer)
+            for index in range(count):
+                render_frame(planes, self.size, zoom[index], x[index], y[index], out)
+                yield view
+            return
+
+        view = self._ring.buf
+        free = deque(range(self.slots))
+        pending = deque()
+        submitted = 0
+        while True:
+            # Keep every free slot busy, then hand out the oldest in order
+            while free and submitted < count:
+                slot = free.popleft()
+                args = (slot, float(zoom[submitted]), float(x[submitted]), float(y[submitted]))
+                pending.append(self._pool.submit(_render_slot, *args))
+                submitted += 1
+            if not pending:
+                return
+            slot = pending.popleft().result()
+            # Released before the slot is reused (and before the ring is unlinked)
+            with view[slot * self.frame_bytes:(slot + 1) * self.frame_bytes] as frame:
+                yield frame
+            free.append(slot)
+
+
+def raw_video_input(width, height, source="pipe:0"):
+    """ffmpeg input options for the frames written to `source`."""
+    return [
+        "-f", "rawvideo", "-pix_fmt", "yuv420p", "-s", f"{width}x{height}", "-framerate", str(FPS), "-i", source,
+    ]
+
+
+def frame_count(duration_seconds):
+    return math.ceil(duration_seconds * FPS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render Ken Burns motion with the NumPy engine")
+    parser.add_argument("bg", help="Background image")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: all CPUs)")
+    parser.add_argument("--start", type=float, default=0, help="Timeline offset (s) of the first frame")
+    parser.add_argument("--output", default="motion.mp4")
+    args = parser.parse_args()
+
+    import time
+
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        *raw_video_input(args.width, args.height),
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", args.output,
+    ]
+    start = time.perf_counter()
+    count = frame_count(args.seconds)
+    with MotionRenderer(args.bg, args.width, args.height, {"start_seconds": args.start}, args.workers) as renderer:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        for frame in renderer.frames(count):
+            process.stdin.write(frame)
+        process.stdin.close()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, command)
+    elapsed = time.perf_counter() - start
+    print(f"{count} frames in {elapsed:.1f}s ({count / elapsed:.1f} fps) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Fail-fast checks of tools, credentials and quotas before any paid or CPU-heavy stage.
+
+A missing encoder, a revoked YOUTUBE_REFRESH_TOKEN, a channel that cannot
+upload long videos or a wrong SHEETS_ID used to surface only when the run got
+there, an hour or more in. run_checks() probes them all at once, one thread
+per check, with cheap calls:
+
+- ffmpeg: version and the encoders this run needs (ffprobe is only reported;
+  the pipeline decodes without it)
+- youtube: refresh-token exchange, then the channel's long-upload status
+  (needs youtube.readonly; a token without it is reported "not verified")
+- drive: refresh-token exchange and DRIVE_FOLDER_ID metadata
+- sheets: service-account token and SHEETS_ID metadata
+- kieai: the credit endpoint (an invalid key or zero credits fail)
+
+ffmpeg, youtube and kieai failures raise PreflightError. Drive and Sheets
+only warn, because the pipeline already continues without them. A check that
+could not verify everything raises NotVerified: the run goes on with a
+warning and the check is not cached. Passed checks are cached in STATE_DIR/preflight.json for PREFLIGHT_TTL_SECONDS, keyed by a
+hash of what they checked, so a batch of channel runs probes each identity once.
+
+Usage:
+    PYTHONPATH=. python scripts/run_pipeline.py preflight [--no-cache]
+"""
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_NAME = "preflight.json"
+
+_cache_lock = threading.Lock()
+
+
+class PreflightError(RuntimeError):
+    pass
+
+
+class NotVerified(Exception):
+    """A check found nothing wrong but could not check everything it covers."""
+
+
+def check_ffmpeg(settings):
+    from scripts.archive_bundle import ffmpeg_version
+    from scripts.video_render import AUDIO_CODECS, RENDER_PROFILES
+
+    version = ffmpeg_version()
+    if version is None:
+        raise RuntimeError("ffmpeg not found on PATH")
+    output = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, check=True
+    ).stdout
+    # " V....D libx264   libx264 H.264 ..." after the legend
+    available = {line.split()[1] for line in output.splitlines() if line.startswith(" ") and len(line.split()) > 1}
+    profile = RENDER_PROFILES[settings["render_profile"]]
+    # Length variants use the same audio codec as the main render
+    needed = {"libx264", AUDIO_CODECS[settings["render_audio_codec"] or profile["audio_codec"]]}
+    if settings["suno_tracks"] > 1:
+        needed.add("flac")  # the chained loop unit
+    missing = sorted(needed - available)
+    if missing:
+        raise RuntimeError(f"{version}: missing encoder(s) {', '.join(missing)}")
+    ffprobe = "ffprobe found" if shutil.which("ffprobe") else "no ffprobe"
+    return f"{version.split(' Copyright')[0].strip()}, {', '.join(sorted(needed))}, {ffprobe}"
+
+
+def check_youtube(settings):
+    from google.auth.exceptions import RefreshError
+    from googleapiclient.errors import HttpError
+
+    from scripts.google_clients import oauth_credentials, oauth_service
+    from scripts.rate_limit import throttle
+    from scripts.upload_youtube import YOUTUBE_READ_SCOPES, YOUTUBE_SCOPES
+
+    identity = (settings["youtube_client_id"], settings["youtube_client_secret"], settings["youtube_refresh_token"])
+    # The token uploads use; a revoked one fails here
+    oauth_credentials(*identity, YOUTUBE_SCOPES, force_refresh=True)
+    try:
+        youtube = oauth_service("youtube", "v3", *identity, YOUTUBE_READ_SCOPES)
+        with throttle("youtube"):
+            response = youtube.channels().list(part="status", mine=True).execute()
+    except (RefreshError, HttpError) as exc:
+        # Tokens from before get_youtube_token.py asked for youtube.readonly
+        if isinstance(exc, RefreshError) or exc.resp.status == 403:
+            raise NotVerified(
+                "token refreshed, long-upload status not verified (the token lacks youtube.readonly; "
+                "run scripts/get_youtube_token.py again)"
+            ) from exc
+        raise
+    items = response.get("items") or []
+    if not items:
+        raise RuntimeError("No YouTube channel for YOUTUBE_REFRESH_TOKEN")
+    status = items[0].get("status", {}).get("longUploadsStatus")
+    if status in ("eligible", "disallowed"):
+        raise RuntimeError(
+            f"Channel {items[0]['id']} cannot upload 15+ minute videos (longUploadsStatus={status}); "
+            "verify it at https://www.youtube.com/verify"
+        )
+    return f"token refreshed, channel {items[0]['id']}, long uploads {status}"
+
+
+def check_drive(settings):
+    from scripts.google_clients import oauth_service
+    from scripts.rate_limit import throttle
+    from scripts.upload_drive import DRIVE_SCOPES
+
+    drive = oauth_service(
+        "drive", "v3",
+        settings["youtube_client_id"], settings["youtube_client_secret"], settings["google_refresh_token"],
+        DRIVE_SCOPES, force_refresh=True,
+    )
+    with throttle("drive"):
+        folder = drive.files().get(
+            fileId=settings["drive_folder_id"], fields="id,mimeType", supportsAllDrives=True
+        ).execute()
+    if folder.get("mimeType") != "application/vnd.google-apps.folder":
+        raise RuntimeError(f"DRIVE_FOLDER_ID {settings['drive_folder_id']} is not a folder")
+    return f"token refreshed, folder {folder['id']}"
+
+
+def check_sheets(settings):
+    from scripts.google_clients import service_account_service
+    from scripts.rate_limit import throttle
+    from scripts.update_sheet import SHEETS_SCOPES
+
+    sheets = service_account_service(
+        "sheets", "v4", settings["gcp_service_account"], SHEETS_SCOPES, force_refresh=True
+    )
+    with throttle("sheets"):
+        spreadsheet = sheets.spreadsheets().get(
+            spreadsheetId=settings["sheets_id"], fields="spreadsheetId"
+        ).execute()
+    return f"token refreshed, sheet {spreadsheet['spreadsheetId']}"
+
+
+def check_kieai(settings):
+    from scripts.kieai_client import KieAIClient
+
+    client = KieAIClient(
+        api_key=settings["kieai_api_key"],
+        api_base=settings["kieai_api_base"],
+        suno_endpoint=settings["kieai_suno_endpoint"],
+        nanobanana_endpoint=settings["kieai_nanobanana_endpoint"],
+    )
+    credits = client.credits()
+    if isinstance(credits, (int, float)) and credits <= 0:
+        raise RuntimeError("KieAI account has no credits left")
+    return f"key valid, {credits} credits"
+
+
+def planned_checks(settings):
+    """[(name, required, identity, fn)] for this run's settings.
+
+    identity covers everything the check's result depends on, so a changed
+    secret or ID is checked again instead of served from the cache.
+    """
+    from scripts.google_clients import api_endpoint
+
+    checks = [
+        (
+            "ffmpeg", True,
+            [shutil.which("ffmpeg"), settings["render_profile"], settings["render_audio_codec"],
+             settings["suno_tracks"] > 1],
+            check_ffmpeg,
+        ),
+        (
+            "youtube", True,
+            [api_endpoint(), settings["youtube_client_id"], settings["youtube_refresh_token"]],
+            check_youtube,
+        ),
+        ("kieai", True, [settings["kieai_api_base"], settings["kieai_api_key"]], check_kieai),
+    ]
+    if settings["google_refresh_token"] and settings["drive_folder_id"]:
+        checks.append((
+            "drive", False,
+            [api_endpoint(), settings["youtube_client_id"], settings["google_refresh_token"],
+             settings["drive_folder_id"]],
+            check_drive,
+        ))
+    if settings["gcp_service_account"] and settings["sheets_id"]:
+        checks.append((
+            "sheets", False,
+            [api_endpoint(), settings["gcp_service_account"].get("client_email"), settings["sheets_id"]],
+            check_sheets,
+        ))
+    return checks
+
+
+def _cache_path(settings):
+    return os.path.join(settings["state_dir"], CACHE_NAME)
+
+
+def _cache_key(name, identity):
+    raw = json.dumps([name, identity], default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _load_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_passed(path, passed):
+    """Merge passed checks into the cache file (atomic replace)."""
+    from scripts.utils import write_json_atomic
+
+    with _cache_lock:
+        cache = _load_cache(path)
+        cache.update(passed)
+        write_json_atomic(path, cache, indent=2)
+
+
+def run_checks(settings, use_cache=True):
+    """Run every planned check concurrently. Returns {name: result}.
+
+    A result is {"ok", "verified", "required", "detail", "cached"}. Raises PreflightError
+    listing every failed required check, after all checks have finished.
+    """
+    from scripts import tracing
+    from scripts.utils import call_with_deadline
+
+    ttl = settings["preflight_ttl_seconds"] if use_cache else 0
+    path = _cache_path(settings)
+    cache = _load_cache(path) if ttl else {}
+    now = time.time()
+    results = {}
+    pending = []
+    for name, required, identity, fn in planned_checks(settings):
+        key = _cache_key(name, identity)
+        entry = cache.get(key)
+        if entry and now - entry["checked_at"] < ttl:
+            results[name] = {"ok": True, "verified": True, "required": required, "detail": entry["detail"], "cached": True}
+        else:
+            pending.append((name, required, key, fn))
+
+    def _run(name, fn):
+        with tracing.span(f"preflight.{name}"):
+            # The deadline thread keeps this span as its parent
+            context = contextvars.copy_context()
+            return call_with_deadline(lambda: context.run(fn, settings), settings["preflight_timeout_seconds"])
+
+    passed = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="preflight") as pool:
+            futures = [
+                (name, required, key, pool.submit(contextvars.copy_context().run, _run, name, fn))
+                for name, required, key, fn in pending
+            ]
+            for name, required, key, future in futures:
+                try:
+                    detail = future.result()
+                except NotVerified as exc:
+                    results[name] = {
+                        "ok": True, "verified": False, "required": required, "detail": str(exc), "cached": False,
+                    }
+                    continue
+                except Exception as exc:
+                    detail = f"{type(exc).__name__}: {exc}"
+                    results[name] = {
+                        "ok": False, "verified": False, "required": required, "detail": detail, "cached": False,
+                    }
+                    continue
+                results[name] = {"ok": True, "verified": True, "required": required, "detail": detail, "cached": False}
+                passed[key] = {"name": name, "detail": detail, "checked_at": now}
+    if passed and settings["preflight_ttl_seconds"]:
+        _save_passed(path, passed)
+
+    fatal = []
+    for name, result in results.items():
+        if result["ok"]:
+            if not result["verified"]:
+                print(f"Warning: preflight {name} not verified: {result['detail']}")
+            continue
+        if result["required"]:
+            fatal.append(f"{name}: {result['detail']}")
+        else:
+            print(f"Warning: preflight {name} failed (optional stage; the run continues): {result['detail']}")
+    if fatal:
+        raise PreflightError("Preflight failed:\n  " + "\n  ".join(fatal))
+    tracing.count("preflight_cached", sum(result["cached"] for result in results.values()))
+    return results
+
+
+def describe_checks(results):
+    return ", ".join(
+        f"{name} {('ok' if result['verified'] else 'not verified') if result['ok'] else 'FAILED'}"
+        f"{' (cached)' if result['cached'] else ''}"
+        for name, result in results.items()
+    )
@@ -0,0 +1,259 @@
+"""Parameter sweep previews for the audio loop and zoompan motion.
+
+Instead of a full 90-minute render per setting, each audio combination renders
+only the loop seam (±20 s around it) and the fade-out tail, and each motion
+combination renders a 30 s video slice. Jobs run in a process pool and an
+index.html / index.json lists every preview with its timing.
+
+The source is decoded once into the PCM cache, so workers slice the memory-mapped
+samples instead of re-decoding the clip.
+
+Usage:
+    PYTHONPATH=. python scripts/preview_sweep.py audio_raw.mp3 bg.png \\
+        --lowpass 3000 4000 6000 --crossfade 8 12 --zoom-rate 0.0003 0.0006
+    PYTHONPATH=. python scripts/preview_sweep.py audio_raw.mp3 bg.png --grid grid.json
+"""
+import argparse
+import html
+import itertools
+import json
+import os
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+SEAM_CONTEXT_SECONDS = 20
+VIDEO_SLICE_SECONDS = 30
+
+AUDIO_AXES = ("lowpass_hz", "crossfade_seconds", "fadeout_seconds")
+MOTION_AXES = ("zoom_rate", "zoom_max", "pan_x_amplitude", "pan_y_rate", "start_seconds")
+
+
+def expand_grid(grid, axes):
+    """Cartesian product of the given axes as a list of dicts."""
+    values = [grid[axis] for axis in axes]
+    return [dict(zip(axes, combo)) for combo in itertools.product(*values)]
+
+
+def combo_label(params):
+    return "_".join(f"{key}-{value}" for key, value in params.items())
+
+
+def _render_audio_preview(source_path, cache_dir, params, output_dir):
+    """Seam and fade-out previews for one audio combination."""
+    from scripts.audio_cache import load_decoded
+
+    start = time.perf_counter()
+    source = load_decoded(source_path, cache_dir)
+    crossfade_ms = params["crossfade_seconds"] * 1000
+    context = SEAM_CONTEXT_SECONDS + params["crossfade_seconds"]
+    duration = source.duration_seconds
+
+    # The loop seam is the end of the clip crossfaded into its start; only
+    # the samples around it are filtered and joined.
+    tail = source.to_audio_segment(max(duration - context, 0)).low_pass_filter(params["lowpass_hz"])
+    head = source.to_audio_segment(0, context).low_pass_filter(params["lowpass_hz"])
+    seam = tail.append(head, crossfade=crossfade_ms)
+
+    fade_length = max(SEAM_CONTEXT_SECONDS, params["fadeout_seconds"] + 5)
+    ending = source.to_audio_segment(max(duration - fade_length, 0)).low_pass_filter(params["lowpass_hz"])
+    ending = ending.fade_out(params["fadeout_seconds"] * 1000)
+
+    label = combo_label(params)
+    seam_path = os.path.join(output_dir, f"seam_{label}.wav")
+    fade_path = os.path.join(output_dir, f"fade_{label}.wav")
+    seam.export(seam_path, format="wav")
+    ending.export(fade_path, format="wav")
+    return {
+        "kind": "audio",
+        "params": params,
+        "seam": os.path.basename(seam_path),
+        "seam_at_seconds": round((len(tail) - crossfade_ms / 2) / 1000, 2),
+        "fade": os.path.basename(fade_path),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def _render_motion_preview(bg_path, slice_path, params, output_dir, width, height, profile):
+    """30 s video slice for one zoompan combination."""
+    from scripts.video_render import render_video
+
+    start = time.perf_counter()
+    output_path = os.path.join(output_dir, f"motion_{combo_label(params)}.mp4")
+    render_video(
+        bg_path,
+        slice_path,
+        output_path,
+        width=width,
+        height=height,
+        profile=profile,
+        duration_seconds=VIDEO_SLICE_SECONDS,
+        motion=params,
+    )
+    return {
+        "kind": "motion",
+        "params": params,
+        "video": os.path.basename(output_path),
+        "bytes": os.path.getsize(output_path),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def write_audio_slice(source, path, seconds=VIDEO_SLICE_SECONDS):
+    """Unfiltered slice of the cached source used as the motion previews' soundtrack."""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(source.channels)
+        f.setsampwidth(source.samples.dtype.itemsize)
+        f.setframerate(source.sample_rate)
+        f.writeframes(source.view(0, seconds).tobytes())
+    return path
+
+
+def write_index(output_dir, results, total_seconds):
+    index = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "total_seconds": round(total_seconds, 3),
+        "audio": [r for r in results if r["kind"] == "audio"],
+        "motion": [r for r in results if r["kind"] == "motion"],
+    }
+    with open(os.path.join(output_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+    def params_cell(params):
+        return html.escape(", ".join(f"{key}={value}" for key, value in params.items()))
+
+    rows = [
+        "<!doctype html><meta charset='utf-8'><title>SleepMusic preview sweep</title>",
+        f"<h1>Preview sweep</h1><p>{len(results)} previews in {total_seconds:.1f}s</p>",
+        "<h2>Audio</h2><table border='1' cellpadding='4'>",
+        "<tr><th>Parameters</th><th>Loop seam</th><th>Fade-out</th><th>Seconds</th></tr>",
+    ]
+    for r in index["audio"]:
+        rows.append(
+            f"<tr><td>{params_cell(r['params'])}<br>seam at {r['seam_at_seconds']}s</td>"
+            f"<td><audio controls preload='none' src='{html.escape(r['seam'])}'></audio></td>"
+            f"<td><audio controls preload='none' src='{html.escape(r['fade'])}'></audio></td>"
+            f"<td>{r['seconds']}</td></tr>"
+        )
+    rows.append("</table><h2>Motion</h2><table border='1' cellpadding='4'>")
+    rows.append("<tr><th>Parameters</th><th>Preview</th><th>Seconds</th></tr>")
+    for r in index["motion"]:
+        rows.append(
+            f"<tr><td>{params_cell(r['params'])}</td>"
+            f"<td><video controls preload='none' width='480' src='{html.escape(r['video'])}'></video></td>"
+            f"<td>{r['seconds']}</td></tr>"
+        )
+    rows.append("</table>")
+    path = os.path.join(output_dir, "index.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(rows))
+    return path
+
+
+def run_sweep(source_path, bg_path, grid, output_dir, cache_dir, workers=None,
+              width=960, height=540, profile="default"):
+    """Render all previews in a process pool. Returns the index.html path."""
+    from scripts.audio_cache import load_decoded
+
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    # Decode once up front so every worker hits the cache
+    source = load_decoded(source_path, cache_dir)
+    slice_path = write_audio_slice(source, os.path.join(output_dir, "slice.wav"))
+
+    audio_combos = expand_grid(grid, AUDIO_AXES)
+    motion_combos = expand_grid(grid, MOTION_AXES)
+    print(f"Rendering {len(audio_combos)} audio and {len(motion_combos)} motion previews")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_render_audio_preview, source_path, cache_dir, params, output_dir)
+            for params in audio_combos
+        ] + [
+            pool.submit(_render_motion_preview, bg_path, slice_path, params, output_dir, width, height, profile)
+            for params in motion_combos
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            print(f"  {result['kind']:6} {combo_label(result['params'])}: {result['seconds']:.1f}s")
+            results.append(result)
+
+    order = {"audio": 0, "motion": 1}
+    results.sort(key=lambda r: (order[r["kind"]], combo_label(r["params"])))
+    return write_index(output_dir, results, time.perf_counter() - start)
+
+
+def default_grid(settings):
+    from scripts.video_render import MOTION_DEFAULTS
+
+    grid = {
+        "lowpass_hz": [settings["lowpass_hz"]],
+        "crossfade_seconds": [settings["crossfade_seconds"]],
+        "fadeout_seconds": [settings["fadeout_seconds"]],
+    }
+    grid.update({axis: [MOTION_DEFAULTS[axis]] for axis in MOTION_AXES})
+    return grid
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from scripts.config import load_settings
+
+    parser = argparse.ArgumentParser(description="Render short previews over a parameter grid")
+    parser.add_argument("audio", help="Raw Suno audio file")
+    parser.add_argument("bg", help="Background image")
+    parser.add_argument("--grid", help="JSON file mapping parameter names to lists of values")
+    parser.add_argument("--lowpass", dest="lowpass_hz", type=int, nargs="+")
+    parser.add_argument("--crossfade", dest="crossfade_seconds", type=int, nargs="+")
+    parser.add_argument("--fadeout", dest="fadeout_seconds", type=int, nargs="+")
+    parser.add_argument("--zoom-rate", dest="zoom_rate", type=float, nargs="+")
+    parser.add_argument("--zoom-max", dest="zoom_max", type=float, nargs="+")
+    parser.add_argument("--pan-x", dest="pan_x_amplitude", type=float, nargs="+")
+    parser.add_argument("--pan-y", dest="pan_y_rate", type=float, nargs="+")
+    parser.add_argument(
+        "--video-start", dest="start_seconds", type=float, nargs="+",
+        help="Timeline offsets (s) at which to preview the motion, e.g. 0 2700 5400",
+    )
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument("--width", type=int, default=960)
+    parser.add_argument("--height", type=int, default=540)
+    parser.add_argument("--profile", default=None, help="Render profile (default: RENDER_PROFILE)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    settings = load_settings(strict=False)
+
+    grid = default_grid(settings)
+    if args.grid:
+        with open(args.grid, "r", encoding="utf-8") as f:
+            for key, values in json.load(f).items():
+                if key not in grid:
+                    raise SystemExit(f"Unknown grid parameter: {key}")
+                grid[key] = values if isinstance(values, list) else [values]
+    for key in grid:
+        if getattr(args, key) is not None:
+            grid[key] = getattr(args, key)
+
+    output_dir = args.output_dir or os.path.join(
+        "output", "preview_" + datetime.now().strftime("%Y%m%d_%H%M%S")
+    )
+    index_path = run_sweep(
+        args.audio,
+        args.bg,
+        grid,
+        output_dir,
+        settings["audio_cache_dir"],
+        workers=args.workers,
+        width=args.width,
+        height=args.height,
+        profile=args.profile or settings["render_profile"],
+    )
+    print(f"Preview index: {index_path}")
+
+
+if __name__ == "__main__":
+    main()
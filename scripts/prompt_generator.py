@@ -1,71 +1,111 @@
-def generate_image_variations(api_key, model, season_jp, season_en, mood_jp, mood_en):
+import time
+
+from scripts.rate_limit import throttle
+from scripts.utils import call_with_deadline
+
+FALLBACK_VARIATIONS = ("星空の夜、starry night", "美しい夜空、beautiful night sky")
+
+
+class GeminiUnavailable(RuntimeError):
+    """Gemini was skipped (open circuit breaker) or failed within the deadline."""
+
+
+def _generate_text(api_key, model, prompt, timeout=30, breaker=None):
+    """Send a prompt to Gemini and return (text, provider).
+
+    Both SDK attempts share one deadline of `timeout` seconds, so an outage
+    costs at most `timeout` instead of two full failure latencies. With a
+    breaker, repeated failures make later runs skip Gemini for a cooldown.
+    """
+    if breaker and not breaker.allow():
+        raise GeminiUnavailable("circuit breaker open, skipping Gemini")
+
+    # The deadline starts once the rate limiter lets the call through
+    with throttle("gemini"):
+        return _generate_text_now(api_key, model, prompt, timeout, breaker)
+
+
+def _generate_text_now(api_key, model, prompt, timeout, breaker):
+    deadline = time.monotonic() + timeout
+
+    def _new_sdk():
+        from google import genai
+        client = genai.Client(api_key=api_key)
+        response = client.models.generate_content(model=model, contents=prompt)
+        return response.text
+
+    def _old_sdk():
+        import google.generativeai as genai_old
+        genai_old.configure(api_key=api_key)
+        llm = genai_old.GenerativeModel(model)
+        response = llm.generate_content(prompt)
+        return response.text
+
+    last_exc = None
+    # Try new google-genai package first, then old google.generativeai package
+    for provider, call in (("google-genai", _new_sdk), ("google-generativeai", _old_sdk)):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            text = call_with_deadline(call, remaining)
+        except Exception as e:
+            print(f"Note: Gemini via {provider} failed ({e})")
+            last_exc = e
+            continue
+        if breaker:
+            breaker.record_success()
+        return text, provider
+
+    if breaker:
+        breaker.record_failure()
+    raise GeminiUnavailable(f"Gemini failed within {timeout}s deadline: {last_exc}")
+
+
+def _parse_lines(text):
+    lines = []
+    for line in text.strip().split('\n'):
+        # Drop list markers the model sometimes adds ("1. ", "- ")
+        line = line.strip().lstrip("-*・").strip()
+        head, sep, rest = line.partition(". ")
+        if sep and head.isdigit():
+            line = rest.strip()
+        if line:
+            lines.append(line)
+    return lines
+
+
+def generate_variation_batch(
+    api_key, model, season_jp, season_en, mood_jp, mood_en, count, avoid=(), timeout=30, breaker=None
+):
     """
-    Generate unique image prompt variations using Gemini AI.
+    Generate many variation phrases for one season × mood pair in a single call.
 
     Returns:
-        tuple: (bg_variation, thumb_variation) - Two different variation phrases
+        tuple: (variations, provider) - variations may be fewer than count.
+        Raises GeminiUnavailable on failure or open breaker.
     """
-    if not api_key:
-        # Fallback: return simple variations if no API key
-        return "星空の夜、starry night", "美しい夜空、beautiful night sky"
+    avoid_block = ""
+    if avoid:
+        avoid_lines = "\n".join(f"- {text}" for text in list(avoid)[-30:])
+        avoid_block = f"\n以下と似た内容は避けること:\n{avoid_lines}\n"
 
     prompt = f"""あなたは睡眠用BGM動画の画像プロンプト生成AIです。
 
 季節: {season_jp} / {season_en}
 ムード: {mood_jp} / {mood_en}
 
-上記の季節とムードに合った、星空をベースにした睡眠導入用の画像バリエーション要素を2つ生成してください。
+上記の季節とムードに合った、星空をベースにした睡眠導入用の画像バリエーション要素を{count}個生成してください。
 
 要件:
 - 各バリエーションは日本語と英語を含む短いフレーズ（10-15単語程度）
 - 星空の風景に追加する具体的な視覚要素を記述（例: 流れ星、霧、山、湖など）
-- 2つのバリエーションは互いに異なる要素を含むこと
+- すべてのバリエーションは互いに異なる要素を含むこと
 - 睡眠導入に適した静かで落ち着いた雰囲気
 - 季節感を反映した要素を含める
+{avoid_block}
+出力形式（{count}行のみ、番号や説明なし）:
+バリエーションの日本語、バリエーションの英語"""
 
-出力形式（この2行のみ、説明なし）:
-バリエーション1の日本語、バリエーション1の英語
-バリエーション2の日本語、バリエーション2の英語"""
-
-    # Try new google-genai package first
-    try:
-        from google import genai
-        client = genai.Client(api_key=api_key)
-
-        # Use gemini-2.0-flash-exp for new API
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=prompt
-        )
-
-        lines = response.text.strip().split('\n')
-        if len(lines) >= 2:
-            bg_variation = lines[0].strip()
-            thumb_variation = lines[1].strip()
-            return bg_variation, thumb_variation
-        else:
-            return "星空の夜、starry night", "美しい夜空、beautiful night sky"
-
-    except Exception as e:
-        print(f"Note: New Gemini API failed ({e}), trying old API...")
-
-        # Fallback to old google.generativeai package
-        try:
-            import google.generativeai as genai_old
-            genai_old.configure(api_key=api_key)
-
-            # Use gemini-1.5-flash for old API
-            llm = genai_old.GenerativeModel("gemini-1.5-flash")
-            response = llm.generate_content(prompt)
-
-            lines = response.text.strip().split('\n')
-            if len(lines) >= 2:
-                bg_variation = lines[0].strip()
-                thumb_variation = lines[1].strip()
-                return bg_variation, thumb_variation
-            else:
-                return "星空の夜、starry night", "美しい夜空、beautiful night sky"
-
-        except Exception as e2:
-            print(f"Warning: Gemini API failed ({e2}), using fallback variations")
-            return "星空の夜、starry night", "美しい夜空、beautiful night sky"
+    text, provider = _generate_text(api_key, model, prompt, timeout=timeout, breaker=breaker)
+    return _parse_lines(text), provider
@@ -0,0 +1,240 @@
+"""Token-bucket rate limits and in-flight caps for external APIs.
+
+Each upstream ("kieai.submit", "kieai.poll", "gemini", "youtube.upload",
+"youtube", "drive", "sheets") has a token bucket (`rate` calls per second,
+bursts of up to `burst`) and a cap on concurrent calls (`concurrency`):
+
+    with throttle("kieai.poll"):
+        response = requests.get(...)
+
+By default the limits are per process. With RATE_LIMIT_SHARED=1 the buckets
+live in lock-protected files under STATE_DIR/rate_limits and the in-flight
+slots are file locks, so concurrent runs on one machine share one budget.
+
+Time spent waiting is added to the current tracing span as the
+`throttle_wait_s` counter (and totalled per upstream in wait_totals()), so
+quota-bound stages show up in trace.json and the run summary.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: shared mode falls back to per-process limits
+    fcntl = None
+
+from scripts import tracing
+
+# rate: calls/second refilled, burst: bucket size, concurrency: max in flight
+DEFAULT_LIMITS = {
+    "kieai.submit": {"rate": 0.5, "burst": 2, "concurrency": 2},
+    "kieai.poll": {"rate": 1.0, "burst": 4, "concurrency": 4},
+    "gemini": {"rate": 0.25, "burst": 2, "concurrency": 1},  # 15 RPM free tier
+    "youtube.upload": {"rate": 1 / 60, "burst": 2, "concurrency": 1},
+    "youtube": {"rate": 1.0, "burst": 5, "concurrency": 2},
+    "drive": {"rate": 2.0, "burst": 5, "concurrency": 2},
+    "sheets": {"rate": 1.0, "burst": 5, "concurrency": 1},  # 60 requests/min/user
+}
+POLL_SECONDS = 0.05  # sleep between attempts to grab a shared slot
+
+_limiters = {}
+_config = {"limits": DEFAULT_LIMITS, "lock_dir": None}
+_registry_lock = threading.Lock()
+_wait_totals = {}
+
+
+class TokenBucket:
+    """Thread-safe bucket held in this process."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        """Take one token; returns seconds to wait before it may be used."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def defer(self, seconds):
+        """Empty the bucket for `seconds` (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class SharedTokenBucket:
+    """Bucket state in a JSON file guarded by flock, shared across processes.
+
+    Wall-clock time is used because monotonic clocks are per process.
+    """
+
+    def __init__(self, path, rate, burst):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        with self._lock, open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except json.JSONDecodeError:
+                    state = {}
+                now = time.time()
+                tokens = state.get("tokens", float(self.burst))
+                updated = state.get("updated", now)
+                state["tokens"] = min(self.burst, tokens + max(now - updated, 0) * self.rate)
+                state["updated"] = now
+                yield state
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def reserve(self):
+        with self._state() as state:
+            state["tokens"] -= 1
+            return -state["tokens"] / self.rate if state["tokens"] < 0 else 0.0
+
+    def defer(self, seconds):
+        with self._state() as state:
+            state["tokens"] = min(state["tokens"], -seconds * self.rate)
+
+
+class SharedSlots:
+    """`count` in-flight slots as flock'd files, shared across processes."""
+
+    def __init__(self, prefix, count):
+        self.paths = [f"{prefix}.slot{index}" for index in range(count)]
+
+    def acquire(self):
+        while True:
+            for path in self.paths:
+                f = open(path, "a", encoding="utf-8")
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return f
+                except OSError:
+                    f.close()
+            time.sleep(POLL_SECONDS)
+
+    def release(self, handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+
+class Limiter:
+    def __init__(self, name, rate, burst, concurrency, lock_dir=None):
+        self.name = name
+        if lock_dir and fcntl is not None:
+            os.makedirs(lock_dir, exist_ok=True)
+            prefix = os.path.join(lock_dir, name)
+            self.bucket = SharedTokenBucket(f"{prefix}.bucket", rate, burst)
+            self.slots = SharedSlots(prefix, concurrency)
+        else:
+            self.bucket = TokenBucket(rate, burst)
+            self.slots = None
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+
+    @contextmanager
+    def acquire(self):
+        start = time.monotonic()
+        # Threads queue on the local semaphore first, so each process only
+        # polls for as many shared slots as it has callers
+        self._semaphore.acquire()
+        try:
+            handle = self.slots.acquire() if self.slots else None
+            try:
+                delay = self.bucket.reserve()
+                if delay:
+                    time.sleep(delay)
+                _record_wait(self.name, time.monotonic() - start)
+                yield
+            finally:
+                if handle is not None:
+                    self.slots.release(handle)
+        finally:
+            self._semaphore.release()
+
+    def defer(self, seconds):
+        self.bucket.defer(seconds)
+
+
+def _record_wait(name, waited):
+    with _registry_lock:
+        _wait_totals[name] = _wait_totals.get(name, 0.0) + waited
+    if waited >= 0.01:
+        tracing.count("throttle_wait_s", round(waited, 3))
+        tracing.count("throttled")
+
+
+def configure(limits=None, lock_dir=None):
+    """Set per-upstream limits (merged over DEFAULT_LIMITS) and, for limits shared
+    across processes, the lock directory. Drops existing limiters."""
+    merged = {name: dict(values) for name, values in DEFAULT_LIMITS.items()}
+    for name, values in (limits or {}).items():
+        merged.setdefault(name, {"rate": 1.0, "burst": 1, "concurrency": 1}).update(values)
+    with _registry_lock:
+        _config["limits"] = merged
+        _config["lock_dir"] = lock_dir
+        _limiters.clear()
+
+
+def configure_from_settings(settings):
+    lock_dir = os.path.join(settings["state_dir"], "rate_limits") if settings["rate_limit_shared"] else None
+    configure(settings["rate_limits"], lock_dir)
+
+
+def limiter(name):
+    with _registry_lock:
+        current = _limiters.get(name)
+        if current is None:
+            values = _config["limits"].get(name)
+            if values is None:
+                raise KeyError(f"Unknown rate limit: {name} (choose from {', '.join(_config['limits'])})")
+            current = Limiter(
+                name, values["rate"], values["burst"], values["concurrency"], lock_dir=_config["lock_dir"]
+            )
+            _limiters[name] = current
+        return current
+
+
+@contextmanager
+def throttle(name):
+    """Wait for a token and a free slot of upstream `name`; hold the slot inside."""
+    if name is None:
+        yield
+        return
+    with limiter(name).acquire():
+        yield
+
+
+def defer(name, seconds):
+    """Hold back upstream `name` for `seconds` (server asked us to slow down)."""
+    if name is not None:
+        limiter(name).defer(seconds)
+
+
+def wait_totals():
+    """{upstream: seconds spent waiting} in this process."""
+    with _registry_lock:
+        return {name: round(value, 3) for name, value in _wait_totals.items()}
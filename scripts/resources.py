@@ -0,0 +1,371 @@
+"""Preflight disk/RAM estimates and output retention.
+
+Before any paid call, plan_run() estimates the run's peak disk and memory from
+the target length, sample rate, render profile and length variants, and picks
+how the soundtrack is produced:
+
+- "memory": pydub builds the whole loop in RAM (~3x the WAV size), then writes
+  audio_90m.wav
+- "streaming": the same bytes written block by block (RAM ~ the source clip)
+- "pipe": no audio_90m.wav at all; blocks are piped into the ffmpeg render and
+  QC analyzes them on the way (QC then fails after render, still before upload)
+
+It raises ResourceError when even the leanest mode cannot fit, so a run never
+dies partway through a render with a full disk.
+
+Retention deletes intermediates as soon as the stage consuming them finishes
+and prunes old output/YYYYMMDD run directories by age and total size.
+
+When several channels run in one process, plan_run() reserves the run's
+estimated peak disk in a process-wide ledger until release_disk() at the end
+of the run (video.mp4 stays on disk through the uploads). Later plans subtract
+what other runs have reserved but not yet written to their output directories
+from the free space. Memory is not reserved: cpu_slot() admits only CPU_JOBS
+audio/render stages at a time, so with the default of one, only one run's
+memory peak is live at once, which is what the per-run estimate assumes.
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+SAMPLE_RATE = 44100  # Suno MP3s
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+SOURCE_SECONDS = 240  # Suno clips run ~2-4 minutes
+ASSET_BYTES = 50 * 2**20  # bg.png, thumbnail, bundle.zip, qc.json, trace.json
+SCENE_IMAGE_BYTES = 10 * 2**20  # bg_2.png, ...
+BASE_RSS_BYTES = 120 * 2**20  # interpreter, numpy, pydub
+# Measured: in-memory looping peaks at ~3x the output WAV (append copies,
+# slice, fade_out, export)
+IN_MEMORY_AUDIO_FACTOR = 3.0
+# Streaming keeps the decoded source, its low-passed copy and a few blocks
+STREAMING_SOURCE_FACTOR = 3.0
+# ffmpeg zoompan + libx264 at 1920x1080: measured ~1.2 GB (default) and
+# ~1.3 GB (compact, longer lookahead)
+RENDER_RSS_BYTES = 1400 * 2**20
+AUDIO_MODES = ("memory", "streaming", "pipe")
+RUN_DIR_PATTERN = re.compile(r"\d{8}")
+
+
+_cpu_slots = threading.BoundedSemaphore(1)
+# Disk reserved by planned runs that have not finished: {output_dir: bytes}
+_disk_reservations = {}
+_disk_lock = threading.Lock()
+
+
+class ResourceError(RuntimeError):
+    pass
+
+
+def set_cpu_jobs(count):
+    """Number of cpu_slot() holders allowed at once (call before runs start)."""
+    global _cpu_slots
+    _cpu_slots = threading.BoundedSemaphore(max(count, 1))
+
+
+@contextmanager
+def cpu_slot():
+    """Hold one of the CPU_JOBS slots; time queued is the `cpu_wait_s` counter."""
+    from scripts import tracing
+
+    slots = _cpu_slots
+    start = time.monotonic()
+    with slots:
+        waited = time.monotonic() - start
+        if waited >= 0.01:
+            tracing.count("cpu_wait_s", round(waited, 3))
+        yield
+
+
+def _pcm_bytes(seconds):
+    return int(seconds * SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH)
+
+
+def _bitrates(settings):
+    """(video kbps, audio kbps) expected for the main render and the length variants."""
+    from scripts.video_render import RENDER_PROFILES, resolve_audio, resolve_video_kbps
+
+    profile_name = settings["render_profile"]
+    _, audio_kbps = resolve_audio(profile_name, settings["render_audio_codec"], settings["render_audio_kbps"])
+    profile = RENDER_PROFILES[profile_name]
+    seconds = (settings["target_minutes"] + settings["target_variance_minutes"]) * 60
+    if profile_name != "default" or settings["render_target_kbps"] or settings["render_target_mb"]:
+        video_kbps = resolve_video_kbps(
+            profile, settings["render_target_kbps"], settings["render_target_mb"], seconds, audio_kbps
+        )
+        return video_kbps, audio_kbps
+    # x264 CRF output has no fixed rate; use the measured default-profile bitrate
+    return settings["render_baseline_kbps"] - audio_kbps, audio_kbps
+
+
+def estimate_run(settings):
+    """Peak disk and RAM (bytes) of one run for each audio mode."""
+    seconds = (settings["target_minutes"] + settings["target_variance_minutes"]) * 60
+    wav = _pcm_bytes(seconds)
+    # The chained unit (track_chain) is about as long as all tracks together
+    tracks = max(settings["suno_tracks"], 1)
+    source = _pcm_bytes(SOURCE_SECONDS * tracks)
+    video_kbps, audio_kbps = _bitrates(settings)
+    video = int((video_kbps + audio_kbps) * 1000 / 8 * seconds)
+
+    variants = 0
+    segment = 0
+    if settings["length_variants"]:
+        variants = sum(
+            int((video_kbps + audio_kbps) * 1000 / 8 * minutes * 60)
+            for minutes in settings["length_variants"]
+        )
+        segment = int(video_kbps * 1000 / 8 * settings["variant_motion_seconds"])
+    # Scene sequences (scripts/scenes.py): extra backgrounds, plus one loop
+    # per scene and one transition per cut until the final mux
+    scene_images = scene_segments = 0
+    if settings["scenes"] > 1:
+        scene_images = (settings["scenes"] - 1) * SCENE_IMAGE_BYTES
+        scene_seconds = (
+            settings["scenes"] * settings["scene_loop_seconds"]
+            + (settings["scenes"] - 1) * settings["scene_transition_seconds"]
+        )
+        scene_segments = int(video_kbps * 1000 / 8 * scene_seconds)
+
+    # Raw downloads (worst case uncompressed WAVs) + decoded cache + assets;
+    # chaining adds the FLAC unit and its decoded copy
+    fixed = (2 if tracks == 1 else 4) * source + ASSET_BYTES
+    keep = settings["keep_intermediates"]
+    disk = {}
+    for mode in AUDIO_MODES:
+        audio_file = 0 if mode == "pipe" else wav
+        during_render = fixed + scene_images + audio_file + video + scene_segments
+        during_variants = fixed + scene_images + (audio_file if keep else 0) + video + segment + variants
+        disk[mode] = max(during_render, during_variants)
+
+    render_rss = RENDER_RSS_BYTES
+    streaming_rss = BASE_RSS_BYTES + int(STREAMING_SOURCE_FACTOR * source)
+    memory = {
+        # Audio runs before the render, so only the larger of the two counts
+        "memory": max(BASE_RSS_BYTES + int(IN_MEMORY_AUDIO_FACTOR * wav), BASE_RSS_BYTES + render_rss),
+        "streaming": max(streaming_rss, BASE_RSS_BYTES + render_rss),
+        # Audio generation and ffmpeg run side by side
+        "pipe": streaming_rss + render_rss,
+    }
+    return {
+        "seconds": seconds,
+        "wav_bytes": wav,
+        "video_bytes": video,
+        "variants_bytes": variants + segment,
+        "disk": disk,
+        "memory": memory,
+    }
+
+
+def available_memory():
+    """MemAvailable in bytes, or None when it cannot be determined."""
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def free_disk(path):
+    """Free bytes on the filesystem that holds `path` (or its nearest existing parent)."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def _gb(value):
+    return f"{value / 1e9:.1f} GB"
+
+
+def _reserved_disk(exclude=None):
+    """Bytes other planned runs may still write (reservation minus what their
+    output directories already hold). Call with _disk_lock held."""
+    return sum(
+        max(reserved - _tree_bytes(output_dir), 0)
+        for output_dir, reserved in _disk_reservations.items()
+        if output_dir != exclude
+    )
+
+
+def plan_run(settings, output_root="output", output_dir=None):
+    """Pick the audio mode for this run, or raise ResourceError if nothing fits.
+
+    settings["audio_mode"] "auto" prefers memory > streaming > pipe; a fixed
+    mode is only checked. With output_dir, the chosen mode's disk estimate is
+    reserved for the run until release_disk(output_dir).
+    """
+    estimate = estimate_run(settings)
+    headroom = 1 + settings["preflight_headroom"]
+    memory_free = available_memory()
+    requested = settings["audio_mode"]
+    if requested != "auto" and requested not in AUDIO_MODES:
+        raise ValueError(f"Unknown AUDIO_MODE: {requested} (choose auto or {', '.join(AUDIO_MODES)})")
+    candidates = AUDIO_MODES if requested == "auto" else (requested,)
+
+    # Checked and reserved in one step, so concurrent plans cannot both fit
+    with _disk_lock:
+        reserved = _reserved_disk(exclude=output_dir and os.path.abspath(output_dir))
+        disk_free = free_disk(output_root) - reserved
+
+        def fits(mode):
+            if estimate["disk"][mode] * headroom > disk_free:
+                return False
+            return memory_free is None or estimate["memory"][mode] * headroom <= memory_free
+
+        mode = next((m for m in candidates if fits(m)), None)
+        if mode is not None and output_dir:
+            _disk_reservations[os.path.abspath(output_dir)] = int(estimate["disk"][mode] * headroom)
+    if mode is None:
+        lean = candidates[-1]
+        raise ResourceError(
+            f"Run does not fit: '{lean}' mode needs ~{_gb(estimate['disk'][lean] * headroom)} disk "
+            f"({_gb(disk_free)} free{f' after {_gb(reserved)} reserved by other runs' if reserved else ''}) "
+            f"and ~{_gb(estimate['memory'][lean] * headroom)} RAM "
+            f"({_gb(memory_free) if memory_free is not None else 'unknown'} available) for "
+            f"{estimate['seconds'] / 60:.0f} min; free space (RETENTION_DAYS / RETENTION_MAX_GB) "
+            "or lower TARGET_MINUTES / LENGTH_VARIANTS"
+        )
+    return {
+        "audio_mode": mode,
+        "disk_free": disk_free,
+        "disk_reserved": reserved,
+        "memory_available": memory_free,
+        "estimate": estimate,
+    }
+
+
+def release_disk(output_dir):
+    """Drop the disk reservation plan_run() made for output_dir (the run ended)."""
+    with _disk_lock:
+        _disk_reservations.pop(os.path.abspath(output_dir), None)
+
+
+def describe_plan(plan):
+    estimate = plan["estimate"]
+    mode = plan["audio_mode"]
+    memory = plan["memory_available"]
+    reserved = f" after {_gb(plan['disk_reserved'])} reserved by other runs" if plan["disk_reserved"] else ""
+    return (
+        f"audio mode '{mode}': peak disk ~{_gb(estimate['disk'][mode])} of {_gb(plan['disk_free'])} free{reserved}, "
+        f"peak RAM ~{_gb(estimate['memory'][mode])} of "
+        f"{_gb(memory) if memory is not None else 'unknown'} available"
+    )
+
+
+class Retention:
+    """Deletes run intermediates once the stage consuming them has finished."""
+
+    def __init__(self, keep_intermediates=False):
+        self.keep_intermediates = keep_intermediates
+        self.released = {}  # name -> bytes freed
+
+    def release(self, name, path):
+        if self.keep_intermediates or not path or not os.path.exists(path):
+            return 0
+        size = os.path.getsize(path)
+        os.remove(path)
+        self.released[name] = size
+        print(f"Removed intermediate {os.path.basename(path)} ({size / 1e6:.1f} MB)")
+        return size
+
+
+def _tree_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def prune_runs(output_root, max_age_days=0, max_total_bytes=0, keep=(), today=None):
+    """Delete output/YYYYMMDD run directories older than max_age_days, then the
+    oldest ones until the rest fit max_total_bytes (0 disables either policy).
+
+    Directories in `keep` are never removed. Returns [(path, bytes)] removed.
+    """
+    if not os.path.isdir(output_root):
+        return []
+    today = today or datetime.now().date()
+    keep = {os.path.abspath(path) for path in keep}
+    runs = []
+    for name in sorted(os.listdir(output_root)):
+        path = os.path.join(output_root, name)
+        if RUN_DIR_PATTERN.fullmatch(name) and os.path.isdir(path):
+            try:
+                day = datetime.strptime(name, "%Y%m%d").date()
+            except ValueError:
+                continue
+            runs.append((day, path, _tree_bytes(path)))
+
+    removed = []
+
+    def remove(path, size):
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append((path, size))
+        print(f"Pruned run directory {path} ({size / 1e6:.1f} MB)")
+
+    remaining = []
+    for day, path, size in runs:
+        if os.path.abspath(path) in keep:
+            remaining.append((day, path, size))
+        elif max_age_days and (today - day).days > max_age_days:
+            remove(path, size)
+        else:
+            remaining.append((day, path, size))
+
+    if max_total_bytes:
+        total = sum(size for _, _, size in remaining)
+        for day, path, size in remaining:  # oldest first
+            if total <= max_total_bytes:
+                break
+            if os.path.abspath(path) in keep:
+                continue
+            remove(path, size)
+            total -= size
+    return removed
+
+
+def prune_audio_cache(cache_dir, max_age_days, now=None):
+    """Delete decoded-audio cache entries not written within max_age_days."""
+    if not max_age_days or not os.path.isdir(cache_dir):
+        return []
+    cutoff = (now or datetime.now().timestamp()) - max_age_days * 86400
+    removed = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".npy"):
+            continue
+        path = os.path.join(cache_dir, name)
+        if os.path.getmtime(path) < cutoff:
+            size = os.path.getsize(path)
+            os.remove(path)
+            meta_path = path[:-len(".npy")] + ".json"
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            removed.append((path, size))
+    return removed
+
+
+def apply_retention(settings, output_root="output", keep=()):
+    """Prune by the RETENTION_* policy. Returns bytes freed."""
+    removed = prune_runs(
+        output_root,
+        max_age_days=settings["retention_days"],
+        max_total_bytes=int(settings["retention_max_gb"] * 1e9),
+        keep=keep,
+    )
+    removed += prune_audio_cache(settings["audio_cache_dir"], settings["retention_days"])
+    return sum(size for _, size in removed)
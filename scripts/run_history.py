@@ -0,0 +1,313 @@
+"""Local SQLite run history (source of truth) with batched Sheets mirroring.
+
+Every run is recorded locally first; Sheets is a mirror that receives all
+not-yet-synced runs in one append, on a background thread or via:
+    PYTHONPATH=. python scripts/run_history.py sync [--channel study]
+    PYTHONPATH=. python scripts/run_history.py stats
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_date TEXT NOT NULL,
+    channel TEXT,
+    seed INTEGER,
+    mood TEXT,
+    season TEXT,
+    title TEXT,
+    suno_prompt TEXT,
+    bg_prompt TEXT,
+    thumb_prompt TEXT,
+    bg_variation TEXT,
+    thumb_variation TEXT,
+    variation_provider TEXT,
+    variation_seconds REAL,
+    prompt_hash TEXT,
+    duration_ms INTEGER,
+    asset_hashes TEXT,
+    stage_timings TEXT,
+    file_sizes TEXT,
+    drive_url TEXT,
+    youtube_url TEXT,
+    status TEXT NOT NULL DEFAULT 'running',
+    error TEXT,
+    synced INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_runs_run_date ON runs (run_date);
+CREATE INDEX IF NOT EXISTS idx_runs_prompt_hash ON runs (prompt_hash);
+CREATE INDEX IF NOT EXISTS idx_runs_synced ON runs (synced, status);
+CREATE TABLE IF NOT EXISTS uploads (
+    content_hash TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    channel TEXT,
+    remote_id TEXT NOT NULL,
+    url TEXT,
+    run_id INTEGER,
+    uploaded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_uploads_content ON uploads (content_hash, destination);
+"""
+
+JSON_COLUMNS = ("asset_hashes", "stage_timings", "file_sizes")
+# runs.synced: 0 = not mirrored yet, 1 = mirrored, 2 = mirrored but changed since
+SYNC_CHANGED = 2
+# Columns added after the first release: (name, type), applied to older databases
+MIGRATIONS = (("channel", "TEXT"), ("variation_provider", "TEXT"), ("variation_seconds", "REAL"))
+
+
+def prompt_hash(*prompts):
+    return hashlib.sha256("\n".join(prompts).encode("utf-8")).hexdigest()[:16]
+
+
+class RunHistory:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        # Sheets sync runs on a background thread, so allow cross-thread use
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(runs)")}
+            for column, column_type in MIGRATIONS:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE runs ADD COLUMN {column} {column_type}")
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def start_run(self, run_date, **fields):
+        fields["run_date"] = run_date
+        return self._insert(fields)
+
+    def _insert(self, fields):
+        fields = self._encode(fields)
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"INSERT INTO runs ({columns}) VALUES ({placeholders})",
+                tuple(fields.values()),
+            )
+            return cursor.lastrowid
+
+    def update(self, run_id, **fields):
+        if not fields:
+            return
+        fields = self._encode(fields)
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        self._execute(
+            f"UPDATE runs SET {assignments} WHERE id = ?",
+            (*fields.values(), run_id),
+        )
+
+    @staticmethod
+    def _encode(fields):
+        return {
+            key: json.dumps(value, ensure_ascii=False) if key in JSON_COLUMNS and value is not None else value
+            for key, value in fields.items()
+        }
+
+    @staticmethod
+    def _decode(row):
+        record = dict(row)
+        for key in JSON_COLUMNS:
+            if record.get(key):
+                record[key] = json.loads(record[key])
+        return record
+
+    def get(self, run_id):
+        rows = self._execute("SELECT * FROM runs WHERE id = ?", (run_id,))
+        return self._decode(rows[0]) if rows else None
+
+    def recent_values(self, column, limit, channel=None):
+        """Values of `column` in the channel's last `limit` successful runs, newest first."""
+        if column not in ("mood", "title", "bg_variation", "thumb_variation", "prompt_hash"):
+            raise ValueError(f"Unsupported column: {column}")
+        rows = self._execute(
+            f"SELECT {column} FROM runs WHERE status = 'success' AND channel IS ? "
+            "ORDER BY run_date DESC LIMIT ?",
+            (channel, limit),
+        )
+        return [row[0] for row in rows]
+
+    def last_success(self, channel=None):
+        """run_date (ISO string) of the channel's latest successful run, or None."""
+        rows = self._execute(
+            "SELECT MAX(run_date) FROM runs WHERE status = 'success' AND channel IS ?",
+            (channel,),
+        )
+        return rows[0][0]
+
+    def duration_stats(self):
+        rows = self._execute(
+            "SELECT COUNT(*), MIN(duration_ms), AVG(duration_ms), MAX(duration_ms) "
+            "FROM runs WHERE status = 'success' AND duration_ms IS NOT NULL"
+        )
+        count, minimum, average, maximum = rows[0]
+        return {"runs": count, "min_ms": minimum, "avg_ms": average, "max_ms": maximum}
+
+    def stage_stats(self, limit=20):
+        """Average seconds per stage over the last `limit` successful runs."""
+        rows = self._execute(
+            "SELECT stage_timings FROM runs WHERE status = 'success' AND stage_timings IS NOT NULL "
+            "ORDER BY run_date DESC LIMIT ?",
+            (limit,),
+        )
+        totals, counts = {}, {}
+        for (raw,) in rows:
+            for stage, seconds in json.loads(raw).items():
+                totals[stage] = totals.get(stage, 0) + seconds
+                counts[stage] = counts.get(stage, 0) + 1
+        return {stage: totals[stage] / counts[stage] for stage in totals}
+
+    def recent(self, limit):
+        rows = self._execute("SELECT * FROM runs ORDER BY run_date DESC LIMIT ?", (limit,))
+        return [self._decode(row) for row in rows]
+
+    def unsynced(self, channel=None):
+        rows = self._execute(
+            "SELECT * FROM runs WHERE synced != 1 AND status IN ('success', 'failed') AND channel IS ? "
+            "ORDER BY id",
+            (channel,),
+        )
+        return [self._decode(row) for row in rows]
+
+    def find_upload(self, content_hash, destination, channel=None):
+        """Earlier transfer of this content to destination ("youtube", "drive"), or None."""
+        rows = self._execute(
+            "SELECT * FROM uploads WHERE content_hash = ? AND destination = ? AND channel IS ? "
+            "ORDER BY uploaded_at LIMIT 1",
+            (content_hash, destination, channel),
+        )
+        return dict(rows[0]) if rows else None
+
+    def record_upload(self, content_hash, destination, remote_id, url=None, channel=None, run_id=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO uploads (content_hash, destination, channel, remote_id, url, run_id, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, destination, channel, remote_id, url, run_id, datetime.now().isoformat()),
+            )
+
+    def mark_synced(self, run_ids):
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE runs SET synced = 1 WHERE id = ?", [(i,) for i in run_ids])
+
+
+def sheets_row(record):
+    """Map a run record onto the Sheets columns (Date ... Status)."""
+    run_date = datetime.fromisoformat(record["run_date"])
+    return [
+        run_date.strftime("%Y-%m-%d %H:%M:%S"),
+        record["seed"],
+        record["suno_prompt"],
+        record["bg_prompt"],
+        record["thumb_prompt"],
+        record["drive_url"] or "N/A",
+        record["youtube_url"] or "N/A",
+        record["status"],
+    ]
+
+
+def sync_to_sheets(history, logger, channel=None):
+    """Mirror the channel's unsynced runs to Sheets in one append. Returns rows sent.
+
+    Rows are handed to the logger's on-disk queue before the runs are marked
+    synced, so a failed flush is retried from that queue without duplicates.
+    Runs changed after they were mirrored replace their existing row.
+    """
+    records = history.unsynced(channel)
+    for record in records:
+        if record["synced"] == SYNC_CHANGED:
+            logger.queue_update(sheets_row(record))
+        else:
+            logger.queue(sheets_row(record))
+    history.mark_synced([record["id"] for record in records])
+    return logger.flush()
+
+
+def start_sheets_sync(history, settings):
+    """Mirror to Sheets on a background thread; returns the thread (or None)."""
+    if not (settings["gcp_service_account"] and settings["sheets_id"]):
+        print("Sheets logging skipped (GCP_SERVICE_ACCOUNT_JSON or SHEETS_ID not set)")
+        return None
+
+    from scripts.update_sheet import SheetsLogger
+
+    def _run():
+        logger = SheetsLogger(
+            settings["gcp_service_account"],
+            settings["sheets_id"],
+            settings["sheets_range"],
+            state_dir=settings["state_dir"],
+        )
+        try:
+            sent = sync_to_sheets(history, logger, channel=settings["channel"])
+            print(f"✓ Synced {sent} run(s) to Sheets: {settings['sheets_id']}")
+        except Exception as e:
+            print(f"✗ Warning: Sheets sync failed, runs stay queued locally: {e}")
+
+    # Non-daemon: the interpreter waits for the sync before exiting
+    thread = threading.Thread(target=_run, name="sheets-sync")
+    thread.start()
+    return thread
+
+
+def history_path(settings):
+    return os.path.join(settings["state_dir"], "history.sqlite3")
+
+
+def main():
+    import argparse
+
+    from dotenv import load_dotenv
+
+    from scripts import rate_limit
+    from scripts.config import load_settings
+
+    parser = argparse.ArgumentParser(description="SleepMusic run history")
+    parser.add_argument("command", choices=["sync", "stats", "recent"])
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--channel", help="Sync this channel's runs (profile from config/channels.json)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    settings = load_settings(strict=False)
+    rate_limit.configure_from_settings(settings)
+    history = RunHistory(history_path(settings))
+    if args.channel:
+        from scripts.channels import channel_settings, load_channels
+
+        profiles = {channel["name"]: channel for channel in load_channels()}
+        if args.channel not in profiles:
+            raise SystemExit(f"Unknown channel: {args.channel}")
+        settings = channel_settings(profiles[args.channel], strict=False)
+
+    if args.command == "sync":
+        thread = start_sheets_sync(history, settings)
+        if thread:
+            thread.join()
+    elif args.command == "stats":
+        print(json.dumps(
+            {"duration": history.duration_stats(), "stage_seconds": history.stage_stats(args.limit)},
+            indent=2,
+        ))
+    else:
+        for record in history.recent(args.limit):
+            print(" | ".join(
+                str(record[key]) for key in ("id", "run_date", "channel", "mood", "season", "status", "youtube_url")
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,28 @@
+"""SleepMusic pipeline CLI.
+
+Heavy dependencies (requests, pydub, googleapiclient, OAuth libraries, dotenv)
+are imported only by the command or stage that needs them, so `--help`,
+`inspect` and stage-only reruns start instantly.
+
+Usage:
+    PYTHONPATH=. python scripts/run_pipeline.py                 # full run
+    PYTHONPATH=. python scripts/run_pipeline.py run --dry-run   # texts and plan only
+    PYTHONPATH=. python scripts/run_pipeline.py channels        # every due channel profile
+    PYTHONPATH=. python scripts/run_pipeline.py audio output/20250101/audio_raw.wav
+    PYTHONPATH=. python scripts/run_pipeline.py render bg.png audio_90m.wav
+    PYTHONPATH=. python scripts/run_pipeline.py inspect output/20250101
+    PYTHONPATH=. python scripts/run_pipeline.py benchmark
+"""
+import argparse
 import json
 import os
 import random
+import subprocess
+import sys
 from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
 
-import requests
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-from scripts.audio_process import process_audio
 from scripts.config import load_settings
-from scripts.image_generate import generate_images
-from scripts.kieai_client import KieAIClient
-from scripts.notify_discord import notify
-from scripts.prompt_generator import generate_image_variations
-from scripts.update_sheet import append_row
-from scripts.upload_drive import upload_to_drive
-from scripts.upload_youtube import upload_video
-from scripts.utils import retry_call
-from scripts.video_render import render_video
 
 JST = timezone(timedelta(hours=9))
 
@@ -51,6 +54,7 @@ def build_texts(templates, mood, season, bg_variation, thumb_variation):
     )
     title_emoji = random.choice(templates["title_emojis"])
     title = f"{templates['title_category']}{title_catchphrase_jp}｜{title_main_en} {title_emoji}"
+    thumb_text = title_catchphrase_jp
 
     # Build description with multiple sections
     description_parts = []
@@ -131,49 +135,259 @@ def build_texts(templates, mood, season, bg_variation, thumb_variation):
     bg_prompt = f"{bg_prompt_jp}\n{bg_prompt_en}"
     thumb_prompt = f"{thumb_prompt_jp}\n{thumb_prompt_en}"
 
-    return title, description, suno_prompt, bg_prompt, thumb_prompt
+    return title, description, suno_prompt, bg_prompt, thumb_prompt, thumb_text
 
 
 def download_file(url, output_path):
-    response = requests.get(url, timeout=120)
+    from scripts import tracing
+    from scripts.utils import http_session
+
+    response = http_session().get(url, timeout=120)
     response.raise_for_status()
+    tracing.add_network_bytes(received=len(response.content))
     with open(output_path, "wb") as f:
         f.write(response.content)
     return output_path
 
 
-def main():
-    settings = load_settings()
-    templates = load_templates(os.path.join("config", "templates.json"))
+def download_files(urls, paths):
+    """download_file for each pair at once; bytes still count toward the caller's span."""
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, download_file, url, path) for url, path in zip(urls, paths)
+        ]
+        return [future.result() for future in futures]
+
+
+def upload_once(history, content_hash, destination, upload, channel=None, run_id=None):
+    """upload() -> (remote_id, url), unless this content already reached destination.
+
+    Transfers are recorded by the rendered file's content hash as soon as they
+    finish, so a retry or rerun reuses the earlier video/file ID instead of
+    sending the same gigabytes again and creating a duplicate.
+    """
+    from scripts import tracing
+
+    previous = history.find_upload(content_hash, destination, channel)
+    if previous:
+        print(f"Skipping {destination} upload: content already uploaded as {previous['url']} (run {previous['run_id']})")
+        tracing.count("uploads_skipped")
+        return previous["remote_id"], previous["url"]
+    remote_id, url = upload()
+    history.record_upload(content_hash, destination, remote_id, url, channel=channel, run_id=run_id)
+    return remote_id, url
+
+
+def finish_uploaded_run(history, run_id, previous, channel):
+    """Mark an interrupted run whose video is already on YouTube as done.
+
+    Returns False when that run already finished (the video is simply today's
+    earlier upload and a new one should be made).
+    """
+    earlier = history.get(previous["run_id"]) if previous["run_id"] else None
+    if earlier is None or earlier["status"] == "success":
+        return False
+    from scripts.run_history import SYNC_CHANGED
+
+    drive = history.find_upload(previous["content_hash"], "drive", channel)
+    history.update(
+        earlier["id"],
+        status="success",
+        error=None,
+        youtube_url=previous["url"],
+        drive_url=drive["url"] if drive else None,
+        # A run already mirrored as failed gets its Sheets row replaced
+        synced=SYNC_CHANGED if earlier["synced"] else 0,
+    )
+    history.update(run_id, status="resumed", error=f"Finished run {earlier['id']} instead (already uploaded)")
+    print(
+        f"Run {earlier['id']} stopped after uploading {previous['url']}; "
+        "recorded it as complete instead of rendering a duplicate"
+    )
+    return True
+
+
+def main(dry_run=False, settings=None, history=None):
+    """One full run. The channel scheduler passes each channel's settings and
+    the shared history; otherwise both come from the environment."""
+    from scripts.run_history import RunHistory, history_path, start_sheets_sync
+
+    if settings is None:
+        from scripts import rate_limit, resources
+
+        settings = load_settings(strict=not dry_run)
+        rate_limit.configure_from_settings(settings)
+        resources.set_cpu_jobs(settings["cpu_jobs"])
+    templates = load_templates(settings["templates_path"])
+    if history is None:
+        history = RunHistory(history_path(settings))
+    channel = settings["channel"]
 
     now = datetime.now(JST)
     seed = random.randint(1, 2_147_483_647)
-    mood = random.choice(templates["moods"])
+    # Avoid moods used in the last few runs (local query, no network)
+    recent_moods = set(history.recent_values("mood", settings["avoid_repeat_runs"], channel))
+    mood = random.choice(
+        [m for m in templates["moods"] if m["en"] not in recent_moods] or templates["moods"]
+    )
     season = choose_season(now.month, templates["seasons"])
 
-    # Generate unique image variations using AI
-    bg_variation, thumb_variation = generate_image_variations(
-        settings["gemini_api_key"],
-        settings["gemini_model"],
-        season["jp"],
-        season["en"],
-        mood["jp"],
-        mood["en"],
+    if dry_run:
+        # Texts from fallback variations; no paid or network calls
+        title, description, suno_prompt, bg_prompt, thumb_prompt, _ = build_texts(
+            templates, mood, season, "星空の夜、starry night", "美しい夜空、beautiful night sky"
+        )
+        print(f"[dry-run] Seed: {seed}  Mood: {mood['en']}  Season: {season['en']}")
+        print(f"[dry-run] Title: {title}")
+        print(f"[dry-run] Suno prompt:\n{suno_prompt}")
+        print(f"[dry-run] Output dir: {os.path.join(settings['output_root'], now.strftime('%Y%m%d'))}")
+        print(
+            f"[dry-run] Render profile: {settings['render_profile']}, "
+            f"target {settings['target_minutes']}±{settings['target_variance_minutes']} min"
+        )
+        if settings["length_variants"]:
+            print(f"[dry-run] Length variants: {', '.join(f'{m} min' for m in settings['length_variants'])}")
+        from scripts.resources import ResourceError, describe_plan, plan_run
+
+        try:
+            print(f"[dry-run] Preflight: {describe_plan(plan_run(settings, settings['output_root']))}")
+        except ResourceError as exc:
+            print(f"[dry-run] Preflight would fail: {exc}")
+        return
+
+    run_id = history.start_run(now.isoformat(), channel=channel, seed=seed, mood=mood["en"], season=season["en"])
+    output_dir = os.path.join(settings["output_root"], now.strftime("%Y%m%d"))
+    try:
+        run_stages(settings, templates, history, run_id, now, seed, mood, season)
+    except Exception as exc:
+        from scripts import tracing
+
+        history.update(run_id, status="failed", error=str(exc), stage_timings=tracing.stage_timings())
+        if os.path.isdir(output_dir):
+            tracing.write_chrome_trace(os.path.join(output_dir, "trace.json"))
+        start_sheets_sync(history, settings)
+        raise
+    finally:
+        from scripts.resources import release_disk
+
+        # The run's files are on disk now (or it failed); free its reservation
+        release_disk(output_dir)
+
+
+def run_stages(settings, templates, history, run_id, now, seed, mood, season):
+    # Stage modules pull in requests, pydub and the Google client libraries;
+    # import them only once a real run starts.
+    from scripts import tracing
+    from scripts.archive_bundle import build_bundle
+    from scripts.audio_cache import load_decoded
+    from scripts.audio_process import process_audio, stream_audio
+    from scripts.audio_qc import StreamQC, loop_seams, run_qc
+    from scripts.image_generate import generate_images
+    from scripts.kieai_client import KieAIClient
+    from scripts.notify_discord import notify
+    from scripts.preflight import describe_checks, run_checks
+    from scripts.resources import Retention, apply_retention, cpu_slot, describe_plan, plan_run
+    from scripts.run_history import prompt_hash, start_sheets_sync
+    from scripts.scenes import plan_timeline, scene_prompts
+    from scripts.thumbnail import compose_thumbnail, resolve_font
+    from scripts.track_chain import chain_tracks
+    from scripts.upload_drive import upload_to_drive
+    from scripts.upload_youtube import upload_video
+    from scripts.utils import retry_call, sha256_file
+    from scripts.variants import render_variants, variant_title
+    from scripts.variation_pool import VariationPool, gemini_breaker
+    from scripts.video_render import HASH_SUFFIX, content_hash, render_video, render_video_stream, report_savings
+
+    tracing.reset(run=settings["channel"])
+    output_dir = os.path.join(settings["output_root"], now.strftime("%Y%m%d"))
+    video_path = os.path.join(output_dir, "video.mp4")
+    # A rerun after a crash between the YouTube upload and the run record
+    # finishes that run instead of generating and uploading the video again
+    if os.path.exists(video_path + HASH_SUFFIX):
+        previous = history.find_upload(content_hash(video_path), "youtube", settings["channel"])
+        if previous and finish_uploaded_run(history, run_id, previous, settings["channel"]):
+            start_sheets_sync(history, settings)
+            return
+    # Prune old runs, then make sure this one fits before any paid call
+    with tracing.span("preflight"):
+        freed = apply_retention(settings, settings["output_root"], keep=[output_dir])
+        plan = plan_run(settings, settings["output_root"], output_dir)
+        if settings["scenes"] > 1:
+            # Raises now if the shortest possible video cannot fit every scene's loop
+            plan_timeline(
+                (settings["target_minutes"] - settings["target_variance_minutes"]) * 60,
+                settings["scenes"], settings["scene_loop_seconds"], settings["scene_transition_seconds"],
+            )
+        # Tools, credentials and quotas, probed concurrently; raises on a fatal failure
+        checks = run_checks(settings) if settings["preflight_checks"] else {}
+    if freed:
+        print(f"Retention freed {freed / 1e6:.1f} MB")
+    print(f"Preflight: {describe_plan(plan)}")
+    if checks:
+        print(f"Preflight checks: {describe_checks(checks)}")
+    audio_mode = plan["audio_mode"]
+    retention = Retention(settings["keep_intermediates"])
+
+    # Draw unique image variations from the pre-generated pool
+    variation_pool = VariationPool(
+        settings["state_dir"],
+        batch_size=settings["variation_pool_batch"],
+        low_water=settings["variation_pool_low_water"],
+        timeout=settings["gemini_timeout_seconds"],
+        breaker=gemini_breaker(settings),
+    )
+    with tracing.span("variations") as variations_span:
+        bg_variation, thumb_variation = variation_pool.draw(
+            settings["gemini_api_key"],
+            settings["gemini_model"],
+            season,
+            mood,
+        )
+        variation_source = variation_pool.last_source
+        variations_span.attrs.update(variation_source)
+    print(
+        f"Variations from {variation_source['provider']} "
+        f"in {variation_source['seconds']:.2f}s"
     )
     print(f"Generated variations:\n  BG: {bg_variation}\n  Thumb: {thumb_variation}")
 
-    title, description, suno_prompt, bg_prompt, thumb_prompt = build_texts(
-        templates, mood, season, bg_variation, thumb_variation
+    # Re-roll the title if it was used in the last few runs
+    recent_titles = set(history.recent_values("title", settings["avoid_repeat_runs"], settings["channel"]))
+    for _ in range(5):
+        title, description, suno_prompt, bg_prompt, thumb_prompt, thumb_text = build_texts(
+            templates, mood, season, bg_variation, thumb_variation
+        )
+        if title not in recent_titles:
+            break
+    history.update(
+        run_id,
+        title=title,
+        suno_prompt=suno_prompt,
+        bg_prompt=bg_prompt,
+        thumb_prompt=thumb_prompt,
+        bg_variation=bg_variation,
+        thumb_variation=thumb_variation,
+        variation_provider=variation_source["provider"],
+        variation_seconds=variation_source["seconds"],
+        prompt_hash=prompt_hash(suno_prompt, bg_prompt, thumb_prompt),
     )
 
-    output_dir = os.path.join("output", now.strftime("%Y%m%d"))
     os.makedirs(output_dir, exist_ok=True)
 
-    raw_audio = os.path.join(output_dir, "audio_raw.wav")
     processed_audio = os.path.join(output_dir, "audio_90m.wav")
     bg_path = os.path.join(output_dir, "bg.png")
-    thumb_path = os.path.join(output_dir, "thumb.png")
-    video_path = os.path.join(output_dir, "video.mp4")
+    # Extra backgrounds of a scene sequence: bg_2.png, bg_3.png, ...
+    scene_paths = [os.path.join(output_dir, f"bg_{index}.png") for index in range(2, settings["scenes"] + 1)]
+    scene_assets = [(os.path.splitext(os.path.basename(path))[0], path) for path in scene_paths]
+    # Compose the thumbnail locally unless no CJK font is available
+    thumb_font = resolve_font(settings["thumbnail_font"]) if settings["thumbnail_mode"] == "local" else None
+    if settings["thumbnail_mode"] == "local" and not thumb_font:
+        print("Warning: no CJK font found (THUMBNAIL_FONT); generating the thumbnail remotely")
+    thumb_path = os.path.join(output_dir, "thumb.jpg" if thumb_font else "thumb.png")
+    bundle_path = os.path.join(output_dir, "bundle.zip")
 
     client = KieAIClient(
         api_key=settings["kieai_api_key"],
@@ -182,50 +396,211 @@ def main():
         nanobanana_endpoint=settings["kieai_nanobanana_endpoint"],
     )
 
-    audio_url = retry_call(
-        lambda: client.generate_suno(suno_prompt, seed, instrumental=True),
-        max_retries=settings["max_retries"],
-    )
-    download_file(audio_url, raw_audio)
+    with tracing.span("suno"):
+        audio_urls = retry_call(
+            lambda: client.generate_suno(suno_prompt, seed, instrumental=True),
+            max_retries=settings["max_retries"],
+        )[:max(settings["suno_tracks"], 1)]
+    # Keep the real container extension (Suno usually serves MP3)
+    track_paths = []
+    for index, url in enumerate(audio_urls):
+        suffix = "" if index == 0 else f"_{index + 1}"
+        raw_ext = os.path.splitext(urlparse(url).path)[1] or ".mp3"
+        track_paths.append(os.path.join(output_dir, f"audio_raw{suffix}{raw_ext}"))
+    with tracing.span("download", tracks=len(track_paths)):
+        download_files(audio_urls, track_paths)
+    # Every track of the generation goes into one longer loop unit
+    raw_audio = track_paths[0]
+    chain_joins = []
+    if len(track_paths) > 1:
+        with cpu_slot(), tracing.span("chain", tracks=len(track_paths)):
+            raw_audio, chain_report = chain_tracks(
+                track_paths,
+                os.path.join(output_dir, "audio_unit.flac"),
+                settings["crossfade_seconds"],
+                cache_dir=settings["audio_cache_dir"],
+                max_key_shift=settings["chain_max_key_shift"],
+            )
+        chain_joins = chain_report["joins_ms"]
+    # audio_raw, audio_raw_2, ... and audio_unit, as recorded in the run history
+    track_assets = [
+        (os.path.splitext(os.path.basename(path))[0], path) for path in dict.fromkeys([*track_paths, raw_audio])
+    ]
 
-    process_audio(
-        raw_audio,
-        processed_audio,
+    audio_args = (
         settings["target_minutes"],
         settings["target_variance_minutes"],
         settings["lowpass_hz"],
         settings["crossfade_seconds"],
         settings["fadeout_seconds"],
     )
+    audio_kwargs = {
+        "cache_dir": settings["audio_cache_dir"],
+        "ambient": settings["ambient_bed"],
+        "ambient_level_db": settings["ambient_level_db"],
+        "ambient_seed": seed,
+    }
+    with cpu_slot(), tracing.span("audio", mode=audio_mode):
+        if audio_mode == "pipe":
+            # No audio_90m.wav: blocks are generated while ffmpeg encodes
+            audio_blocks, sample_rate, channels, target_ms = stream_audio(raw_audio, *audio_args, **audio_kwargs)
+        else:
+            _, target_ms = process_audio(
+                raw_audio, processed_audio, *audio_args, streaming=audio_mode == "streaming", **audio_kwargs
+            )
 
-    retry_call(
-        lambda: generate_images(
-            client, bg_prompt, thumb_prompt, seed, bg_path, thumb_path,
-            bg_model=settings["kieai_nanobanana_bg_model"],
-            thumb_model=settings["kieai_nanobanana_thumb_model"]
-        ),
-        max_retries=settings["max_retries"],
-    )
+    qc_path = os.path.join(output_dir, "qc.json")
+    stream_qc = None
+    if settings["qc_enabled"]:
+        source = load_decoded(raw_audio, settings["audio_cache_dir"])
+        seams = loop_seams(
+            int(source.duration_seconds * 1000), settings["crossfade_seconds"] * 1000, target_ms, chain_joins
+        )
+        if audio_mode == "pipe":
+            # Checked on the way into the render, still before upload
+            stream_qc = StreamQC(sample_rate, channels, settings, seams=seams)
+            audio_blocks = stream_qc.tee(audio_blocks)
+        else:
+            # Check the soundtrack before spending time on render and upload
+            with cpu_slot(), tracing.span("qc"):
+                qc_report = run_qc(processed_audio, settings, seams=seams, report_path=qc_path)
+            print(
+                f"Audio QC passed: {qc_report['integrated_lufs']} LUFS, "
+                f"true peak {qc_report['true_peak_dbtp']} dBTP, {len(seams)} seams checked"
+            )
+
+    with tracing.span("images", scenes=len(scene_paths) + 1):
+        retry_call(
+            lambda: generate_images(
+                client, bg_prompt, thumb_prompt, seed, bg_path, None if thumb_font else thumb_path,
+                bg_model=settings["kieai_nanobanana_bg_model"],
+                thumb_model=settings["kieai_nanobanana_thumb_model"],
+                scene_prompts=scene_prompts(bg_prompt, settings["scenes"]),
+                scene_paths=scene_paths,
+            ),
+            max_retries=settings["max_retries"],
+        )
+    if thumb_font:
+        with tracing.span("thumbnail"):
+            compose_thumbnail(
+                bg_path,
+                thumb_path,
+                thumb_text,
+                thumb_font,
+                label=templates["title_category"].strip("【】"),
+                layout_cache=os.path.join(settings["state_dir"], "thumb_layouts.json"),
+            )
 
-    render_video(bg_path, processed_audio, video_path)
+    render_params = {
+        "width": 1920,
+        "height": 1080,
+        "profile": settings["render_profile"],
+        "target_kbps": settings["render_target_kbps"],
+        "target_mb": settings["render_target_mb"],
+        "audio_codec": settings["render_audio_codec"],
+        "audio_kbps": settings["render_audio_kbps"],
+        "duration_seconds": target_ms / 1000,
+        "motion_engine": settings["motion_engine"],
+        "motion_workers": settings["motion_workers"] or None,
+        "scene_loop_seconds": settings["scene_loop_seconds"],
+        "scene_transition_seconds": settings["scene_transition_seconds"],
+    }
+    # Scene paths stay out of render_params, which the bundle stores
+    with cpu_slot(), tracing.span("render", scenes=len(scene_paths) + 1):
+        if audio_mode == "pipe":
+            render_video_stream(
+                bg_path, audio_blocks, sample_rate, channels, video_path, scenes=scene_paths, **render_params
+            )
+        else:
+            render_video(bg_path, processed_audio, video_path, scenes=scene_paths, **render_params)
+    retention.release("audio", processed_audio)
+    if stream_qc:
+        with tracing.span("qc"):
+            qc_report = stream_qc.check(report_path=qc_path)
+        print(
+            f"Audio QC passed: {qc_report['integrated_lufs']} LUFS, "
+            f"true peak {qc_report['true_peak_dbtp']} dBTP, {len(seams)} seams checked"
+        )
+
+    variants = []
+    if settings["length_variants"]:
+        # Longer lengths reuse one loop unit and one motion segment
+        with cpu_slot(), tracing.span("variants", count=len(settings["length_variants"])):
+            variants = render_variants(
+                raw_audio, bg_path, output_dir, settings["length_variants"], settings, render_params
+            )
+        retention.release("motion_segment", os.path.join(output_dir, "motion_segment.mp4"))
+
+    # Written by the render itself; keys the upload records below
+    video_hash = content_hash(video_path)
+    uploads = {"history": history, "channel": settings["channel"], "run_id": run_id}
+
+    # YouTube always receives the MP4; Drive only in "video" archive mode
+    upload_count = 1
+    if settings["drive_archive_mode"] == "video" and settings["drive_folder_id"]:
+        upload_count += 1
+    savings = report_savings(
+        video_path,
+        target_ms / 1000,
+        settings["render_baseline_kbps"],
+        settings["upload_mbps"],
+        upload_count=upload_count,
+    )
+    print(
+        f"Rendered {savings['bytes'] / 1e6:.1f} MB with profile '{settings['render_profile']}' "
+        f"(saved {savings['saved_bytes'] / 1e6:.1f} MB, "
+        f"~{savings['saved_upload_seconds']:.0f}s upload time vs baseline)"
+    )
 
     # Upload to Drive (optional, requires OAuth credentials)
     drive_url = None
     if settings["google_refresh_token"] and settings["drive_folder_id"]:
         # Use date-based filename for easy identification
-        drive_filename = f"SleepMusic_{now.strftime('%Y%m%d_%H%M%S')}.mp4"
+        drive_basename = f"{settings['channel'] or 'SleepMusic'}_{now.strftime('%Y%m%d_%H%M%S')}"
         print(f"Uploading to Drive folder: {settings['drive_folder_id']}")
-        print(f"  Filename: {drive_filename}")
         try:
-            drive_url = upload_to_drive(
-                settings["youtube_client_id"],
-                settings["youtube_client_secret"],
-                settings["google_refresh_token"],
-                video_path,
-                drive_filename,
-                settings["drive_folder_id"],
-            )
+            def _upload_drive():
+                if settings["drive_archive_mode"] == "bundle":
+                    # Archive the small rebuildable inputs instead of the full MP4
+                    build_bundle(
+                        bundle_path,
+                        raw_audio,
+                        bg_path,
+                        audio_params={
+                            "target_minutes": settings["target_minutes"],
+                            "variance_minutes": settings["target_variance_minutes"],
+                            "lowpass_hz": settings["lowpass_hz"],
+                            "crossfade_seconds": settings["crossfade_seconds"],
+                            "fadeout_seconds": settings["fadeout_seconds"],
+                            "target_ms": target_ms,
+                            "ambient": settings["ambient_bed"],
+                            "ambient_level_db": settings["ambient_level_db"],
+                            "ambient_seed": seed,
+                        },
+                        render_params=render_params,
+                        scenes=scene_paths,
+                        metadata={"seed": seed, "title": title, "date": now.isoformat()},
+                    )
+                    drive_source, drive_filename = bundle_path, f"{drive_basename}.zip"
+                else:
+                    drive_source, drive_filename = video_path, f"{drive_basename}.mp4"
+                print(f"  Filename: {drive_filename} ({os.path.getsize(drive_source) / 1e6:.1f} MB)")
+                with tracing.span("drive"):
+                    link = upload_to_drive(
+                        settings["youtube_client_id"],
+                        settings["youtube_client_secret"],
+                        settings["google_refresh_token"],
+                        drive_source,
+                        drive_filename,
+                        settings["drive_folder_id"],
+                    )
+                # https://drive.google.com/file/d/<file id>/view
+                return link.split("/")[-2], link
+
+            # Keyed by the video's hash in either archive mode (the bundle rebuilds it)
+            _, drive_url = upload_once(destination="drive", content_hash=video_hash, upload=_upload_drive, **uploads)
             print(f"✓ Uploaded to Drive: {drive_url}")
+            retention.release("bundle", bundle_path)
         except Exception as e:
             print(f"✗ Warning: Drive upload failed (continuing anyway): {e}")
             import traceback
@@ -234,83 +609,351 @@ def main():
     else:
         print("Drive upload skipped (GOOGLE_REFRESH_TOKEN or DRIVE_FOLDER_ID not set)")
 
-    # Calculate publish time: today at 20:00 JST
-    publish_time = now.replace(hour=20, minute=0, second=0, microsecond=0)
-    # If current time is past 20:00, schedule for tomorrow
+    # Calculate publish time: today at PUBLISH_TIME (JST)
+    publish_hour, publish_minute = (int(part) for part in settings["publish_time"].split(":"))
+    publish_time = now.replace(hour=publish_hour, minute=publish_minute, second=0, microsecond=0)
+    # If current time is past it, schedule for tomorrow
     if now >= publish_time:
         publish_time += timedelta(days=1)
     # Convert to ISO 8601 format for YouTube API
     publish_at = publish_time.isoformat()
     print(f"Scheduled publish time: {publish_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
 
-    video_id = retry_call(
-        lambda: upload_video(
-            settings["youtube_client_id"],
-            settings["youtube_client_secret"],
-            settings["youtube_refresh_token"],
-            video_path,
-            title,
-            description,
-            templates["tags"],
-            privacy_status=settings["youtube_privacy"],
-            publish_at=publish_at,
-            thumbnail_path=thumb_path,
-        ),
-        max_retries=settings["max_retries"],
-    )
-    print(f"Video uploaded successfully: https://youtu.be/{video_id}")
-
-    youtube_url = f"https://youtu.be/{video_id}"
-
-    # Log to Sheets (optional, requires GCP service account)
-    # Expected header row: Date | Seed | Suno Prompt | BG Prompt | Thumb Prompt | Drive URL | YouTube URL | Status
-    if settings["gcp_service_account"] and settings["sheets_id"]:
-        print(f"Logging to Sheets: {settings['sheets_id']}")
+    def _upload_youtube(path, video_title):
+        video_id = retry_call(
+            lambda: upload_video(
+                settings["youtube_client_id"],
+                settings["youtube_client_secret"],
+                settings["youtube_refresh_token"],
+                path,
+                video_title,
+                description,
+                templates["tags"],
+                privacy_status=settings["youtube_privacy"],
+                publish_at=publish_at,
+                thumbnail_path=thumb_path,
+            ),
+            max_retries=settings["max_retries"],
+        )
+        return video_id, f"https://youtu.be/{video_id}"
+
+    with tracing.span("youtube"):
+        _, youtube_url = upload_once(
+            destination="youtube", content_hash=video_hash, upload=lambda: _upload_youtube(video_path, title), **uploads
+        )
+    print(f"Video uploaded successfully: {youtube_url}")
+
+    variant_urls = []
+    for variant in variants:
         try:
-            append_row(
-                settings["gcp_service_account"],
-                settings["sheets_id"],
-                settings["sheets_range"],
-                [
-                    now.strftime("%Y-%m-%d %H:%M:%S"),
-                    seed,
-                    suno_prompt,
-                    bg_prompt,
-                    thumb_prompt,
-                    drive_url or "N/A",
-                    youtube_url,
-                    "success",
-                ],
-            )
-            print(f"✓ Logged to Sheets: {settings['sheets_id']}")
+            with tracing.span("youtube.variant", minutes=variant["minutes"]):
+                _, variant_url = upload_once(
+                    destination="youtube",
+                    content_hash=content_hash(variant["path"]),
+                    upload=lambda: _upload_youtube(variant["path"], variant_title(title, variant["minutes"])),
+                    **uploads,
+                )
+            variant_urls.append(variant_url)
+            print(f"✓ Uploaded {variant['minutes']} min variant: {variant_urls[-1]}")
         except Exception as e:
-            print(f"✗ Warning: Sheets logging failed (continuing anyway): {e}")
-            import traceback
-            traceback.print_exc()
-    else:
-        print("Sheets logging skipped (GCP_SERVICE_ACCOUNT_JSON or SHEETS_ID not set)")
+            print(f"✗ Warning: {variant['minutes']} min variant upload failed (continuing anyway): {e}")
+
+    # Record locally first; Sheets is mirrored asynchronously in batches
+    history.update(
+        run_id,
+        status="success",
+        duration_ms=target_ms,
+        drive_url=drive_url,
+        youtube_url=youtube_url,
+        stage_timings=tracing.stage_timings(),
+        asset_hashes={
+            name: sha256_file(path)
+            for name, path in (*track_assets, ("bg", bg_path), *scene_assets, ("thumb", thumb_path))
+        },
+        file_sizes={
+            # Intermediates already deleted are recorded with their size at release
+            **retention.released,
+            **{
+                name: os.path.getsize(path)
+                for name, path in (
+                    *track_assets,
+                    ("audio", processed_audio),
+                    ("bg", bg_path),
+                    *scene_assets,
+                    ("thumb", thumb_path),
+                    ("video", video_path),
+                    *((f"video_{v['minutes']}m", v["path"]) for v in variants),
+                )
+                if os.path.exists(path)
+            },
+        },
+    )
+    start_sheets_sync(history, settings)
+
+    trace_path = tracing.write_chrome_trace(os.path.join(output_dir, "trace.json"))
+    trace_summary = tracing.summary()
+    print(f"Trace written to {trace_path}\n  {trace_summary}")
 
     # Discord notification (optional)
     if settings["discord_webhook_url"]:
         try:
             notify(
                 settings["discord_webhook_url"],
-                f"Upload complete: {youtube_url}",
+                "\n".join([f"Upload complete: {youtube_url}", *variant_urls, trace_summary]),
             )
         except Exception as e:
             print(f"Warning: Discord notification failed: {e}")
 
 
-if __name__ == "__main__":
+def run_command(args):
     try:
-        main()
+        main(dry_run=args.dry_run)
         print("\nPipeline completed successfully!")
     except Exception as exc:
         print(f"\nPipeline failed: {exc}")
         webhook = os.getenv("DISCORD_WEBHOOK_URL")
-        if webhook:
+        if webhook and not args.dry_run:
             try:
+                from scripts.notify_discord import notify
+
                 notify(webhook, f"Pipeline failed: {exc}")
             except Exception:
                 pass  # Don't fail on notification error
         raise
+
+
+def channels_command(args):
+    from scripts.channels import load_channels, run_channels
+
+    channels = load_channels(args.config)
+    if args.only:
+        unknown = set(args.only) - {channel["name"] for channel in channels}
+        if unknown:
+            raise SystemExit(f"Unknown channel(s): {', '.join(sorted(unknown))}")
+        channels = [channel for channel in channels if channel["name"] in args.only]
+    results = run_channels(channels, dry_run=args.dry_run, force=args.force)
+    print("\nChannels:")
+    for name, result in results.items():
+        print(f"  {name}: {result}")
+    failed = {name: result for name, result in results.items() if result.startswith("failed")}
+    if failed:
+        webhook = os.getenv("DISCORD_WEBHOOK_URL")
+        if webhook and not args.dry_run:
+            try:
+                from scripts.notify_discord import notify
+
+                notify(webhook, "\n".join(f"Channel {name} {result}" for name, result in failed.items()))
+            except Exception:
+                pass  # Don't fail on notification error
+        raise SystemExit(1)
+
+
+def audio_command(args):
+    from scripts.audio_process import process_audio
+
+    settings = load_settings(strict=False)
+    output_path = args.output or os.path.join(os.path.dirname(args.input) or ".", "audio_90m.wav")
+    _, target_ms = process_audio(
+        args.input,
+        output_path,
+        args.minutes or settings["target_minutes"],
+        settings["target_variance_minutes"] if args.minutes is None else 0,
+        settings["lowpass_hz"],
+        settings["crossfade_seconds"],
+        settings["fadeout_seconds"],
+        cache_dir=settings["audio_cache_dir"],
+        ambient=settings["ambient_bed"],
+        ambient_level_db=settings["ambient_level_db"],
+        streaming=args.streaming,
+    )
+    print(f"Processed audio: {output_path} ({target_ms / 60000:.1f} min)")
+
+
+def render_command(args):
+    from scripts.video_render import render_video
+
+    settings = load_settings(strict=False)
+    output_path = args.output or os.path.join(os.path.dirname(args.audio) or ".", "video.mp4")
+    render_video(
+        args.bg,
+        args.audio,
+        output_path,
+        profile=args.profile or settings["render_profile"],
+        target_kbps=settings["render_target_kbps"],
+        target_mb=settings["render_target_mb"],
+        audio_codec=settings["render_audio_codec"],
+        audio_kbps=settings["render_audio_kbps"],
+        motion_engine=settings["motion_engine"],
+        motion_workers=settings["motion_workers"] or None,
+    )
+    print(f"Rendered video: {output_path}")
+
+
+def thumbnail_command(args):
+    from scripts.thumbnail import compose_thumbnail, resolve_font
+
+    settings = load_settings(strict=False)
+    font_path = resolve_font(settings["thumbnail_font"])
+    if not font_path:
+        raise SystemExit("No CJK font found; set THUMBNAIL_FONT or install fonts-noto-cjk")
+    output_path = args.output or os.path.join(os.path.dirname(args.bg) or ".", "thumb.jpg")
+    compose_thumbnail(
+        args.bg,
+        output_path,
+        args.text,
+        font_path,
+        label=args.label,
+        layout_cache=os.path.join(settings["state_dir"], "thumb_layouts.json"),
+    )
+    print(f"Thumbnail: {output_path}")
+
+
+def preflight_command(args):
+    from scripts import rate_limit
+    from scripts.preflight import PreflightError, run_checks
+
+    settings = load_settings()
+    rate_limit.configure_from_settings(settings)
+    try:
+        results = run_checks(settings, use_cache=not args.no_cache)
+    except PreflightError as exc:
+        raise SystemExit(str(exc))
+    for name, result in results.items():
+        status = ("ok" if result["verified"] else "not verified") if result["ok"] else "FAILED"
+        print(f"  {name:8} {status}{' (cached)' if result['cached'] else ''}: {result['detail']}")
+
+
+def inspect_command(args):
+    if not os.path.isdir(args.output_dir):
+        raise SystemExit(f"Not a directory: {args.output_dir}")
+    total = 0
+    for name in sorted(os.listdir(args.output_dir)):
+        path = os.path.join(args.output_dir, name)
+        if os.path.isfile(path):
+            size = os.path.getsize(path)
+            total += size
+            print(f"{size / 1e6:10.1f} MB  {name}")
+    print(f"{total / 1e6:10.1f} MB  total")
+    bundle_path = os.path.join(args.output_dir, "bundle.zip")
+    if os.path.exists(bundle_path):
+        from scripts.archive_bundle import read_manifest
+
+        print("\nBundle manifest:")
+        print(json.dumps(read_manifest(bundle_path), ensure_ascii=False, indent=2))
+
+
+# Everything run_pipeline used to import at module load
+EAGER_IMPORTS = (
+    "requests",
+    "dotenv",
+    "pydub",
+    "googleapiclient.discovery",
+    "googleapiclient.http",
+    "google.oauth2.credentials",
+    "google.oauth2.service_account",
+    "scripts.run_pipeline",
+)
+
+
+def import_time_us(statement):
+    """Run `statement` in a fresh interpreter under -X importtime.
+
+    Returns (total microseconds, [(cumulative_us, module), ...] top-level imports).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), os.getenv("PYTHONPATH")]))},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import failed: {result.stderr.strip().splitlines()[-1:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        # Top-level entries have no extra indentation before the module name
+        if not name[1:].startswith(" "):
+            entries.append((int(cumulative), name.strip()))
+    return sum(us for us, _ in entries), entries
+
+
+def benchmark_command(args):
+    before, _ = import_time_us("; ".join(f"import {name}" for name in EAGER_IMPORTS))
+    after, entries = import_time_us("import scripts.run_pipeline")
+    print("Import time (-X importtime, cumulative):")
+    print(f"  eager (previous layout):  {before / 1000:8.1f} ms")
+    print(f"  lazy  (current CLI load): {after / 1000:8.1f} ms")
+    print(f"  saved:                    {(before - after) / 1000:8.1f} ms")
+    print("\nSlowest modules at CLI load:")
+    for us, name in sorted(entries, reverse=True)[: args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="SleepMusic pipeline")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run = subparsers.add_parser("run", help="Run the full pipeline (default)")
+    run.add_argument("--dry-run", action="store_true", help="Build texts and print the plan; no API calls")
+    run.set_defaults(func=run_command)
+
+    channels = subparsers.add_parser("channels", help="Run every due channel profile in one process")
+    channels.add_argument("--config", help="Channel profiles (default: CHANNELS_PATH or config/channels.json)")
+    channels.add_argument("--only", nargs="+", help="Run only these channels")
+    channels.add_argument("--force", action="store_true", help="Run even if not due")
+    channels.add_argument("--dry-run", action="store_true", help="Build texts and print the plan; no API calls")
+    channels.set_defaults(func=channels_command)
+
+    audio = subparsers.add_parser("audio", help="Run only the audio processing stage")
+    audio.add_argument("input", help="Raw Suno audio file")
+    audio.add_argument("--output", help="Output WAV (default: audio_90m.wav next to input)")
+    audio.add_argument("--minutes", type=int, help="Exact length in minutes (no variance)")
+    audio.add_argument("--streaming", action="store_true", help="Write block by block (bounded memory)")
+    audio.set_defaults(func=audio_command)
+
+    render = subparsers.add_parser("render", help="Run only the video render stage")
+    render.add_argument("bg", help="Background image")
+    render.add_argument("audio", help="Processed audio")
+    render.add_argument("--output", help="Output MP4 (default: video.mp4 next to audio)")
+    render.add_argument("--profile", help="Render profile (default: RENDER_PROFILE)")
+    render.set_defaults(func=render_command)
+
+    thumbnail = subparsers.add_parser("thumbnail", help="Compose only the thumbnail from a background")
+    thumbnail.add_argument("bg", help="Background image")
+    thumbnail.add_argument("text", help="Catchphrase to lay out")
+    thumbnail.add_argument("--label", help="Smaller line above the text (e.g. title category)")
+    thumbnail.add_argument("--output", help="Output JPEG (default: thumb.jpg next to bg)")
+    thumbnail.set_defaults(func=thumbnail_command)
+
+    preflight = subparsers.add_parser("preflight", help="Check tools, credentials and quotas")
+    preflight.add_argument("--no-cache", action="store_true", help="Probe even checks that passed recently")
+    preflight.set_defaults(func=preflight_command)
+
+    inspect = subparsers.add_parser("inspect", help="Show files and manifest of an output directory")
+    inspect.add_argument("output_dir")
+    inspect.set_defaults(func=inspect_command)
+
+    benchmark = subparsers.add_parser("benchmark", help="Report CLI import time before/after lazy loading")
+    benchmark.add_argument("--top", type=int, default=10)
+    benchmark.set_defaults(func=benchmark_command)
+
+    return parser
+
+
+def cli(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(["run", *(argv or [])])
+
+    # Load environment variables from .env file
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    cli()
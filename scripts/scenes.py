@@ -0,0 +1,240 @@
+"""Several backgrounds in one video, with slow crossfades between them.
+
+render_video(..., scenes=[...]) shows bg_path and then each extra background
+for about an equal share of the video. Nothing is rendered at full length:
+
+- each scene's periodic motion (looping_zoompan_filter, SCENE_LOOP_SECONDS) is
+  encoded once, as a head (the first SCENE_TRANSITION_SECONDS of the period)
+  and the rest
+- each transition is encoded once: the next scene's head motion crossfading
+  from the previous scene's head motion (which continues the previous loop
+  where it ended)
+- the timeline is a concat list of those segments (a transition takes the
+  place of the next scene's first head), stream-copied and muxed with the
+  soundtrack
+
+Every segment is a separate encode with the same encoder settings, so it
+starts on an IDR frame with identical SPS/PPS and the concat demuxer can join
+them without re-encoding. An extra scene costs one loop and one transition
+encode, however long the video.
+"""
+import math
+import os
+import tempfile
+
+from scripts import tracing
+
+FPS = 25
+# Appended to the background prompt for scenes after the first
+SCENE_SHOTS = (
+    "Same place and art style, seen from a wider angle.",
+    "Same place and art style, a closer and more intimate view.",
+    "Same place and art style, later in the night with softer light.",
+    "Same place and art style, from a different viewpoint.",
+)
+
+
+def scene_prompts(bg_prompt, count):
+    """Prompts of the extra scenes (count - 1 of them)."""
+    return [f"{bg_prompt}\n{SCENE_SHOTS[index % len(SCENE_SHOTS)]}" for index in range(count - 1)]
+
+
+def plan_timeline(duration_seconds, scene_count, loop_seconds, transition_seconds):
+    """[(kind, scene)] segments in playback order; kind is "head", "rest" or "transition".
+
+    head/transition last transition_seconds, rest loop - transition seconds.
+    The duration is covered by whole loops, split so that scene i ends at the
+    loop nearest (i + 1) / scene_count of the duration; every scene gets at
+    least one loop.
+    """
+    if transition_seconds <= 0 or loop_seconds <= transition_seconds:
+        raise ValueError(
+            f"SCENE_LOOP_SECONDS ({loop_seconds}) must exceed SCENE_TRANSITION_SECONDS ({transition_seconds}) > 0"
+        )
+    if duration_seconds < scene_count * loop_seconds:
+        raise ValueError(
+            f"{duration_seconds:.0f}s is too short for {scene_count} scenes of SCENE_LOOP_SECONDS ({loop_seconds}); "
+            "lower SCENES or SCENE_LOOP_SECONDS"
+        )
+    total = math.ceil(duration_seconds / loop_seconds)
+    share = duration_seconds / scene_count
+    timeline = []
+    used = 0
+    for scene in range(scene_count):
+        # Rounded half up from cumulative targets, so the error never piles up on the last scene
+        end = total if scene == scene_count - 1 else math.floor((scene + 1) * share / loop_seconds + 0.5)
+        for index in range(end - used):
+            timeline.append(("transition" if scene and not index else "head", scene))
+            timeline.append(("rest", scene))
+        used = end
+    return timeline
+
+
+def _zoompan_transition(from_bg, to_bg, output_path, width, height, loop_seconds, seconds, motion, video_args):
+    from scripts.video_render import looping_zoompan_filter
+
+    motion_filter = looping_zoompan_filter(width, height, loop_seconds, motion)
+    command = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-loop", "1", "-i", from_bg,
+        "-loop", "1", "-i", to_bg,
+        "-filter_complex",
+        f"[0:v]{motion_filter}[a];[1:v]{motion_filter}[b];"
+        f"[a][b]xfade=transition=fade:duration={seconds}:offset=0,format=yuv420p",
+        *video_args,
+        "-frames:v", str(int(seconds * FPS)),
+        "-an",
+        output_path,
+    ]
+    tracing.run(command, check=True)
+    return output_path
+
+
+def _crossfade_frames(from_frames, to_frames, count):
+    """Linear crossfade of two yuv420p frame iterators (first frame all `from`)."""
+    import numpy as np
+
+    for index, (a, b) in enumerate(zip(from_frames, to_frames)):
+        a = np.frombuffer(a, dtype=np.uint8).astype(np.float32)
+        b = np.frombuffer(b, dtype=np.uint8).astype(np.float32)
+        b -= a
+        b *= index / count
+        b += a
+        b += 0.5
+        yield b.astype(np.uint8)
+
+
+def _numpy_transition(from_bg, to_bg, output_path, width, height, loop_seconds, seconds, motion, workers,
+                      video_args):
+    from scripts.motion_frames import MotionRenderer, raw_video_input
+    from scripts.video_render import _run_feeding
+
+    count = int(seconds * FPS)
+    command = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        *raw_video_input(width, height),
+        *video_args,
+        "-frames:v", str(count),
+        "-an",
+        output_path,
+    ]
+    with MotionRenderer(from_bg, width, height, motion, workers) as first, \
+            MotionRenderer(to_bg, width, height, motion, workers) as second:
+        frames = _crossfade_frames(
+            first.frames(count, period_seconds=loop_seconds), second.frames(count, period_seconds=loop_seconds), count
+        )
+        _run_feeding(command, stdin_chunks=frames)
+    return output_path
+
+
+def render_segments(bg_paths, workdir, timeline, width, height, loop_seconds, transition_seconds, profile,
+                    video_kbps, motion=None, motion_engine="zoompan", motion_workers=None):
+    """Encode every segment the timeline uses, once. Returns {(kind, scene): path}."""
+    from scripts.video_render import RENDER_PROFILES, _video_args, render_motion_segment
+
+    audio_kbps = RENDER_PROFILES[profile]["audio_kbps"]
+    # Every scene's loop starts at phase 0, so a transition continues the previous loop
+    motion = {**(motion or {}), "start_seconds": 0}
+    segments = {}
+    for kind, scene in dict.fromkeys(timeline):
+        path = os.path.join(workdir, f"{kind}_{scene}.mp4")
+        common = {
+            "width": width,
+            "height": height,
+            "profile": profile,
+            "target_kbps": video_kbps,
+            "audio_kbps": audio_kbps,
+            "motion_engine": motion_engine,
+            "motion_workers": motion_workers,
+        }
+        if kind == "head":
+            render_motion_segment(
+                bg_paths[scene], path, loop_seconds, duration_seconds=transition_seconds, motion=motion, **common
+            )
+        elif kind == "rest":
+            render_motion_segment(
+                bg_paths[scene],
+                path,
+                loop_seconds,
+                duration_seconds=loop_seconds - transition_seconds,
+                motion={**motion, "start_seconds": transition_seconds},
+                **common,
+            )
+        else:
+            # Same encoder settings as render_motion_segment, so SPS/PPS match
+            video_args = [*_video_args(profile, video_kbps, None, transition_seconds, audio_kbps), "-pix_fmt", "yuv420p"]
+            if motion_engine == "numpy":
+                _numpy_transition(
+                    bg_paths[scene - 1], bg_paths[scene], path, width, height, loop_seconds, transition_seconds,
+                    motion, motion_workers, video_args,
+                )
+            else:
+                _zoompan_transition(
+                    bg_paths[scene - 1], bg_paths[scene], path, width, height, loop_seconds, transition_seconds,
+                    motion, video_args,
+                )
+        segments[(kind, scene)] = path
+    return segments
+
+
+def render_scene_video(
+    bg_paths,
+    audio_input,
+    output_path,
+    duration_seconds,
+    width=1920,
+    height=1080,
+    profile="default",
+    target_kbps=None,
+    target_mb=None,
+    audio_codec=None,
+    audio_kbps=None,
+    motion=None,
+    motion_engine="zoompan",
+    motion_workers=None,
+    loop_seconds=300,
+    transition_seconds=10,
+    audio_chunks=None,
+):
+    """Scene-sequence render: per-scene segments, stream-copied into one timeline.
+
+    audio_input are ffmpeg input options for the soundtrack; with
+    audio_chunks, they read "pipe:0" and the chunks are written to it.
+    """
+    from scripts.video_render import AUDIO_CODECS, RENDER_PROFILES, _run_feeding, hashed_output
+    from scripts.video_render import resolve_audio, resolve_video_kbps
+
+    audio_codec, audio_kbps = resolve_audio(profile, audio_codec, audio_kbps)
+    settings = RENDER_PROFILES[profile]
+    # One bitrate cap for every segment, resolved against the whole video
+    video_kbps = None
+    if profile != "default" or target_kbps or target_mb:
+        video_kbps = resolve_video_kbps(settings, target_kbps, target_mb, duration_seconds, audio_kbps)
+
+    timeline = plan_timeline(duration_seconds, len(bg_paths), loop_seconds, transition_seconds)
+    with tempfile.TemporaryDirectory(prefix="scenes_", dir=os.path.dirname(os.path.abspath(output_path))) as workdir:
+        segments = render_segments(
+            bg_paths, workdir, timeline, width, height, loop_seconds, transition_seconds, profile,
+            video_kbps, motion, motion_engine, motion_workers,
+        )
+        list_path = os.path.join(workdir, "timeline.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for segment in timeline:
+                f.write(f"file '{segments[segment]}'\n")
+        command = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            *audio_input,
+            "-map", "0:v", "-map", "1:a",
+            "-c:v", "copy",
+            "-c:a", AUDIO_CODECS[audio_codec],
+            "-b:a", f"{audio_kbps}k",
+            "-t", f"{duration_seconds:.3f}",
+            *hashed_output(output_path),
+        ]
+        _run_feeding(command, stdin_chunks=audio_chunks)
+    print(
+        f"Scene sequence: {len(bg_paths)} scenes, {len(segments)} segments encoded, "
+        f"{len(timeline)} in the timeline"
+    )
+    return output_path
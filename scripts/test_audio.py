@@ -90,11 +90,11 @@ def main():
         nanobanana_endpoint=settings["kieai_nanobanana_endpoint"],
     )
 
-    audio_url = retry_call(
+    audio_urls = retry_call(
         lambda: client.generate_suno(suno_prompt, seed),
         max_retries=settings["max_retries"],
     )
-    download_file(audio_url, raw_audio)
+    download_file(audio_urls[0], raw_audio)
     print(f"Downloaded raw audio to {raw_audio}")
 
     # Process audio with new settings
@@ -112,6 +112,7 @@ def main():
         settings["lowpass_hz"],
         settings["crossfade_seconds"],
         settings["fadeout_seconds"],
+        cache_dir=settings["audio_cache_dir"],
     )
     print(f"Processed audio saved to {processed_audio}")
 
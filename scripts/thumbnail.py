@@ -0,0 +1,224 @@
+"""Local thumbnail compositor.
+
+Builds the YouTube thumbnail from the already-generated background instead of a
+second remote image generation: the background is cropped to 1280x720, the
+title catchphrase is laid out in a CJK font with a soft shadow band behind it,
+and the result is saved as a JPEG under YouTube's 2 MB thumbnail limit.
+
+Fitting the text (line break and font size) takes a few dozen glyph
+measurements; layouts are cached in STATE_DIR/thumb_layouts.json keyed by text,
+font and canvas size. There are only templates x seasons x moods distinct
+catchphrases, so after the first few runs every layout is a cache hit.
+
+Usage:
+    PYTHONPATH=. python scripts/run_pipeline.py thumbnail output/YYYYMMDD/bg.png "冬の夜、穏やか音に包まれる90分"
+"""
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+
+WIDTH = 1280
+HEIGHT = 720
+MAX_BYTES = 2 * 1024 * 1024  # YouTube custom thumbnail limit
+JPEG_QUALITIES = (90, 85, 80, 70, 60)
+
+# Searched in order when THUMBNAIL_FONT is unset (fonts-noto-cjk on Ubuntu,
+# Noto CJK / Hiragino on macOS)
+FONT_CANDIDATES = (
+    "assets/fonts/NotoSansJP-Bold.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Bold.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Bold.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Bold.ttc",
+    "/Library/Fonts/NotoSansJP-Bold.otf",
+    "/System/Library/Fonts/ヒラギノ角ゴシック W6.ttc",
+)
+
+TEXT_MAX_WIDTH = 0.88  # of the canvas
+TEXT_MAX_HEIGHT = 0.34
+LINE_SPACING = 1.25
+LABEL_SCALE = 0.45  # category label size relative to the catchphrase
+
+# Channel runs in one process share the layout cache file
+_cache_lock = threading.Lock()
+# Japanese break opportunities, preferred over splitting mid-phrase
+BREAK_AFTER = "、，。・ 　"
+
+
+def resolve_font(font_path=None):
+    """First existing font from THUMBNAIL_FONT or FONT_CANDIDATES, else None."""
+    for path in ([font_path] if font_path else FONT_CANDIDATES):
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+@lru_cache(maxsize=32)
+def _font(font_path, size):
+    from PIL import ImageFont
+
+    return ImageFont.truetype(font_path, size)
+
+
+def _line_candidates(text):
+    """[[text]] plus two-line splits at punctuation, then near the middle."""
+    candidates = [[text]]
+    breaks = [i + 1 for i, char in enumerate(text[:-1]) if char in BREAK_AFTER]
+    if not breaks:
+        breaks = [len(text) // 2]
+    for index in sorted(breaks, key=lambda i: abs(i - len(text) / 2)):
+        candidates.append([text[:index].rstrip(), text[index:].lstrip()])
+    return candidates
+
+
+def _fit(font_path, lines, max_width, max_height):
+    """Largest font size at which `lines` fit the text box (binary search)."""
+    low, high = 12, int(max_height)
+    while low < high:
+        size = (low + high + 1) // 2
+        font = _font(font_path, size)
+        width = max(font.getlength(line) for line in lines)
+        height = size * (1 + LINE_SPACING * (len(lines) - 1))
+        if width <= max_width and height <= max_height:
+            low = size
+        else:
+            high = size - 1
+    return low
+
+
+def compute_layout(text, font_path, width=WIDTH, height=HEIGHT):
+    """{"lines", "size"}: the split that allows the largest font."""
+    max_width = width * TEXT_MAX_WIDTH
+    max_height = height * TEXT_MAX_HEIGHT
+    best = None
+    for lines in _line_candidates(text):
+        size = _fit(font_path, lines, max_width, max_height)
+        if best is None or size > best["size"]:
+            best = {"lines": lines, "size": size}
+    return best
+
+
+def _layout_key(text, font_path, width, height):
+    raw = json.dumps([text, os.path.basename(font_path), width, height], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _load_layouts(cache_path):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def cached_layout(text, font_path, cache_path=None, width=WIDTH, height=HEIGHT):
+    """compute_layout() memoized in a JSON file."""
+    if not cache_path:
+        return compute_layout(text, font_path, width, height)
+    from scripts.utils import write_json_atomic
+
+    key = _layout_key(text, font_path, width, height)
+    cached = _load_layouts(cache_path).get(key)
+    if cached:
+        return cached
+    layout = compute_layout(text, font_path, width, height)
+    with _cache_lock:
+        # Re-read under the lock so layouts added by other threads are kept
+        cache = _load_layouts(cache_path)
+        cache[key] = layout
+        write_json_atomic(cache_path, cache, ensure_ascii=False, indent=2)
+    return layout
+
+
+def _cover(image, width, height):
+    """Scale and center-crop to exactly width x height."""
+    from PIL import Image
+
+    scale = max(width / image.width, height / image.height)
+    size = (round(image.width * scale), round(image.height * scale))
+    if size != image.size:
+        # draft() lets the JPEG decoder downscale for free; PNG ignores it
+        image.draft("RGB", size)
+        image = image.convert("RGB").resize(size, Image.Resampling.BILINEAR)
+    left = (image.width - width) // 2
+    top = (image.height - height) // 2
+    return image.convert("RGB").crop((left, top, left + width, top + height))
+
+
+def _shade(image, top, bottom, strength=150):
+    """Darken a horizontal band (feathered edges) so text stays readable."""
+    from PIL import Image
+
+    feather = max((bottom - top) // 3, 1)
+    start = max(top - feather, 0)
+    end = min(bottom + feather, image.height)
+    column = []
+    for y in range(start, end):
+        if y < top:
+            alpha = strength * (y - top + feather) // feather
+        elif y > bottom:
+            alpha = strength * (bottom + feather - y) // feather
+        else:
+            alpha = strength
+        column.append(alpha)
+    # Only the band is composited, not the whole frame
+    mask = Image.frombytes("L", (1, len(column)), bytes(column)).resize((image.width, len(column)))
+    image.paste((0, 0, 0), (0, start, image.width, end), mask)
+
+
+def save_jpeg(image, output_path, max_bytes=MAX_BYTES):
+    """Save as JPEG, lowering quality until the file fits max_bytes."""
+    for quality in JPEG_QUALITIES:
+        image.save(output_path, "JPEG", quality=quality)
+        if os.path.getsize(output_path) <= max_bytes:
+            return quality
+    raise RuntimeError(
+        f"Thumbnail {output_path} is {os.path.getsize(output_path)} bytes at quality "
+        f"{JPEG_QUALITIES[-1]} (limit {max_bytes})"
+    )
+
+
+def compose_thumbnail(bg_path, output_path, text, font_path, label=None, layout_cache=None):
+    """Write a 1280x720 JPEG thumbnail with `text` over the background.
+
+    `label` (e.g. the title category) is drawn smaller above the catchphrase.
+    Returns the output path.
+    """
+    from PIL import Image, ImageDraw
+
+    layout = cached_layout(text, font_path, layout_cache)
+    size = layout["size"]
+    font = _font(font_path, size)
+    label_font = _font(font_path, max(int(size * LABEL_SCALE), 12)) if label else None
+
+    line_height = int(size * LINE_SPACING)
+    label_height = int(label_font.size * LINE_SPACING) if label else 0
+    block_height = label_height + size + line_height * (len(layout["lines"]) - 1)
+    # Lower-middle of the frame, clear of the bottom-right timestamp badge
+    top = int(HEIGHT * 0.62 - block_height / 2)
+
+    with Image.open(bg_path) as source:
+        image = _cover(source, WIDTH, HEIGHT)
+    _shade(image, top - size // 3, top + block_height + size // 3)
+
+    draw = ImageDraw.Draw(image)
+    stroke = max(size // 14, 2)
+    y = top
+    if label:
+        draw.text(
+            (WIDTH / 2, y), label, font=label_font, fill=(235, 225, 200), anchor="mt",
+            stroke_width=max(stroke // 2, 1), stroke_fill=(20, 20, 35),
+        )
+        y += label_height
+    for line in layout["lines"]:
+        draw.text(
+            (WIDTH / 2, y), line, font=font, fill=(255, 255, 255), anchor="mt",
+            stroke_width=stroke, stroke_fill=(20, 20, 35),
+        )
+        y += line_height
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    save_jpeg(image, output_path)
+    return output_path
+
@@ -0,0 +1,340 @@
+"""Lightweight per-stage tracing.
+
+Each span records wall time, CPU time (including waited-for subprocesses such
+as ffmpeg), peak RSS, disk bytes read/written, network bytes reported by the
+HTTP helpers, and counters such as retries. Spans nest; the trace is written
+in Chrome trace-event format (open in chrome://tracing or Perfetto).
+
+Peak RSS is per span where Linux allows it:
+
+- peak_rss_bytes: this process's high-water mark, reset when a top-level span
+  starts. While another top-level span is open (concurrent channel runs) the
+  mark is shared and not reset, so the figure is the process peak since the
+  last reset.
+- peak_child_rss_bytes: the largest ru_maxrss of the subprocesses run with
+  run() or reaped with wait() below inside the span (from wait4), or None if
+  the span reaped none.
+
+Concurrent runs in one process (one per channel, each on its own thread) call
+reset(run=name) first; their spans are tagged with the run and spans(),
+summary() and the written trace only cover the caller's run.
+
+    with span("render", profile="compact"):
+        render_video(...)
+"""
+import contextvars
+import json
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_spans = []
+_lock = threading.Lock()
+_current = contextvars.ContextVar("current_span", default=None)
+_run = contextvars.ContextVar("trace_run", default=None)
+_origin = time.perf_counter()
+_open_roots = 0
+
+
+def _reset_peak_rss():
+    """Reset this process's RSS high-water mark (Linux only) so a top-level span
+    reports its own peak rather than the run's peak so far."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_bytes():
+    """High-water RSS of this process."""
+    if resource is None:
+        return None
+    own = None
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    own = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    if own is None:
+        # ru_maxrss is KiB on Linux
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return own
+
+
+def _record_child_rss(peak_bytes):
+    """Attribute a reaped child's peak RSS to the innermost open span and its ancestors."""
+    current = _current.get()
+    while current is not None:
+        current.child_rss = max(current.child_rss or 0, peak_bytes)
+        current = current.parent
+
+
+def wait(process, timeout=None):
+    """Popen.wait() that reaps the child with os.wait4 and attributes its peak
+    RSS to the open span (RUSAGE_CHILDREN only holds the largest child ever)."""
+    if process.returncode is not None or not hasattr(os, "wait4"):
+        return process.wait(timeout)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            pid, status, usage = os.wait4(process.pid, 0 if deadline is None else os.WNOHANG)
+        except ChildProcessError:
+            # Reaped elsewhere (SIGCHLD ignored); Popen handles that case
+            return process.wait(timeout)
+        if pid:
+            break
+        if time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired(process.args, timeout)
+        time.sleep(0.05)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is KiB on Linux
+    _record_child_rss(usage.ru_maxrss * 1024)
+    return process.returncode
+
+
+def _communicate(process, input, timeout):
+    """Popen.communicate() without its final wait, so wait() can reap the child."""
+    outputs = {}
+
+    def read(name, stream):
+        with stream:
+            outputs[name] = stream.read()
+
+    readers = [
+        threading.Thread(target=read, args=(name, stream), daemon=True)
+        for name, stream in (("stdout", process.stdout), ("stderr", process.stderr))
+        if stream is not None
+    ]
+    for reader in readers:
+        reader.start()
+    if process.stdin is not None:
+        try:
+            if input:
+                process.stdin.write(input)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass  # the child exited early; its return code says why
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for reader in readers:
+        reader.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        if reader.is_alive():
+            raise subprocess.TimeoutExpired(process.args, timeout)
+    return outputs.get("stdout"), outputs.get("stderr")
+
+
+def run(*popenargs, input=None, capture_output=False, timeout=None, check=False, **kwargs):
+    """subprocess.run() that reaps the child with wait() above, so its peak RSS is traced."""
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    with subprocess.Popen(*popenargs, **kwargs) as process:
+        try:
+            stdout, stderr = _communicate(process, input, timeout)
+            returncode = wait(process, timeout)
+        except BaseException:
+            process.kill()
+            raise
+        if check and returncode:
+            raise subprocess.CalledProcessError(returncode, process.args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(process.args, returncode, stdout, stderr)
+
+
+def _disk_io():
+    """(read_bytes, write_bytes) from /proc/self/io, which includes reaped children."""
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["read_bytes"]), int(fields["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _enter_root():
+    """Count an open top-level span; the first one resets the RSS high-water mark."""
+    global _open_roots
+    with _lock:
+        # With another run's span open, a reset would corrupt its peak
+        if not _open_roots:
+            _reset_peak_rss()
+        _open_roots += 1
+
+
+def _exit_root():
+    global _open_roots
+    with _lock:
+        _open_roots -= 1
+
+
+class Span:
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.parent = parent
+        self.attrs = dict(attrs)
+        self.counters = {}
+        self.net_in = 0
+        self.net_out = 0
+        self.child_rss = None
+        self.tid = threading.get_ident()
+        if parent is None:
+            _enter_root()
+        self.start = time.perf_counter()
+        self.cpu_start = _cpu_seconds()
+        self.disk_start = _disk_io()
+        self.wall = None
+        self.record = None
+
+    def finish(self, error=None):
+        self.wall = time.perf_counter() - self.start
+        read_end, write_end = _disk_io()
+        read_start, write_start = self.disk_start
+        own_rss = _peak_rss_bytes()
+        if self.parent is None:
+            _exit_root()
+        self.record = {
+            "name": self.name,
+            "parent": self.parent.name if self.parent else None,
+            "start": self.start - _origin,
+            "wall_s": round(self.wall, 3),
+            # CPU is process-wide, so concurrent spans (threads) overlap
+            "cpu_s": round(_cpu_seconds() - self.cpu_start, 3),
+            "peak_rss_bytes": own_rss,
+            "peak_child_rss_bytes": self.child_rss,
+            "disk_read_bytes": read_end - read_start if read_end is not None else None,
+            "disk_write_bytes": write_end - write_start if write_end is not None else None,
+            "net_in_bytes": self.net_in,
+            "net_out_bytes": self.net_out,
+            "counters": self.counters,
+            "attrs": self.attrs,
+            "tid": self.tid,
+            "run": _run.get(),
+        }
+        if error is not None:
+            self.record["error"] = repr(error)
+        with _lock:
+            _spans.append(self.record)
+
+
+@contextmanager
+def span(name, **attrs):
+    parent = _current.get()
+    current = Span(name, parent, attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.finish(error=exc)
+        raise
+    else:
+        current.finish()
+    finally:
+        _current.reset(token)
+
+
+def count(name, amount=1):
+    """Increment a counter (e.g. retries, polls) on the innermost open span and its ancestors."""
+    current = _current.get()
+    while current is not None:
+        current.counters[name] = current.counters.get(name, 0) + amount
+        current = current.parent
+
+
+def add_network_bytes(received=0, sent=0):
+    """Attribute network bytes to the innermost open span and its ancestors."""
+    current = _current.get()
+    while current is not None:
+        current.net_in += received
+        current.net_out += sent
+        current = current.parent
+
+
+def reset(run=None):
+    """Start a new trace; with `run`, only that run's spans are dropped and the
+    caller's context is tagged with it."""
+    global _origin
+    _run.set(run)
+    with _lock:
+        if run is None:
+            _spans.clear()
+            _origin = time.perf_counter()
+        else:
+            _spans[:] = [record for record in _spans if record["run"] != run]
+
+
+def spans():
+    """Finished spans of the caller's run."""
+    run = _run.get()
+    with _lock:
+        return [record for record in _spans if record["run"] == run]
+
+
+def stage_timings():
+    """Wall seconds of top-level spans, in start order."""
+    top = sorted((s for s in spans() if s["parent"] is None), key=lambda s: s["start"])
+    return {s["name"]: s["wall_s"] for s in top}
+
+
+def write_chrome_trace(path):
+    events = []
+    pid = os.getpid()
+    for record in spans():
+        args = {key: value for key, value in record.items() if key not in ("name", "start", "tid", "run")}
+        events.append({
+            "name": record["name"],
+            "ph": "X",
+            "ts": int(record["start"] * 1_000_000),
+            "dur": int(record["wall_s"] * 1_000_000),
+            "pid": pid,
+            "tid": record["tid"],
+            "args": args,
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    return path
+
+
+def _format_bytes(value):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(value) < 1024 or unit == "GB":
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+        value /= 1024
+
+
+def summary():
+    """One-line summary of top-level spans, e.g. for Discord."""
+    parts = []
+    top = sorted((s for s in spans() if s["parent"] is None), key=lambda s: s["start"])
+    for record in top:
+        part = f"{record['name']} {record['wall_s']:.0f}s"
+        moved = record["net_in_bytes"] + record["net_out_bytes"]
+        if moved:
+            part += f" ({_format_bytes(moved)} net)"
+        retries = record["counters"].get("retries")
+        if retries:
+            part += f" [{retries} retries]"
+        throttled = record["counters"].get("throttle_wait_s")
+        if throttled:
+            part += f" [throttled {throttled:.0f}s]"
+        parts.append(part)
+    if top:
+        peak = max((s["peak_rss_bytes"] or 0) for s in top)
+        child_peak = max((s["peak_child_rss_bytes"] or 0) for s in top)
+        parts.append(f"peak RSS {_format_bytes(peak)} / child {_format_bytes(child_peak)}")
+    return " | ".join(parts)
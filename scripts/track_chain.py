@@ -0,0 +1,205 @@
+"""Chain every Suno track of one generation into a longer loop unit.
+
+A Suno task returns two tracks from the same prompt. Instead of looping only
+the first one, the tracks are joined into one base unit before looping:
+
+- key: a chroma profile of each track is correlated with the Krumhansl
+  major/minor profiles. Tracks whose key (or its relative major/minor) is
+  within CHAIN_MAX_KEY_SHIFT semitones of the first track's are pitch-shifted
+  onto it with ffmpeg (asetrate + aresample + atempo, so the length is kept);
+  tracks further off are left out rather than clash at the crossfade.
+- loudness: each track's integrated loudness (BS.1770, as in audio_qc) is
+  matched down to the quietest track, so the gain never clips.
+- join: consecutive tracks are crossfaded with pydub's append, the same fade
+  curve the loop itself uses.
+
+The unit is written as FLAC (lossless, about half the WAV) and then stands in
+for the single Suno download everywhere: looping, QC seams, length variants
+and the Drive bundle.
+
+Usage:
+    PYTHONPATH=. python scripts/track_chain.py audio_raw.mp3 audio_raw_2.mp3 -o audio_unit.flac
+"""
+import argparse
+import os
+import tempfile
+
+from scripts import tracing
+
+KEY_ANALYSIS_SECONDS = 90  # analyzed from the middle of each track
+FFT_SIZE = 8192
+CHROMA_MIN_HZ, CHROMA_MAX_HZ = 100.0, 2000.0
+PITCH_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+# Krumhansl-Kessler key profiles, tonic first
+MAJOR_PROFILE = (6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88)
+MINOR_PROFILE = (6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17)
+
+
+def _decode(path, cache_dir):
+    from pydub import AudioSegment
+
+    if cache_dir:
+        from scripts.audio_cache import load_decoded
+
+        return load_decoded(path, cache_dir).to_audio_segment()
+    return AudioSegment.from_file(path)
+
+
+def _samples(segment):
+    import numpy as np
+
+    return np.frombuffer(segment.raw_data, dtype="<i2").reshape(-1, segment.channels)
+
+
+def chroma(samples, sample_rate):
+    """12-bin pitch-class magnitude profile (C first) of int16 (frames, channels)."""
+    import numpy as np
+
+    middle = len(samples) // 2
+    half = int(KEY_ANALYSIS_SECONDS * sample_rate) // 2
+    mono = samples[max(middle - half, 0):middle + half].astype(np.float32).mean(axis=1)
+    count = len(mono) // FFT_SIZE
+    if count == 0:
+        raise ValueError("Track too short for key analysis")
+    frames = mono[:count * FFT_SIZE].reshape(count, FFT_SIZE) * np.hanning(FFT_SIZE).astype(np.float32)
+    magnitude = np.abs(np.fft.rfft(frames, axis=1)).sum(axis=0)
+    freqs = np.fft.rfftfreq(FFT_SIZE, 1 / sample_rate)
+    band = (freqs >= CHROMA_MIN_HZ) & (freqs <= CHROMA_MAX_HZ)
+    # MIDI note 69 is A4 = 440 Hz; note % 12 == 0 is C
+    notes = np.round(69 + 12 * np.log2(freqs[band] / 440.0)).astype(int)
+    return np.bincount(notes % 12, weights=magnitude[band], minlength=12)
+
+
+def estimate_key(samples, sample_rate):
+    """(tonic pitch class, "major" | "minor") with the best profile correlation."""
+    import numpy as np
+
+    profile = chroma(samples, sample_rate)
+    best = None
+    for mode, template in (("major", MAJOR_PROFILE), ("minor", MINOR_PROFILE)):
+        for tonic in range(12):
+            score = np.corrcoef(profile, np.roll(template, tonic))[0, 1]
+            if best is None or score > best[0]:
+                best = (score, tonic, mode)
+    return best[1], best[2]
+
+
+def key_name(key):
+    return f"{PITCH_NAMES[key[0]]} {key[1]}"
+
+
+def key_shift(key, reference):
+    """Semitones (-6..5) moving `key` onto `reference`, relative keys counted as equal."""
+    def relative_major(tonic, mode):
+        return tonic if mode == "major" else (tonic + 3) % 12
+
+    return (relative_major(*reference) - relative_major(*key) + 6) % 12 - 6
+
+
+def shift_pitch(input_path, output_path, semitones, input_rate, sample_rate, channels):
+    """Pitch-shift by `semitones` keeping the length; also converts rate and channels.
+
+    input_rate is the rate input_path decodes at: asetrate relabels it, so a
+    shift computed from any other rate would also change pitch and tempo.
+    With semitones == 0 this only resamples.
+    """
+    filters = []
+    if semitones:
+        factor = 2 ** (semitones / 12)
+        filters = ["-af", f"asetrate={input_rate * factor:.3f},aresample={sample_rate},atempo={1 / factor:.6f}"]
+    tracing.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", input_path, *filters,
+            "-ar", str(sample_rate), "-ac", str(channels), "-c:a", "pcm_s16le", output_path,
+        ],
+        check=True,
+    )
+    return output_path
+
+
+def integrated_lufs(segment):
+    from scripts.audio_process import rechunk
+    from scripts.audio_qc import analyze_stream
+
+    rate = segment.frame_rate
+    blocks = rechunk([_samples(segment)], rate * 10)
+    return analyze_stream(blocks, rate, segment.channels)["integrated_lufs"]
+
+
+def chain_tracks(paths, output_path, crossfade_seconds, cache_dir=None, max_key_shift=2):
+    """Join the tracks into one crossfaded unit at output_path.
+
+    Returns (path, report): the unit, or paths[0] itself when no other track
+    fits the first one's key. report["tracks"] lists key, shift and gain per
+    track; report["joins_ms"] the crossfade centres inside the unit.
+    """
+    from pydub import AudioSegment
+
+    crossfade_ms = crossfade_seconds * 1000
+    reference = _decode(paths[0], cache_dir)
+    reference_key = estimate_key(_samples(reference), reference.frame_rate)
+    tracks = [reference]
+    entries = [{"name": os.path.basename(paths[0]), "key": key_name(reference_key), "shift": 0, "used": True}]
+    report = {"tracks": entries, "joins_ms": []}
+
+    with tempfile.TemporaryDirectory(prefix="chain_") as workdir:
+        for index, path in enumerate(paths[1:], start=2):
+            segment = _decode(path, cache_dir)
+            key = estimate_key(_samples(segment), segment.frame_rate)
+            shift = key_shift(key, reference_key)
+            entry = {"name": os.path.basename(path), "key": key_name(key), "shift": shift}
+            entries.append(entry)
+            if abs(shift) > max_key_shift or len(segment) <= 2 * crossfade_ms:
+                entry["used"] = False
+                print(f"Leaving out {entry['name']}: {entry['key']} vs {key_name(reference_key)}")
+                continue
+            if shift or (segment.frame_rate, segment.channels) != (reference.frame_rate, reference.channels):
+                shifted = shift_pitch(
+                    path, os.path.join(workdir, f"track_{index}.wav"), shift,
+                    segment.frame_rate, reference.frame_rate, reference.channels,
+                )
+                segment = AudioSegment.from_wav(shifted)
+            entry["used"] = True
+            tracks.append(segment)
+
+        if len(tracks) == 1:
+            return paths[0], report
+
+        loudness = [integrated_lufs(segment) for segment in tracks]
+        target = min(loudness)
+        unit = None
+        for segment, lufs, entry in zip(tracks, loudness, (e for e in entries if e["used"])):
+            gain_db = round(target - lufs, 2)
+            entry.update(lufs=round(lufs, 2), gain_db=gain_db)
+            segment = segment.apply_gain(gain_db) if gain_db else segment
+            if unit is None:
+                unit = segment
+            else:
+                report["joins_ms"].append(len(unit) - crossfade_ms / 2)
+                unit = unit.append(segment, crossfade=crossfade_ms)
+
+    unit.export(output_path, format="flac")
+    print(
+        f"Chained {len(tracks)} tracks into {os.path.basename(output_path)} "
+        f"({len(unit) / 1000:.0f}s, {target:.1f} LUFS, key {key_name(reference_key)})"
+    )
+    return output_path, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chain Suno tracks into one loop unit")
+    parser.add_argument("tracks", nargs="+", help="Track files; the first sets the key")
+    parser.add_argument("-o", "--output", default="audio_unit.flac")
+    parser.add_argument("--crossfade", type=int, default=12, help="Crossfade seconds")
+    parser.add_argument("--max-key-shift", type=int, default=2, help="Semitones")
+    parser.add_argument("--cache-dir", default=None)
+    args = parser.parse_args()
+
+    path, report = chain_tracks(args.tracks, args.output, args.crossfade, args.cache_dir, args.max_key_shift)
+    for entry in report["tracks"]:
+        print(entry)
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
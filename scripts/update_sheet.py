@@ -1,90 +1,291 @@
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
 
+from scripts.google_clients import service_account_service
+from scripts.rate_limit import throttle
 
-def ensure_header_row(service_account_info, sheets_id, range_name):
-    """Add header row if the sheet is empty."""
-    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = Credentials.from_service_account_info(service_account_info, scopes=scopes)
-    service = build("sheets", "v4", credentials=creds)
+SHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 
-    # Check if sheet has data
-    try:
-        # Use simple range "A1:H1" to check first row
-        result = service.spreadsheets().values().get(
-            spreadsheetId=sheets_id,
+HEADER = [
+    "実行日時",
+    "Seed",
+    "音楽プロンプト",
+    "背景画像プロンプト",
+    "サムネイルプロンプト",
+    "Drive URL",
+    "YouTube URL",
+    "ステータス",
+]
+
+# Channels logging to the same spreadsheet share its queue file
+_queue_lock = threading.Lock()
+
+DATE_FORMAT = {
+    "numberFormat": {
+        "type": "DATE_TIME",
+        "pattern": "yyyy-mm-dd hh:mm:ss",
+    }
+}
+# Day 0 of Sheets date serial numbers
+SHEETS_EPOCH = datetime(1899, 12, 30)
+
+
+def _row_key(values):
+    """(date, seed) identifying a run's row, whether read back as text or as a serial number."""
+    date, seed = (list(values) + [None, None])[:2]
+    if isinstance(date, str):
+        try:
+            date = (datetime.strptime(date, "%Y-%m-%d %H:%M:%S") - SHEETS_EPOCH) / timedelta(days=1)
+        except ValueError:
+            pass
+    if isinstance(date, (int, float)):
+        date = round(date * 86400)
+    if isinstance(seed, float) and seed.is_integer():
+        seed = int(seed)
+    return str(date), "" if seed is None else str(seed)
+
+
+class SheetsLogger:
+    """Append rows to Sheets with one API call per flush.
+
+    Header/format setup is done once per spreadsheet and remembered in a local
+    state file. Rows that fail to send are kept in a local queue and sent
+    together with the next flush.
+
+    A flush first moves the queue to an in-flight file and deletes that file
+    only once Sheets has answered. If it is still there at the next flush (a
+    crash or error mid-send), its rows are matched against the sheet's date
+    and seed columns, so rows that did arrive are not appended twice. Queued
+    updates replace the row of the same run the same way.
+    """
+
+    def __init__(self, service_account_info, sheets_id, range_name, state_dir=".cache"):
+        self.service_account_info = service_account_info
+        self.sheets_id = sheets_id
+        self.range_name = range_name
+        self.state_path = os.path.join(state_dir, "sheets_state.json")
+        self.queue_path = os.path.join(state_dir, f"sheets_queue_{sheets_id}.jsonl")
+        self.sending_path = f"{self.queue_path}.sending"
+        self._service = None
+        os.makedirs(state_dir, exist_ok=True)
+
+    @property
+    def service(self):
+        if self._service is None:
+            self._service = service_account_service(
+                "sheets", "v4", self.service_account_info, SHEETS_SCOPES
+            )
+        return self._service
+
+    @staticmethod
+    def _execute(request):
+        with throttle("sheets"):
+            return request.execute()
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, state):
+        from scripts.utils import write_json_atomic
+
+        write_json_atomic(self.state_path, state, indent=2)
+
+    def ensure_setup(self):
+        """Add header row and date format once; skipped entirely once recorded."""
+        state = self._load_state()
+        if state.get(self.sheets_id, {}).get("setup_done"):
+            return
+
+        metadata = self._execute(self.service.spreadsheets().get(
+            spreadsheetId=self.sheets_id,
+            fields="sheets.properties.sheetId",
+        ))
+        sheet_id = metadata["sheets"][0]["properties"]["sheetId"]
+
+        result = self._execute(self.service.spreadsheets().values().get(
+            spreadsheetId=self.sheets_id,
             range="A1:H1",
-        ).execute()
+        ))
         values = result.get("values", [])
 
+        requests = [{
+            "repeatCell": {
+                "range": {
+                    "sheetId": sheet_id,
+                    "startColumnIndex": 0,
+                    "endColumnIndex": 1,
+                },
+                "cell": {"userEnteredFormat": DATE_FORMAT},
+                "fields": "userEnteredFormat.numberFormat",
+            }
+        }]
         # If empty or first row doesn't look like a header, add one
         if not values or len(values[0]) < 5:
-            header = [
-                "実行日時",
-                "Seed",
-                "音楽プロンプト",
-                "背景画像プロンプト",
-                "サムネイルプロンプト",
-                "Drive URL",
-                "YouTube URL",
-                "ステータス",
-            ]
-            service.spreadsheets().values().update(
-                spreadsheetId=sheets_id,
-                range="A1:H1",
-                valueInputOption="USER_ENTERED",
-                body={"values": [header]},
-            ).execute()
-            print("Added header row to Sheets")
-    except Exception as e:
-        print(f"Note: Could not check/add header (continuing anyway): {e}")
-
-
-def append_row(service_account_info, sheets_id, range_name, values):
-    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = Credentials.from_service_account_info(service_account_info, scopes=scopes)
-    service = build("sheets", "v4", credentials=creds)
-
-    # Ensure header exists
-    ensure_header_row(service_account_info, sheets_id, range_name)
-
-    # Format column A (Date column) as datetime
-    try:
-        sheet_metadata = service.spreadsheets().get(spreadsheetId=sheets_id).execute()
-        sheet_id = sheet_metadata['sheets'][0]['properties']['sheetId']
-
-        format_request = {
-            "requests": [{
-                "repeatCell": {
-                    "range": {
-                        "sheetId": sheet_id,
-                        "startColumnIndex": 0,
-                        "endColumnIndex": 1
-                    },
-                    "cell": {
-                        "userEnteredFormat": {
-                            "numberFormat": {
-                                "type": "DATE_TIME",
-                                "pattern": "yyyy-mm-dd hh:mm:ss"
-                            }
-                        }
-                    },
-                    "fields": "userEnteredFormat.numberFormat"
+            requests.insert(0, {
+                "updateCells": {
+                    "start": {"sheetId": sheet_id, "rowIndex": 0, "columnIndex": 0},
+                    "rows": [{
+                        "values": [
+                            {"userEnteredValue": {"stringValue": name}} for name in HEADER
+                        ]
+                    }],
+                    "fields": "userEnteredValue",
                 }
-            }]
-        }
-        service.spreadsheets().batchUpdate(
-            spreadsheetId=sheets_id,
-            body=format_request
-        ).execute()
-    except Exception as e:
-        print(f"Note: Could not format date column (continuing anyway): {e}")
-
-    body = {"values": [values]}
-    service.spreadsheets().values().append(
-        spreadsheetId=sheets_id,
-        range=range_name,
-        valueInputOption="USER_ENTERED",
-        insertDataOption="INSERT_ROWS",
-        body=body,
-    ).execute()
+            })
+            print("Adding header row to Sheets")
+
+        self._execute(self.service.spreadsheets().batchUpdate(
+            spreadsheetId=self.sheets_id,
+            body={"requests": requests},
+        ))
+
+        state[self.sheets_id] = {"setup_done": True, "sheet_id": sheet_id}
+        self._save_state(state)
+
+    def queue(self, values):
+        """Store a row locally without any network call."""
+        self._queue_entry(values)
+
+    def queue_update(self, values):
+        """Store a replacement for an already queued or sent row of the same run."""
+        self._queue_entry({"update": values})
+
+    def _queue_entry(self, entry):
+        with _queue_lock, open(self.queue_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _read_entries(path):
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def pending(self):
+        """Rows not confirmed by Sheets yet (in flight or queued), updates included."""
+        return [
+            entry["update"] if isinstance(entry, dict) else entry
+            for entry in self._read_entries(self.sending_path) + self._read_entries(self.queue_path)
+        ]
+
+    def _claim(self):
+        """Move the queue into the in-flight file.
+
+        Returns ({row key: (is_update, values)}, whether an earlier flush left
+        rows in flight). Later entries for a run replace earlier ones; an update
+        of a row that is itself still to be appended is appended instead.
+        """
+        resumed = os.path.exists(self.sending_path)
+        queued = self._read_entries(self.queue_path)
+        entries = self._read_entries(self.sending_path) + queued
+        if queued:
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f".{os.path.basename(self.sending_path)}.", dir=os.path.dirname(self.queue_path)
+            )
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+            os.replace(tmp_path, self.sending_path)
+            os.remove(self.queue_path)
+
+        rows = {}
+        for entry in entries:
+            is_update = isinstance(entry, dict)
+            values = entry["update"] if is_update else entry
+            key = _row_key(values)
+            if key in rows:
+                is_update = rows[key][0] and is_update
+            rows[key] = (is_update, values)
+        return rows, resumed
+
+    def _sheet_rows(self):
+        """{row key: 1-based row number} of the rows already in the sheet."""
+        result = self._execute(self.service.spreadsheets().values().get(
+            spreadsheetId=self.sheets_id,
+            range=f"{self._sheet_prefix()}A:B",
+            valueRenderOption="UNFORMATTED_VALUE",
+        ))
+        return {_row_key(values): number for number, values in enumerate(result.get("values", []), start=1)}
+
+    def _sheet_prefix(self):
+        sheet, sep, _ = self.range_name.rpartition("!")
+        return f"{sheet}{sep}"
+
+    def flush(self):
+        """Send every queued row in a single append (plus one call per updated
+        row). Returns the number of rows written."""
+        with _queue_lock:
+            return self._flush()
+
+    def _flush(self):
+        rows, resumed = self._claim()
+        if not rows:
+            return 0
+        try:
+            self.ensure_setup()
+        except Exception as e:
+            print(f"Note: Could not check/add header (continuing anyway): {e}")
+
+        appends = []
+        updates = {}
+        existing = self._sheet_rows() if resumed or any(is_update for is_update, _ in rows.values()) else {}
+        for key, (is_update, values) in rows.items():
+            if key not in existing:
+                appends.append(values)
+            elif is_update:
+                updates[existing[key]] = values
+            # else: appended by the interrupted flush already
+
+        for number, values in updates.items():
+            self._execute(self.service.spreadsheets().values().update(
+                spreadsheetId=self.sheets_id,
+                range=f"{self._sheet_prefix()}A{number}",
+                valueInputOption="USER_ENTERED",
+                body={"values": [values]},
+            ))
+        if appends:
+            self._execute(self.service.spreadsheets().values().append(
+                spreadsheetId=self.sheets_id,
+                range=self.range_name,
+                valueInputOption="USER_ENTERED",
+                insertDataOption="INSERT_ROWS",
+                body={"values": appends},
+            ))
+        os.remove(self.sending_path)
+        return len(appends) + len(updates)
+
+    def log(self, values):
+        """Queue a row and flush it along with any rows left from earlier failures."""
+        self.queue(values)
+        return self.flush()
+
+
+def append_row(service_account_info, sheets_id, range_name, values, state_dir=".cache"):
+    logger = SheetsLogger(service_account_info, sheets_id, range_name, state_dir=state_dir)
+    return logger.log(values)
+
+
+def main():
+    """Flush rows queued by earlier runs (e.g. after a Sheets outage or a batch run)."""
+    from dotenv import load_dotenv
+
+    from scripts.config import load_json_env, get_env
+
+    load_dotenv()
+    logger = SheetsLogger(
+        load_json_env("GCP_SERVICE_ACCOUNT_JSON", required=True),
+        get_env("SHEETS_ID", required=True),
+        get_env("SHEETS_RANGE", "A:H"),
+        state_dir=get_env("STATE_DIR", ".cache"),
+    )
+    sent = logger.flush()
+    print(f"Flushed {sent} queued row(s) to Sheets")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,31 @@
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+import os
+
+from scripts import tracing
+from scripts.google_clients import oauth_service, run_resumable
+from scripts.rate_limit import throttle
+
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 
 
 def upload_to_drive(client_id, client_secret, refresh_token, file_path, file_name, folder_id=None):
     """Upload file to Google Drive using OAuth credentials"""
-    creds = Credentials(
-        None,
-        refresh_token=refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=client_id,
-        client_secret=client_secret,
-        scopes=["https://www.googleapis.com/auth/drive.file"],
-    )
-    service = build("drive", "v3", credentials=creds)
+    from googleapiclient.http import MediaFileUpload
+
+    service = oauth_service("drive", "v3", client_id, client_secret, refresh_token, DRIVE_SCOPES)
 
     metadata = {"name": file_name}
     if folder_id:
         metadata["parents"] = [folder_id]
 
     media = MediaFileUpload(file_path, resumable=True)
-    file_obj = service.files().create(
-        body=metadata,
-        media_body=media,
-        fields="id",
-    ).execute()
+    size = os.path.getsize(file_path)
+    with tracing.span("drive.upload", bytes=size), throttle("drive"):
+        file_obj = run_resumable(service.files().create(
+            body=metadata,
+            media_body=media,
+            fields="id",
+        ))
+        tracing.add_network_bytes(sent=size)
     file_id = file_obj["id"]
     link = f"https://drive.google.com/file/d/{file_id}/view"
     return link
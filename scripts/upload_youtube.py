@@ -1,10 +1,13 @@
-import time
+import os
 from datetime import datetime, timedelta, timezone
 
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+from scripts import tracing
+from scripts.google_clients import oauth_service, run_resumable
+from scripts.rate_limit import throttle
+
+YOUTUBE_SCOPES = ["https://www.googleapis.com/auth/youtube.upload"]
+# Lets preflight read the channel's long-upload status; requested by get_youtube_token.py
+YOUTUBE_READ_SCOPES = ["https://www.googleapis.com/auth/youtube.readonly"]
 
 
 def upload_video(
@@ -19,15 +22,10 @@ def upload_video(
     publish_at=None,
     thumbnail_path=None,
 ):
-    creds = Credentials(
-        None,
-        refresh_token=refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=client_id,
-        client_secret=client_secret,
-        scopes=["https://www.googleapis.com/auth/youtube.upload"],
-    )
-    youtube = build("youtube", "v3", credentials=creds)
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaFileUpload
+
+    youtube = oauth_service("youtube", "v3", client_id, client_secret, refresh_token, YOUTUBE_SCOPES)
 
     # Use resumable upload with chunking for large files
     media = MediaFileUpload(
@@ -63,36 +61,19 @@ def upload_video(
         media_body=media,
     )
 
-    # Execute resumable upload with retry logic
-    response = None
-    error = None
-    retry_count = 0
-    max_retries = 10
-
-    while response is None:
+    size = os.path.getsize(video_path)
+    with tracing.span("youtube.upload", bytes=size), throttle("youtube.upload"):
         try:
-            print("Uploading video chunk...")
-            status, response = request.next_chunk()
-            if status:
-                progress = int(status.progress() * 100)
-                print(f"Upload progress: {progress}%")
+            response = run_resumable(request, max_retries=10)
         except HttpError as e:
-            if e.resp.status in [500, 502, 503, 504]:
-                # Retriable error
-                error = f"Retriable error {e.resp.status}: {e}"
-                retry_count += 1
-                if retry_count > max_retries:
-                    raise Exception(f"Upload failed after {max_retries} retries: {error}")
-                print(f"{error}. Retrying in {retry_count * 2} seconds...")
-                time.sleep(retry_count * 2)
-            elif e.resp.status == 403 and "uploadLimitExceeded" in str(e):
+            if e.resp.status == 403 and "uploadLimitExceeded" in str(e):
                 # Account not verified for 15+ minute videos
                 raise Exception(
                     "YouTube account not verified for 15+ minute videos. "
                     "Please verify your account at https://www.youtube.com/verify"
                 )
-            else:
-                raise
+            raise
+        tracing.add_network_bytes(sent=size)
 
     print("Upload complete!")
     video_id = response.get("id")
@@ -112,17 +93,13 @@ def upload_video(
 
 
 def set_thumbnail(client_id, client_secret, refresh_token, video_id, thumbnail_path):
-    creds = Credentials(
-        None,
-        refresh_token=refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=client_id,
-        client_secret=client_secret,
-        scopes=["https://www.googleapis.com/auth/youtube.upload"],
-    )
-    youtube = build("youtube", "v3", credentials=creds)
+    from googleapiclient.http import MediaFileUpload
+
+    youtube = oauth_service("youtube", "v3", client_id, client_secret, refresh_token, YOUTUBE_SCOPES)
     request = youtube.thumbnails().set(
         videoId=video_id,
         media_body=MediaFileUpload(thumbnail_path),
     )
-    request.execute()
+    with tracing.span("youtube.thumbnail"), throttle("youtube"):
+        request.execute()
+        tracing.add_network_bytes(sent=os.path.getsize(thumbnail_path))
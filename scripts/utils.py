@@ -1,8 +1,44 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
 import time
 from typing import Callable
 
 import requests
 
+from scripts import rate_limit, tracing
+
+# Connections kept alive per host; channels running side by side share them
+HTTP_POOL_SIZE = 16
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    """Process-wide requests.Session, so every caller reuses warm keep-alive
+    connections (TLS handshakes with KieAI and its CDN happen once)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _retry_after(response):
+    """Seconds from a numeric Retry-After header, else None."""
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
 
 def request_with_retry(
     method: str,
@@ -11,23 +47,37 @@ def request_with_retry(
     json_payload=None,
     timeout=60,
     max_retries=2,
+    limit=None,
 ):
+    """`limit` names the scripts.rate_limit upstream each attempt waits for."""
     last_exc = None
     for attempt in range(max_retries + 1):
         try:
-            response = requests.request(
-                method,
-                url,
-                headers=headers,
-                json=json_payload,
-                timeout=timeout,
+            with rate_limit.throttle(limit):
+                response = http_session().request(
+                    method,
+                    url,
+                    headers=headers,
+                    json=json_payload,
+                    timeout=timeout,
+                )
+            tracing.add_network_bytes(
+                received=len(response.content),
+                sent=len(response.request.body or b""),
             )
+            if response.status_code == 429:
+                tracing.count("rate_limited")
+                retry_after = _retry_after(response)
+                if retry_after:
+                    # Hold back every caller of this upstream, not just this retry
+                    rate_limit.defer(limit, retry_after)
             response.raise_for_status()
             return response
         except requests.RequestException as exc:
             last_exc = exc
             if attempt >= max_retries:
                 break
+            tracing.count("retries")
             time.sleep(2 + attempt * 2)
     raise last_exc
 
@@ -41,5 +91,109 @@ def retry_call(fn: Callable, max_retries=2):
             last_exc = exc
             if attempt >= max_retries:
                 break
+            tracing.count("retries")
             time.sleep(2 + attempt * 2)
     raise last_exc
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def call_with_deadline(fn: Callable, timeout):
+    """Run fn() and raise TimeoutError if it has not returned within timeout seconds.
+
+    The call keeps running on a daemon thread after a timeout; only use this for
+    calls whose late result can safely be discarded.
+    """
+    result = {}
+
+    def _run():
+        try:
+            result["value"] = fn()
+        except BaseException as exc:
+            result["error"] = exc
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"Call exceeded deadline of {timeout:.1f}s")
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    """Write data as JSON to path via a unique temp file and os.replace.
+
+    The temp file comes from mkstemp (mode 0600) in the same directory, so
+    concurrent writers in one process never share it and readers see either
+    the old or the new file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, **dump_kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+_breaker_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """Failure counter persisted to disk so later runs skip a failing upstream.
+
+    After `threshold` consecutive failures the breaker opens for
+    `cooldown_seconds`; while open, allow() returns False. The first call after
+    the cooldown is let through, and a success closes the breaker again.
+    """
+
+    def __init__(self, path, threshold=3, cooldown_seconds=3600):
+        self.path = path
+        self.threshold = threshold
+        self.cooldown_seconds = cooldown_seconds
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {"failures": 0, "open_until": 0}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {"failures": 0, "open_until": 0}
+
+    def _save(self, state):
+        write_json_atomic(self.path, state)
+
+    def allow(self):
+        return time.time() >= self._load()["open_until"]
+
+    def record_success(self):
+        with _breaker_lock:
+            self._save({"failures": 0, "open_until": 0})
+
+    def record_failure(self):
+        with _breaker_lock:
+            self._record_failure()
+
+    def _record_failure(self):
+        state = self._load()
+        state["failures"] += 1
+        if state["failures"] >= self.threshold:
+            state["open_until"] = time.time() + self.cooldown_seconds
+            print(
+                f"Circuit breaker {os.path.basename(self.path)} open for "
+                f"{self.cooldown_seconds}s after {state['failures']} failures"
+            )
+        self._save(state)
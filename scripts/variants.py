@@ -0,0 +1,261 @@
+"""Several video lengths (e.g. 1h/3h/8h) from one set of assets.
+
+The expensive work happens once per run:
+
+- audio: the low-passed clip is turned into an intro plus a loop unit whose
+  length is a whole number of AAC frames (the crossfade is stretched by at most
+  one frame to get there). intro + unit + unit + fade tail is AAC-encoded once
+  to ADTS, and every variant is spliced from those frames: intro, the second
+  unit copy repeated n times, then the tail. Each splice point follows the same
+  audio the encoder saw, so the MDCT overlap decodes seamlessly. The codec
+  and bitrate are the main render's (RENDER_PROFILE, RENDER_AUDIO_CODEC,
+  RENDER_AUDIO_KBPS); with Opus, which has no frame splice here, each
+  variant's audio is encoded from the PCM loop instead.
+- video: one periodic motion segment (looping_zoompan_filter) is encoded once
+  and repeated with the concat demuxer.
+
+Each variant is then a byte splice plus a stream-copy mux, i.e. I/O only.
+Variant lengths are rounded to whole loop units (a few minutes). The ambient
+bed is not applied here: repeating it with the unit would give it a period.
+"""
+import os
+import tempfile
+import wave
+
+from scripts import tracing
+
+AAC_FRAME = 1024  # samples per AAC-LC frame
+
+
+def build_loop_unit(input_path, lowpass_hz, crossfade_seconds, cache_dir):
+    """(intro, unit, sample_rate) as int16 arrays (frames, channels).
+
+    intro + unit * n reproduces process_audio's crossfade loop; both lengths
+    are multiples of AAC_FRAME.
+    """
+    import numpy as np
+
+    from scripts.audio_cache import load_decoded
+
+    source = load_decoded(input_path, cache_dir)
+    filtered = source.to_audio_segment().low_pass_filter(lowpass_hz)
+    samples = np.frombuffer(filtered.raw_data, dtype="<i2").reshape(-1, filtered.channels)
+    length = len(samples)
+
+    crossfade = int(crossfade_seconds * source.sample_rate)
+    # Stretch the crossfade by < 1 frame so the unit is frame-aligned
+    crossfade += (length - crossfade) % AAC_FRAME
+    if length <= 2 * crossfade:
+        raise ValueError(f"Source clip too short to loop with a {crossfade_seconds}s crossfade")
+
+    ramp = np.linspace(0.0, 1.0, crossfade, dtype=np.float32)[:, None]
+    blend = samples[-crossfade:] * (1 - ramp) + samples[:crossfade] * ramp
+    unit = np.concatenate([samples[crossfade:-crossfade], np.round(blend).astype("<i2")])
+    pad = (-crossfade) % AAC_FRAME
+    intro = np.concatenate([np.zeros((pad, samples.shape[1]), dtype="<i2"), samples[:crossfade]])
+    return intro, unit, source.sample_rate
+
+
+def _fade_tail(unit, sample_rate, fadeout_seconds):
+    """Start of the unit, faded to silence, frame-aligned."""
+    import numpy as np
+
+    fade = int(fadeout_seconds * sample_rate)
+    length = min(-(-max(fade, AAC_FRAME) // AAC_FRAME) * AAC_FRAME, len(unit))
+    tail = unit[:length].astype(np.float32)
+    gain = np.ones(length, dtype=np.float32)
+    gain[length - min(fade, length):] = np.linspace(1.0, 0.0, min(fade, length), dtype=np.float32)
+    return np.round(tail * gain[:, None]).astype("<i2")
+
+
+def parse_adts(path):
+    """Byte offsets of every ADTS frame (plus the end offset)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    offsets = []
+    position = 0
+    while position + 7 <= len(data):
+        if data[position] != 0xFF or data[position + 1] & 0xF0 != 0xF0:
+            raise ValueError(f"Lost ADTS sync at byte {position} in {path}")
+        offsets.append(position)
+        frame_length = ((data[position + 3] & 0x03) << 11) | (data[position + 4] << 3) | (data[position + 5] >> 5)
+        position += frame_length
+    offsets.append(position)
+    return data, offsets
+
+
+class LoopAudio:
+    """Intro/unit/tail loop audio, written at any number of unit repeats.
+
+    AAC frames are encoded once and spliced; other codecs are encoded per write.
+    """
+
+    def __init__(self, intro, unit, tail, sample_rate, workdir, audio_codec, audio_kbps):
+        import numpy as np
+
+        self.sample_rate = sample_rate
+        self.audio_codec = audio_codec
+        self.audio_kbps = audio_kbps
+        self.intro_frames = len(intro) // AAC_FRAME
+        self.unit_frames = len(unit) // AAC_FRAME
+        self.tail_samples = len(tail)
+        if audio_codec != "aac":
+            self.pcm = (intro, unit, tail)
+            return
+
+        wav_path = os.path.join(workdir, "loop_pcm.wav")
+        with wave.open(wav_path, "wb") as f:
+            f.setnchannels(unit.shape[1])
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            for part in (intro, unit, unit, tail):
+                f.writeframes(np.ascontiguousarray(part).tobytes())
+        adts_path = os.path.join(workdir, "loop.aac")
+        tracing.run(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-i", wav_path,
+                "-c:a", "aac", "-b:a", f"{audio_kbps}k",
+                "-f", "adts", adts_path,
+            ],
+            check=True,
+        )
+        os.remove(wav_path)
+
+        data, offsets = parse_adts(adts_path)
+        # Packet k decodes input frame k-1 (one frame of encoder priming)
+        intro_end = self.intro_frames + 1
+        unit_start = intro_end + self.unit_frames  # second unit copy
+        tail_start = unit_start + self.unit_frames
+        self.intro = data[offsets[0]:offsets[intro_end]]
+        self.unit = data[offsets[unit_start]:offsets[tail_start]]
+        self.tail = data[offsets[tail_start]:offsets[-1]]
+
+    @property
+    def extension(self):
+        return "aac" if self.audio_codec == "aac" else "mka"
+
+    @property
+    def unit_seconds(self):
+        return self.unit_frames * AAC_FRAME / self.sample_rate
+
+    def repeats_for(self, minutes):
+        fixed = (self.intro_frames * AAC_FRAME + self.tail_samples) / self.sample_rate
+        return max(round((minutes * 60 - fixed) / self.unit_seconds), 1)
+
+    def duration_seconds(self, repeats):
+        frames = self.intro_frames * AAC_FRAME + repeats * self.unit_frames * AAC_FRAME + self.tail_samples
+        return frames / self.sample_rate
+
+    def write(self, path, repeats):
+        if self.audio_codec != "aac":
+            return self._encode(path, repeats)
+        with open(path, "wb") as f:
+            f.write(self.intro)
+            for _ in range(repeats):
+                f.write(self.unit)
+            f.write(self.tail)
+        return path
+
+    def _encode(self, path, repeats):
+        import numpy as np
+
+        from scripts.video_render import AUDIO_CODECS, _run_feeding
+
+        intro, unit, tail = self.pcm
+        chunks = (np.ascontiguousarray(part).tobytes() for part in (intro, *[unit] * repeats, tail))
+        _run_feeding(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "s16le", "-ar", str(self.sample_rate), "-ac", str(unit.shape[1]), "-i", "pipe:0",
+                "-c:a", AUDIO_CODECS[self.audio_codec], "-b:a", f"{self.audio_kbps}k",
+                path,
+            ],
+            stdin_chunks=chunks,
+        )
+        return path
+
+
+def assemble_variant(segment_path, segment_seconds, audio_path, duration_seconds, output_path):
+    """Stream-copy the motion segment (repeated) and the spliced AAC into an MP4."""
+    from scripts.video_render import hashed_output
+
+    copies = int(-(-duration_seconds // segment_seconds))
+    list_path = f"{output_path}.concat.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for _ in range(copies):
+            f.write(f"file '{os.path.abspath(segment_path)}'\n")
+    try:
+        tracing.run(
+            [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-i", audio_path,
+                "-map", "0:v", "-map", "1:a",
+                "-c", "copy",
+                "-t", f"{duration_seconds:.3f}",
+                *hashed_output(output_path, encoded=False),
+            ],
+            check=True,
+        )
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+def render_variants(
+    raw_audio,
+    bg_path,
+    output_dir,
+    minutes_list,
+    settings,
+    render_params,
+):
+    """Render one MP4 per requested length. Returns [{minutes, path, duration_seconds}]."""
+    from scripts.video_render import render_motion_segment, resolve_audio
+
+    audio_codec, audio_kbps = resolve_audio(
+        render_params["profile"], render_params["audio_codec"], render_params["audio_kbps"]
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    intro, unit, sample_rate = build_loop_unit(
+        raw_audio, settings["lowpass_hz"], settings["crossfade_seconds"], settings["audio_cache_dir"]
+    )
+    tail = _fade_tail(unit, sample_rate, settings["fadeout_seconds"])
+
+    segment_seconds = settings["variant_motion_seconds"]
+    segment_path = os.path.join(output_dir, "motion_segment.mp4")
+    render_motion_segment(
+        bg_path,
+        segment_path,
+        segment_seconds,
+        width=render_params["width"],
+        height=render_params["height"],
+        profile=render_params["profile"],
+        target_kbps=render_params["target_kbps"],
+        audio_kbps=audio_kbps,
+        motion_engine=render_params["motion_engine"],
+        motion_workers=render_params["motion_workers"],
+    )
+
+    variants = []
+    with tempfile.TemporaryDirectory(dir=output_dir) as workdir:
+        loop_audio = LoopAudio(intro, unit, tail, sample_rate, workdir, audio_codec, audio_kbps)
+        for minutes in minutes_list:
+            repeats = loop_audio.repeats_for(minutes)
+            duration = loop_audio.duration_seconds(repeats)
+            audio_path = loop_audio.write(
+                os.path.join(workdir, f"audio_{minutes}m.{loop_audio.extension}"), repeats
+            )
+            video_path = os.path.join(output_dir, f"video_{minutes}m.mp4")
+            assemble_variant(segment_path, segment_seconds, audio_path, duration, video_path)
+            os.remove(audio_path)
+            print(f"Variant {minutes} min -> {video_path} ({duration / 60:.1f} min)")
+            variants.append({"minutes": minutes, "path": video_path, "duration_seconds": duration})
+    return variants
+
+
+def variant_title(title, minutes):
+    label = f"{minutes // 60}時間" if minutes % 60 == 0 else f"{minutes}分"
+    return f"【{label}】{title}"
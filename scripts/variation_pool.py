@@ -0,0 +1,212 @@
+"""Pre-generated pool of image prompt variations per season × mood.
+
+One batched Gemini request fills a pair's pool with dozens of variations,
+deduplicated against everything already pooled or used. Runs draw from the
+pool without touching the network; when a pool runs low it is refilled on a
+background thread while the rest of the pipeline carries on.
+
+Usage (prefill every pair ahead of time):
+    PYTHONPATH=. python scripts/variation_pool.py fill
+"""
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from scripts.prompt_generator import FALLBACK_VARIATIONS, generate_variation_batch
+from scripts.utils import CircuitBreaker, write_json_atomic
+
+# Character-bigram Jaccard similarity above which two variations count as duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.8
+# Normalized texts of used variations kept per pair for deduplication
+USED_HISTORY = 500
+
+_lock = threading.Lock()
+
+
+def normalize(text):
+    """Case/width-insensitive form with punctuation and whitespace removed."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return re.sub(r"[\W_]+", "", text)
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def is_near_duplicate(norm, existing_bigrams):
+    grams = _bigrams(norm)
+    for other in existing_bigrams:
+        overlap = len(grams & other) / len(grams | other)
+        if overlap >= NEAR_DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+
+class VariationPool:
+    def __init__(self, state_dir=".cache", batch_size=40, low_water=6, timeout=30, breaker=None):
+        self.path = os.path.join(state_dir, "variation_pool.json")
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.timeout = timeout
+        self.breaker = breaker
+        self._refills = {}
+        # Which provider answered the last draw() and how long it took
+        self.last_source = None
+        os.makedirs(state_dir, exist_ok=True)
+
+    @staticmethod
+    def key(season, mood):
+        return f"{season['en']}|{mood['en']}"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, data):
+        write_json_atomic(self.path, data, ensure_ascii=False, indent=2)
+
+    def available(self, season, mood):
+        with _lock:
+            entry = self._load().get(self.key(season, mood), {})
+        return len(entry.get("available", []))
+
+    def add(self, season, mood, candidates):
+        """Add candidates that are not (near-)duplicates of pooled or used ones."""
+        with _lock:
+            data = self._load()
+            entry = data.setdefault(self.key(season, mood), {"available": [], "used": []})
+            seen = entry["used"] + [normalize(text) for text in entry["available"]]
+            seen_bigrams = [_bigrams(norm) for norm in seen]
+            added = 0
+            for text in candidates:
+                norm = normalize(text)
+                if not norm or is_near_duplicate(norm, seen_bigrams):
+                    continue
+                entry["available"].append(text)
+                seen_bigrams.append(_bigrams(norm))
+                added += 1
+            self._save(data)
+        return added
+
+    def refill(self, api_key, model, season, mood):
+        """Fill one pair's pool with a single batched Gemini request.
+
+        Returns the provider that answered.
+        """
+        with _lock:
+            entry = self._load().get(self.key(season, mood), {})
+        avoid = entry.get("available", [])
+        candidates, provider = generate_variation_batch(
+            api_key, model, season["jp"], season["en"], mood["jp"], mood["en"],
+            self.batch_size, avoid=avoid, timeout=self.timeout, breaker=self.breaker,
+        )
+        added = self.add(season, mood, candidates)
+        print(
+            f"Variation pool {self.key(season, mood)}: +{added} "
+            f"(of {len(candidates)} generated via {provider})"
+        )
+        return provider
+
+    def refill_in_background(self, api_key, model, season, mood):
+        key = self.key(season, mood)
+        running = self._refills.get(key)
+        if running and running.is_alive():
+            return running
+
+        def _run():
+            try:
+                self.refill(api_key, model, season, mood)
+            except Exception as e:
+                print(f"Warning: background variation refill failed ({e})")
+
+        # Non-daemon so a refill started late in a run still gets saved
+        thread = threading.Thread(target=_run, name=f"variation-refill-{key}")
+        thread.start()
+        self._refills[key] = thread
+        return thread
+
+    def _take(self, season, mood, count):
+        with _lock:
+            data = self._load()
+            entry = data.get(self.key(season, mood))
+            if not entry or len(entry["available"]) < count:
+                return None, 0
+            taken = entry["available"][:count]
+            entry["available"] = entry["available"][count:]
+            entry["used"] = (entry["used"] + [normalize(text) for text in taken])[-USED_HISTORY:]
+            self._save(data)
+            return taken, len(entry["available"])
+
+    def draw(self, api_key, model, season, mood):
+        """Return (bg_variation, thumb_variation) from the pool.
+
+        Only an empty pool puts Gemini on the critical path (one batched call);
+        a low pool is refilled in the background.
+        """
+        start = time.monotonic()
+        provider = "pool"
+        taken, remaining = self._take(season, mood, 2)
+        if taken is None and api_key:
+            try:
+                provider = self.refill(api_key, model, season, mood)
+            except Exception as e:
+                print(f"Warning: Gemini API failed ({e}), using fallback variations")
+            taken, remaining = self._take(season, mood, 2)
+        if taken is None:
+            provider = "fallback"
+        self.last_source = {"provider": provider, "seconds": round(time.monotonic() - start, 3)}
+        if taken is None:
+            return FALLBACK_VARIATIONS
+        if api_key and remaining < self.low_water:
+            self.refill_in_background(api_key, model, season, mood)
+        return taken[0], taken[1]
+
+
+def gemini_breaker(settings):
+    return CircuitBreaker(
+        os.path.join(settings["state_dir"], "gemini_breaker.json"),
+        threshold=settings["gemini_breaker_threshold"],
+        cooldown_seconds=settings["gemini_breaker_cooldown_seconds"],
+    )
+
+
+def main():
+    import argparse
+
+    from dotenv import load_dotenv
+
+    from scripts.config import load_settings
+
+    parser = argparse.ArgumentParser(description="Manage the image variation pool")
+    parser.add_argument("command", choices=["fill", "status"])
+    args = parser.parse_args()
+
+    load_dotenv()
+    settings = load_settings(strict=False)
+    with open(settings["templates_path"], "r", encoding="utf-8") as f:
+        templates = json.load(f)
+    pool = VariationPool(
+        settings["state_dir"],
+        batch_size=settings["variation_pool_batch"],
+        low_water=settings["variation_pool_low_water"],
+        timeout=settings["gemini_timeout_seconds"],
+        breaker=gemini_breaker(settings),
+    )
+
+    for season in templates["seasons"]:
+        for mood in templates["moods"]:
+            if args.command == "fill" and pool.available(season, mood) < pool.batch_size:
+                try:
+                    pool.refill(settings["gemini_api_key"], settings["gemini_model"], season, mood)
+                except Exception as e:
+                    print(f"Warning: refill failed for {pool.key(season, mood)} ({e})")
+            print(f"{pool.key(season, mood):20s} {pool.available(season, mood):4d} available")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,454 @@
+import os
 import subprocess
+import threading
+import wave
 
+from scripts import tracing
 
-def render_video(bg_path, audio_path, output_path, width=1920, height=1080):
+# Encoder settings per render profile.
+# - default: original x264 rate control + 192k AAC
+# - compact: size-targeted encode for the near-static zoompan output. Long GOPs
+#   (no scene cuts in a slow zoom), CRF capped by maxrate/bufsize, aq-mode 3 to
+#   keep dark night-sky gradients from banding, and a lower audio bitrate that
+#   is plenty for a 4 kHz low-passed ambient track.
+RENDER_PROFILES = {
+    "default": {
+        "preset": "medium",
+        "crf": None,
+        "x264_params": None,
+        "video_kbps": None,
+        "audio_codec": "aac",
+        "audio_kbps": 192,
+    },
+    "compact": {
+        "preset": "slow",
+        "crf": 30,
+        "x264_params": "keyint=500:min-keyint=250:scenecut=0:aq-mode=3:rc-lookahead=60",
+        "video_kbps": 800,
+        "audio_codec": "aac",
+        "audio_kbps": 96,
+    },
+}
+
+# Ken Burns motion parameters (see render_video)
+MOTION_DEFAULTS = {
+    "zoom_rate": 0.0003,  # zoom increase per second
+    "zoom_max": 1.03,
+    "pan_x_amplitude": 20,  # pixels of slow horizontal sway
+    "pan_y_rate": 0.5,  # pixels per 100 seconds of downward drift
+    "start_seconds": 0,  # evaluate the motion from this point (for previews)
+}
+
+# zoompan: ffmpeg filter (integer crop window, single-threaded)
+# numpy: scripts/motion_frames.py (sub-pixel, worker pool, piped as rawvideo)
+MOTION_ENGINES = ("zoompan", "numpy")
+
+# Written next to each rendered MP4 by hashed_output
+HASH_SUFFIX = ".hash"
+
+AUDIO_CODECS = {
+    "aac": "aac",
+    "opus": "libopus",
+}
+
+
+def resolve_video_kbps(profile, target_kbps=None, target_mb=None, duration_seconds=None, audio_kbps=None):
+    """Pick the video bitrate cap: explicit file size > explicit bitrate > profile default."""
+    if target_mb and duration_seconds:
+        total_kbps = target_mb * 8 * 1000 / duration_seconds
+        # Leave a little room for container overhead
+        return max(int(total_kbps * 0.97 - (audio_kbps or 0)), 100)
+    if target_kbps:
+        return int(target_kbps)
+    return profile["video_kbps"]
+
+
+def zoompan_filter(width, height, motion=None):
+    motion = {**MOTION_DEFAULTS, **(motion or {})}
+    # Output frame index, shifted so a preview can start mid-timeline
+    n = f"(on+{int(motion['start_seconds'] * 25)})"
     # Subtle Ken Burns effect: very slow zoom + pan
     # For 92-minute video (138000 frames at 25fps):
     # - Zoom from 1.0 to 1.03 (3% zoom)
     # - Pan slowly from top-left to bottom-right
-    video_filter = (
+    return (
         f"scale={int(width*1.1)}:{int(height*1.1)}:force_original_aspect_ratio=increase,"  # Scale up 10% for panning room
         f"zoompan="
-        f"z='min(1+0.0003*on/25,1.03)':"  # Zoom: 1.0 -> 1.03 over 92 minutes
-        f"x='iw/2-(iw/zoom/2)+sin(on/25/100)*20':"  # Subtle horizontal movement
-        f"y='ih/2-(ih/zoom/2)+on/25/100*0.5':"  # Very slow downward pan
+        f"z='min(1+{motion['zoom_rate']}*{n}/25,{motion['zoom_max']})':"  # Zoom: 1.0 -> 1.03 over 92 minutes
+        f"x='iw/2-(iw/zoom/2)+sin({n}/25/100)*{motion['pan_x_amplitude']}':"  # Subtle horizontal movement
+        f"y='ih/2-(ih/zoom/2)+{n}/25/100*{motion['pan_y_rate']}':"  # Very slow downward pan
         f"d=1:"
         f"s={width}x{height}:"
         f"fps=25"
     )
 
-    command = [
-        "ffmpeg",
-        "-y",
-        "-loop",
-        "1",
-        "-i",
-        bg_path,
-        "-i",
-        audio_path,
-        "-vf",
-        video_filter,
+
+def looping_zoompan_filter(width, height, period_seconds, motion=None):
+    """Ken Burns motion that returns to its start every period_seconds.
+
+    Zoom and vertical drift ease out and back over one period, so encoded
+    segments can be concatenated end to end without a jump. start_seconds
+    shifts the phase (a segment that picks up mid-period).
+    """
+    motion = {**MOTION_DEFAULTS, **(motion or {})}
+    phase = f"(2*PI*(on+{int(motion['start_seconds'] * 25)})/{int(period_seconds * 25)})"
+    # Same peak travel as the linear drift would reach in one period
+    pan_y = motion["pan_y_rate"] * period_seconds / 100
+    return (
+        f"scale={int(width*1.1)}:{int(height*1.1)}:force_original_aspect_ratio=increase,"
+        f"zoompan="
+        f"z='1+{motion['zoom_max'] - 1}*(1-cos({phase}))/2':"
+        f"x='iw/2-(iw/zoom/2)+sin({phase})*{motion['pan_x_amplitude']}':"
+        f"y='ih/2-(ih/zoom/2)+(1-cos({phase}))/2*{pan_y}':"
+        f"d=1:"
+        f"s={width}x{height}:"
+        f"fps=25"
+    )
+
+
+def resolve_audio(profile, audio_codec=None, audio_kbps=None):
+    """(codec, kbps) of the soundtrack: RENDER_AUDIO_CODEC/KBPS over the profile's."""
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: {profile} (choose from {', '.join(RENDER_PROFILES)})")
+    settings = RENDER_PROFILES[profile]
+    audio_codec = audio_codec or settings["audio_codec"]
+    if audio_codec not in AUDIO_CODECS:
+        raise ValueError(f"Unknown audio codec: {audio_codec} (choose from {', '.join(AUDIO_CODECS)})")
+    return audio_codec, audio_kbps or settings["audio_kbps"]
+
+
+def _video_args(profile, target_kbps=None, target_mb=None, duration_seconds=None, audio_kbps=None):
+    settings = RENDER_PROFILES[profile]
+    video_args = [
         "-c:v",
         "libx264",
         "-preset",
-        "medium",  # Changed from stillimage tune for motion
+        settings["preset"],  # Changed from stillimage tune for motion
+    ]
+    if settings["crf"] is not None:
+        video_args += ["-crf", str(settings["crf"])]
+    if settings["x264_params"]:
+        video_args += ["-x264-params", settings["x264_params"]]
+    video_kbps = None
+    if profile != "default" or target_kbps or target_mb:
+        video_kbps = resolve_video_kbps(settings, target_kbps, target_mb, duration_seconds, audio_kbps)
+    if video_kbps:
+        # Cap CRF with a VBV ceiling so the size target holds
+        video_args += ["-maxrate", f"{video_kbps}k", "-bufsize", f"{video_kbps * 2}k"]
+    return video_args
+
+
+def hashed_output(output_path, encoded=True):
+    """Output options writing output_path and, in the same pass, its content hash.
+
+    The tee muxer hands the packets to the MP4 and to ffmpeg's hash muxer
+    (SHA-256 over every packet, see content_hash), so no second read of a
+    multi-GB file is needed. Streams must be mapped with -map. encoded: the
+    streams are encoded here (not stream-copied) and need global headers, as
+    the MP4 muxer alone would request.
+    """
+    def escape(path):
+        for char in "\\|[]":
+            path = path.replace(char, "\\" + char)
+        return path
+
+    return [
+        *(["-flags", "+global_header"] if encoded else []),
+        "-f", "tee", f"[f=mp4]{escape(output_path)}|[f=hash:hash=sha256]{escape(output_path + HASH_SUFFIX)}",
+    ]
+
+
+def content_hash(video_path):
+    """SHA-256 content key of a rendered video (from the render's hash file).
+
+    Falls back to hashing the file for videos rendered without one.
+    """
+    try:
+        with open(video_path + HASH_SUFFIX, "r", encoding="utf-8") as f:
+            digest = f.read().strip().partition("=")[2]
+    except FileNotFoundError:
+        digest = ""
+    if digest:
+        return digest
+    from scripts.utils import sha256_file
+
+    return sha256_file(video_path)
+
+
+def _video_input(bg_path, width, height, motion, engine, video_source="pipe:0"):
+    """(input options, output filter options) of the motion video."""
+    if engine not in MOTION_ENGINES:
+        raise ValueError(f"Unknown motion engine: {engine} (choose from {', '.join(MOTION_ENGINES)})")
+    if engine == "numpy":
+        from scripts.motion_frames import raw_video_input
+
+        return raw_video_input(width, height, video_source), []
+    return ["-loop", "1", "-i", bg_path], ["-vf", zoompan_filter(width, height, motion)]
+
+
+def _run_feeding(command, stdin_chunks=None, pipe=None):
+    """Run ffmpeg, writing stdin_chunks to its stdin and, on a second thread,
+    pipe = (read_fd, write_fd, chunks) to an inherited pipe ("pipe:<read_fd>")."""
+    pass_fds = (pipe[0],) if pipe else ()
+    process = subprocess.Popen(
+        command, stdin=subprocess.PIPE if stdin_chunks is not None else None, pass_fds=pass_fds
+    )
+    errors = []
+
+    def feed(stream, chunks):
+        try:
+            for chunk in chunks:
+                stream.write(chunk)
+        except BrokenPipeError:
+            pass  # ffmpeg stopped reading (-shortest, or it failed); its return code says which
+        except BaseException as exc:
+            errors.append(exc)
+            process.kill()
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            try:
+                stream.close()
+            except BrokenPipeError:
+                pass
+
+    thread = None
+    if pipe:
+        os.close(pipe[0])
+        thread = threading.Thread(target=feed, args=(os.fdopen(pipe[1], "wb"), pipe[2]), daemon=True)
+        thread.start()
+    if stdin_chunks is not None:
+        feed(process.stdin, stdin_chunks)
+    if thread:
+        thread.join()
+    returncode = tracing.wait(process)
+    if errors:
+        raise errors[0]
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+def _audio_seconds(audio_path):
+    with wave.open(audio_path, "rb") as f:
+        return f.getnframes() / f.getframerate()
+
+
+def _render_command(
+    video_input,
+    audio_input,
+    output_path,
+    profile,
+    target_kbps,
+    target_mb,
+    audio_codec,
+    audio_kbps,
+    duration_seconds,
+):
+    audio_codec, audio_kbps = resolve_audio(profile, audio_codec, audio_kbps)
+    video_args = _video_args(profile, target_kbps, target_mb, duration_seconds, audio_kbps)
+
+    video_input, video_filter = video_input
+    return [
+        "ffmpeg",
+        "-y",
+        *video_input,
+        *audio_input,
+        *video_filter,
+        "-map",
+        "0:v",
+        "-map",
+        "1:a",
+        *video_args,
         "-c:a",
-        "aac",
+        AUDIO_CODECS[audio_codec],
         "-b:a",
-        "192k",
+        f"{audio_kbps}k",
         "-pix_fmt",
         "yuv420p",
         "-shortest",
+        *hashed_output(output_path),
+    ]
+
+
+def render_video(
+    bg_path,
+    audio_path,
+    output_path,
+    width=1920,
+    height=1080,
+    profile="default",
+    target_kbps=None,
+    target_mb=None,
+    audio_codec=None,
+    audio_kbps=None,
+    duration_seconds=None,
+    motion=None,
+    motion_engine="zoompan",
+    motion_workers=None,
+    scenes=None,
+    scene_loop_seconds=300,
+    scene_transition_seconds=10,
+):
+    """Render the Ken Burns video over audio_path (motion_engine "zoompan" or "numpy").
+
+    With scenes (more background paths), bg_path and each scene take turns
+    with crossfades between them (scripts/scenes.py).
+    """
+    if scenes:
+        from scripts.scenes import render_scene_video
+
+        return render_scene_video(
+            [bg_path, *scenes], ["-i", audio_path], output_path, duration_seconds or _audio_seconds(audio_path),
+            width, height, profile, target_kbps, target_mb, audio_codec, audio_kbps, motion, motion_engine,
+            motion_workers, scene_loop_seconds, scene_transition_seconds,
+        )
+    video_input = _video_input(bg_path, width, height, motion, motion_engine)
+    command = _render_command(
+        video_input, ["-i", audio_path], output_path, profile,
+        target_kbps, target_mb, audio_codec, audio_kbps, duration_seconds,
+    )
+    if motion_engine == "numpy":
+        from scripts.motion_frames import MotionRenderer, frame_count
+
+        # Frames are rendered up to the audio's end; -shortest trims the rest
+        count = frame_count(duration_seconds or _audio_seconds(audio_path))
+        with MotionRenderer(bg_path, width, height, motion, motion_workers) as renderer:
+            _run_feeding(command, stdin_chunks=renderer.frames(count))
+    else:
+        tracing.run(command, check=True)
+    return output_path
+
+
+def render_video_stream(
+    bg_path,
+    blocks,
+    sample_rate,
+    channels,
+    output_path,
+    width=1920,
+    height=1080,
+    profile="default",
+    target_kbps=None,
+    target_mb=None,
+    audio_codec=None,
+    audio_kbps=None,
+    duration_seconds=None,
+    motion=None,
+    motion_engine="zoompan",
+    motion_workers=None,
+    scenes=None,
+    scene_loop_seconds=300,
+    scene_transition_seconds=10,
+):
+    """render_video with the soundtrack piped in as int16 PCM blocks.
+
+    No processed WAV is written to disk; the audio is produced while ffmpeg
+    encodes. With the numpy engine, frames go through a second pipe.
+    """
+    audio = (block.astype("<i2", copy=False).tobytes() for block in blocks)
+    audio_input = ["-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0"]
+    if scenes:
+        from scripts.scenes import render_scene_video
+
+        if duration_seconds is None:
+            raise ValueError("Scene sequences need duration_seconds for piped audio")
+        return render_scene_video(
+            [bg_path, *scenes], audio_input, output_path, duration_seconds, width, height, profile,
+            target_kbps, target_mb, audio_codec, audio_kbps, motion, motion_engine, motion_workers,
+            scene_loop_seconds, scene_transition_seconds, audio_chunks=audio,
+        )
+    if motion_engine != "numpy":
+        command = _render_command(
+            _video_input(bg_path, width, height, motion, motion_engine), audio_input, output_path, profile,
+            target_kbps, target_mb, audio_codec, audio_kbps, duration_seconds,
+        )
+        _run_feeding(command, stdin_chunks=audio)
+        return output_path
+
+    from scripts.motion_frames import MotionRenderer, frame_count
+
+    if duration_seconds is None:
+        raise ValueError("The numpy motion engine needs duration_seconds for piped audio")
+    with MotionRenderer(bg_path, width, height, motion, motion_workers) as renderer:
+        read_fd, write_fd = os.pipe()
+        command = _render_command(
+            _video_input(bg_path, width, height, motion, motion_engine, f"pipe:{read_fd}"), audio_input,
+            output_path, profile, target_kbps, target_mb, audio_codec, audio_kbps, duration_seconds,
+        )
+        _run_feeding(
+            command, stdin_chunks=audio, pipe=(read_fd, write_fd, renderer.frames(frame_count(duration_seconds)))
+        )
+    return output_path
+
+
+def render_motion_segment(
+    bg_path,
+    output_path,
+    period_seconds,
+    width=1920,
+    height=1080,
+    profile="default",
+    target_kbps=None,
+    audio_kbps=None,
+    motion=None,
+    motion_engine="zoompan",
+    motion_workers=None,
+    duration_seconds=None,
+):
+    """Video-only, seamlessly repeatable motion segment (starts on an IDR frame).
+
+    Long videos concatenate copies of it with stream copy instead of encoding
+    every minute of the zoompan. duration_seconds (default one period) and
+    motion["start_seconds"] select part of the period.
+    """
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile: {profile} (choose from {', '.join(RENDER_PROFILES)})")
+    if motion_engine not in MOTION_ENGINES:
+        raise ValueError(f"Unknown motion engine: {motion_engine} (choose from {', '.join(MOTION_ENGINES)})")
+    audio_kbps = audio_kbps or RENDER_PROFILES[profile]["audio_kbps"]
+    frames = int((duration_seconds or period_seconds) * 25)
+    if motion_engine == "numpy":
+        from scripts.motion_frames import raw_video_input
+
+        video_input = raw_video_input(width, height)
+    else:
+        video_filter = looping_zoompan_filter(width, height, period_seconds, motion)
+        video_input = ["-loop", "1", "-i", bg_path, "-vf", video_filter]
+    command = [
+        "ffmpeg",
+        "-y",
+        *video_input,
+        *_video_args(profile, target_kbps, None, period_seconds, audio_kbps),
+        "-pix_fmt",
+        "yuv420p",
+        "-frames:v",
+        str(frames),
+        "-an",
         output_path,
     ]
-    subprocess.run(command, check=True)
+    if motion_engine == "numpy":
+        from scripts.motion_frames import MotionRenderer
+
+        with MotionRenderer(bg_path, width, height, motion, motion_workers) as renderer:
+            _run_feeding(command, stdin_chunks=renderer.frames(frames, period_seconds=period_seconds))
+    else:
+        tracing.run(command, check=True)
     return output_path
+
+
+def report_savings(output_path, duration_seconds, baseline_kbps, upload_mbps, upload_count=1):
+    """Compare the rendered size against the default profile's typical bitrate.
+
+    baseline_kbps is the measured total bitrate of a default-profile render;
+    upload_mbps is the observed upload throughput used to convert bytes into time.
+    """
+    actual_bytes = os.path.getsize(output_path)
+    baseline_bytes = int(baseline_kbps * 1000 / 8 * duration_seconds)
+    saved_bytes = max(baseline_bytes - actual_bytes, 0)
+    saved_seconds = saved_bytes * 8 / (upload_mbps * 1_000_000) * upload_count
+    return {
+        "bytes": actual_bytes,
+        "baseline_bytes": baseline_bytes,
+        "saved_bytes": saved_bytes,
+        "saved_upload_seconds": round(saved_seconds, 1),
+    }
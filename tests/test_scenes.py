@@ -0,0 +1,35 @@
+import pytest
+
+from scripts.scenes import plan_timeline
+
+
+def loops_per_scene(timeline, scene_count):
+    return [sum(1 for kind, scene in timeline if scene == index and kind != "rest") for index in range(scene_count)]
+
+
+@pytest.mark.parametrize(
+    "duration, scenes, loop, expected",
+    [
+        (5400, 5, 300, [4, 3, 4, 3, 4]),
+        (900, 3, 300, [1, 1, 1]),
+        (1200, 4, 300, [1, 1, 1, 1]),
+        (600, 3, 120, [2, 1, 2]),
+        (5400, 1, 300, [18]),
+    ],
+)
+def test_every_scene_gets_its_share(duration, scenes, loop, expected):
+    timeline = plan_timeline(duration, scenes, loop, 10)
+    assert loops_per_scene(timeline, scenes) == expected
+    assert len(timeline) // 2 * loop >= duration
+
+
+def test_transitions_open_later_scenes():
+    timeline = plan_timeline(900, 3, 300, 10)
+    assert timeline == [
+        ("head", 0), ("rest", 0), ("transition", 1), ("rest", 1), ("transition", 2), ("rest", 2),
+    ]
+
+
+def test_too_short_for_scenes():
+    with pytest.raises(ValueError):
+        plan_timeline(600, 3, 300, 10)